@@ -0,0 +1,345 @@
+# file eulcommon/binfile/aio.py
+#
+#   Copyright 2012 Emory University Libraries
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+'''Read mail folders from :mod:`asyncio` applications without blocking
+the event loop.
+
+Reading mapped folder files can block for a long time on slow storage,
+as each page of a file is faulted in on first access, and parsing large
+messages is CPU-bound. An :class:`AsyncMailReader` runs that work in a
+bounded pool of threads and provides asynchronous iterators over the
+results, for use with ``async for`` (Python 3.5 or later)::
+
+    reader = AsyncMailReader(max_workers=8)
+
+    async def ingest(top):
+        async for found in reader.walk(top):
+            if found.format == triage.OE_INDEX:
+                folder = await reader.run(outlookexpress.MacFolder,
+                                          os.path.dirname(found.path))
+                async for msg in folder.aiter_messages(reader):
+                    await store(msg)
+
+The work in progress is bounded in two ways: the reader's thread pool
+limits how many blocking operations run at once, across every folder
+being read; and messages are parsed ahead of the consumer only while the
+total size of messages parsed but not yet consumed, across all
+iterators, is within :attr:`AsyncMailReader.max_inflight_bytes`. Each
+iterator may always have one message in flight, so a very large message,
+or a consumer reading several folders in turn, cannot stall iteration.
+
+Iterators return :class:`asyncio.Future` objects from ``__anext__``
+rather than being written as coroutines, so this module can be imported
+(though not used) by Python versions without :mod:`asyncio`. A reader and
+its iterators should be used from a single event loop.
+
+This module exports the following names:
+ * :class:`AsyncMailReader` -- runs blocking folder reads in a bounded
+   thread pool
+ * :func:`default_reader` -- a shared :class:`AsyncMailReader`
+'''
+
+from collections import deque
+from functools import partial
+from itertools import islice
+
+try:
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    # python 2
+    asyncio = None
+
+from eulcommon.binfile import triage
+
+__all__ = ['AsyncMailReader', 'default_reader', 'DEFAULT_INFLIGHT_BYTES']
+
+DEFAULT_INFLIGHT_BYTES = 32 * 1024 * 1024
+'''default limit on the total size of messages parsed ahead of their
+consumers'''
+
+INDEX_BATCH = 1024
+'''number of index entries read from a folder index at a time'''
+
+RECORD_BATCH = 1024
+'''default number of records or scan results produced per blocking call'''
+
+
+def _loop():
+    return asyncio.get_event_loop()
+
+
+def _done_future(result=None, exception=None):
+    future = _loop().create_future()
+    if exception is not None:
+        future.set_exception(exception)
+    else:
+        future.set_result(result)
+    return future
+
+
+# blocking work, run in the reader's thread pool
+
+def _index_entries(table, start, stop):
+    # (offset, size) for a range of index entries, decoded a column at a time
+    return list(zip(table.column('offset', start, stop),
+                    table.column('size', start, stop)))
+
+
+def _parse_message(folder, offset, size, skip_deleted):
+    raw_msg = folder.data.get_message(offset, size)
+    if skip_deleted and raw_msg.deleted:
+        return None
+    return raw_msg.as_email()
+
+
+def _next_batch(source, size):
+    return list(islice(source, size))
+
+
+def _paged_records(table, batch_size):
+    # records of a table, reading each batch of records from the map
+    # before it is used so that page faults happen here
+    for start in range(0, len(table), batch_size):
+        table.data(start, start + batch_size)
+        for record in table[start:start + batch_size]:
+            yield record
+
+
+class AsyncMailReader(object):
+    '''Runs blocking mail folder reads for :mod:`asyncio` code in a
+    bounded pool of threads.
+
+    :param max_workers: number of threads used for blocking work; ignored
+        if `executor` is given
+    :param max_inflight_bytes: limit on the total size of messages parsed
+        ahead of their consumers, across all iterators of this reader
+    :param prefetch: maximum number of messages each message iterator
+        parses ahead of its consumer
+    :param executor: an existing :class:`concurrent.futures.Executor` to
+        use instead of creating a thread pool
+    '''
+
+    def __init__(self, max_workers=4, max_inflight_bytes=DEFAULT_INFLIGHT_BYTES,
+                 prefetch=8, executor=None):
+        if asyncio is None:
+            raise RuntimeError('AsyncMailReader requires asyncio')
+        self.max_inflight_bytes = max_inflight_bytes
+        self.prefetch = prefetch
+        self._own_executor = executor is None
+        self.executor = executor or ThreadPoolExecutor(max_workers)
+        self.inflight_bytes = 0
+        'total size of messages currently parsed ahead of their consumers'
+        self._waiting = []
+
+    def run(self, func, *args):
+        '''Run ``func(*args)`` in the reader's thread pool, returning an
+        awaitable :class:`asyncio.Future` for its result.'''
+        return _loop().run_in_executor(self.executor, func, *args)
+
+    def close(self):
+        '''Shut down the reader's thread pool, if it created one.'''
+        if self._own_executor:
+            self.executor.shutdown(wait=False)
+
+    def _reserve(self, size, force=False):
+        if not force and self.inflight_bytes and \
+           self.inflight_bytes + size > self.max_inflight_bytes:
+            return False
+        self.inflight_bytes += size
+        return True
+
+    def _release(self, size):
+        self.inflight_bytes -= size
+        waiting, self._waiting = self._waiting, []
+        loop = _loop()
+        for callback in waiting:
+            loop.call_soon(callback)
+
+    def _wait_for_budget(self, callback):
+        if callback not in self._waiting:
+            self._waiting.append(callback)
+
+    def messages(self, folder, skip_deleted=True):
+        '''Asynchronous iterator over the messages of an
+        :class:`~eulcommon.binfile.outlookexpress.MacFolder`, as
+        :class:`email.message.Message` objects in folder order.
+
+        :param skip_deleted: if False, include deleted messages
+        '''
+        return _MessageIterator(self, folder, skip_deleted)
+
+    def records(self, table, batch_size=RECORD_BATCH):
+        '''Asynchronous iterator over the records of a
+        :class:`~eulcommon.binfile.RecordTable`, such as
+        :attr:`eulcommon.binfile.eudora.Toc.messages`, reading
+        `batch_size` records from the map at a time in the thread
+        pool.'''
+        return _BatchIterator(self, _paged_records(table, batch_size),
+                              batch_size)
+
+    def walk(self, top, batch_size=RECORD_BATCH, **kwargs):
+        '''Asynchronous iterator over the mail files found in a directory
+        tree, yielding :class:`~eulcommon.binfile.triage.TriageResult`
+        objects as from :func:`eulcommon.binfile.triage.scan`, which is
+        passed any additional keyword arguments.'''
+        return _BatchIterator(self, triage.scan(top, **kwargs), batch_size)
+
+
+_default_reader = None
+
+
+def default_reader():
+    '''Return an :class:`AsyncMailReader` with default settings shared
+    by the whole process, creating it if necessary.'''
+    global _default_reader
+    if _default_reader is None:
+        _default_reader = AsyncMailReader()
+    return _default_reader
+
+
+class _MessageIterator(object):
+    # parses messages ahead of the consumer, within the reader's limits,
+    # and hands them over in folder order
+
+    def __init__(self, reader, folder, skip_deleted):
+        self.reader = reader
+        self.folder = folder
+        self.skip_deleted = skip_deleted
+        self._total = len(folder.index.messages) if folder.data else 0
+        self._position = 0        # next index entry to read
+        self._fetching = False    # index entries are being read
+        self._entries = deque()   # (offset, size) not yet being parsed
+        self._pending = deque()   # (future, size) being parsed, in order
+        self._error = None
+        self._waiter = None
+        self._closed = False
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        if self._closed:
+            return _done_future(exception=StopAsyncIteration())
+        self._waiter = _loop().create_future()
+        self._pump()
+        return self._waiter
+
+    def close(self):
+        '''Stop iterating, discarding any messages parsed ahead.'''
+        self._closed = True
+        while self._pending:
+            future, size = self._pending.popleft()
+            future.cancel()
+            self.reader._release(size)
+        self._entries.clear()
+
+    def _entries_read(self, future):
+        self._fetching = False
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            self._error = future.exception()
+        else:
+            self._entries.extend(future.result())
+        self._pump()
+
+    def _pump(self, *args):
+        while not self._closed and self._step():
+            pass
+
+    def _step(self):
+        reader = self.reader
+        if not self._entries and not self._fetching and \
+           self._position < self._total:
+            start = self._position
+            self._position = min(start + INDEX_BATCH, self._total)
+            self._fetching = True
+            reader.run(_index_entries, self.folder.index.messages, start,
+                       self._position).add_done_callback(self._entries_read)
+
+        while self._entries and len(self._pending) < reader.prefetch:
+            offset, size = self._entries[0]
+            if not reader._reserve(size, force=not self._pending):
+                reader._wait_for_budget(self._pump)
+                break
+            self._entries.popleft()
+            future = reader.run(_parse_message, self.folder, offset, size,
+                                self.skip_deleted)
+            future.add_done_callback(self._pump)
+            self._pending.append((future, size))
+
+        waiter = self._waiter
+        if waiter is None or waiter.done():
+            return False
+        if self._pending and self._pending[0][0].done():
+            future, size = self._pending.popleft()
+            reader._release(size)
+            if future.exception() is not None:
+                waiter.set_exception(future.exception())
+            elif future.result() is not None:
+                waiter.set_result(future.result())
+            # a skipped deleted message; check for the next one
+            return True
+        if self._error is not None:
+            error, self._error = self._error, None
+            waiter.set_exception(error)
+        elif not (self._pending or self._entries or self._fetching) and \
+             self._position >= self._total:
+            waiter.set_exception(StopAsyncIteration())
+        return False
+
+
+class _BatchIterator(object):
+    # advances a blocking iterator a batch at a time in the thread pool
+
+    def __init__(self, reader, source, batch_size):
+        self.reader = reader
+        self.batch_size = batch_size
+        self._source = source
+        self._buffer = deque()
+        self._exhausted = False
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        if self._buffer:
+            return _done_future(self._buffer.popleft())
+        if self._exhausted:
+            return _done_future(exception=StopAsyncIteration())
+        waiter = _loop().create_future()
+        batch = self.reader.run(_next_batch, self._source, self.batch_size)
+        batch.add_done_callback(partial(self._batch_read, waiter))
+        return waiter
+
+    def _batch_read(self, waiter, batch):
+        if batch.cancelled():
+            error = asyncio.CancelledError()
+        else:
+            error = batch.exception()
+        if error is None:
+            items = batch.result()
+            self._exhausted = len(items) < self.batch_size
+            self._buffer.extend(items)
+        if waiter.done():
+            return
+        if error is not None:
+            waiter.set_exception(error)
+        elif self._buffer:
+            waiter.set_result(self._buffer.popleft())
+        else:
+            waiter.set_exception(StopAsyncIteration())
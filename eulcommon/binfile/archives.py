@@ -0,0 +1,325 @@
+# file eulcommon/binfile/archives.py
+#
+#   Copyright 2012 Emory University Libraries
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+'''Read mail files directly out of tar and zip archives, without
+extracting them first.
+
+An :class:`Archive` reads the member list of a tar or zip file once, and
+maps each member as a window that a
+:class:`~eulcommon.binfile.BinaryStructure` can overlay in place of an
+:class:`~mmap.mmap`::
+
+    >>> from eulcommon.binfile import archives, eudora, outlookexpress
+    >>> archive = archives.open_archive('/path/to/accession.tar')
+    >>> toc = eudora.Toc(mm=archive.map('Eudora Folder/In.toc'))
+    >>> folder = outlookexpress.MacFolder('Outlook/Inbox', archive=archive)
+
+Members stored without compression (every member of an uncompressed tar
+file, and ``ZIP_STORED`` zip members) are windows into a single map of the
+whole archive, so reading them copies nothing and costs no more than
+reading an extracted file. Compressed members (in ``.tar.gz`` and similar
+files, and deflated zip members) are decompressed on demand: a window
+decompresses its member only as far as the furthest offset read so far,
+and keeps the decompressed data in memory for random access.
+
+This module exports the following names:
+ * :class:`Archive` -- a tar or zip file whose members can be mapped
+ * :func:`open_archive` -- an :class:`Archive`, indexed once per process
+ * :class:`MapWindow` -- a zero-copy window onto part of a map
+ * :class:`InflatedWindow` -- a window onto a compressed member
+'''
+
+from collections import namedtuple
+from mmap import mmap
+import os
+import struct
+import tarfile
+import threading
+import zipfile
+
+from eulcommon.binfile.msgcache import file_identity
+
+__all__ = ['Archive', 'open_archive', 'MapWindow', 'InflatedWindow',
+           'ArchiveMember']
+
+ArchiveMember = namedtuple('ArchiveMember', 'name offset size stored')
+'''An entry in the member index of an :class:`Archive`: member name, offset
+of its data in the archive file (meaningful only for stored members),
+size in bytes, and whether it is stored without compression.'''
+
+_ZIP_LOCAL_HEADER = struct.Struct('<4s5H3L2H')
+_ZIP_LOCAL_MAGIC = b'PK\x03\x04'
+
+
+def _member_name(name):
+    # a canonical member name: no leading ./ or /, no trailing /
+    while name.startswith('./'):
+        name = name[2:]
+    return name.strip('/')
+
+
+class MapWindow(object):
+    '''A read-only view of `size` bytes of a map starting at `start`,
+    indexed from zero like a map of its own. Indexing, slicing and
+    :meth:`find` are served from the underlying map without copying.'''
+
+    def __init__(self, mm, start, size):
+        self.mmap = mm
+        self.start = start
+        self.size = size
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.size)
+            if step != 1:
+                raise ValueError('map windows do not support steps')
+            return self.mmap[self.start + start:self.start + max(start, stop)]
+        if index < 0:
+            index += self.size
+        if not 0 <= index < self.size:
+            raise IndexError('map window index out of range')
+        return self.mmap[self.start + index]
+
+    def find(self, sub, start=0, end=None):
+        '''Return the lowest offset of `sub` between `start` and `end`,
+        or -1 if it is not found.'''
+        if end is None or end > self.size:
+            end = self.size
+        found = self.mmap.find(sub, self.start + start, self.start + end)
+        return -1 if found == -1 else found - self.start
+
+    def close(self):
+        '''Release the window. The archive map is left open.'''
+        self.mmap = None
+
+
+class InflatedWindow(object):
+    '''A read-only view of a compressed archive member, indexed like a
+    map. The member is decompressed only as far as it has been read,
+    `chunk_size` bytes at a time, and decompressed data is kept in memory
+    so it can be read again in any order.
+
+    :param open_member: callable returning a new file object for the
+        decompressed member
+    :param size: decompressed size of the member
+    :param chunk_size: overrides :attr:`chunk_size`
+    '''
+
+    chunk_size = 1024 * 1024
+    '''number of bytes decompressed at a time'''
+
+    def __init__(self, open_member, size, chunk_size=None):
+        self.size = size
+        if chunk_size is not None:
+            self.chunk_size = chunk_size
+        self._open = open_member
+        self._source = None
+        self._buffer = bytearray()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def buffered(self):
+        'number of bytes decompressed so far'
+        return len(self._buffer)
+
+    def _fill(self, stop):
+        stop = min(stop, self.size)
+        if len(self._buffer) >= stop:
+            return
+        with self._lock:
+            if self._source is None and len(self._buffer) < self.size:
+                self._source = self._open()
+            while len(self._buffer) < stop:
+                chunk = self._source.read(max(stop - len(self._buffer),
+                                              self.chunk_size))
+                if not chunk:
+                    break
+                self._buffer.extend(chunk)
+            if len(self._buffer) >= self.size and self._source is not None:
+                self._source.close()
+                self._source = None
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.size)
+            if step != 1:
+                raise ValueError('map windows do not support steps')
+            self._fill(stop)
+            return bytes(self._buffer[start:max(start, stop)])
+        if index < 0:
+            index += self.size
+        if not 0 <= index < self.size:
+            raise IndexError('map window index out of range')
+        self._fill(index + 1)
+        # a single byte, as from an mmap
+        if bytes is str:
+            return chr(self._buffer[index])
+        return self._buffer[index]
+
+    def find(self, sub, start=0, end=None):
+        '''Return the lowest offset of `sub` between `start` and `end`,
+        or -1 if it is not found. Decompresses the member up to `end`.'''
+        if end is None or end > self.size:
+            end = self.size
+        self._fill(end)
+        return self._buffer.find(sub, start, end)
+
+    def close(self):
+        '''Release the decompressed data.'''
+        with self._lock:
+            if self._source is not None:
+                self._source.close()
+                self._source = None
+            self._buffer = bytearray()
+
+
+class Archive(object):
+    '''A tar or zip file whose members can be mapped without extracting
+    them. The member index is read when the archive is opened.
+
+    :param path: path to a tar file (optionally compressed) or zip file
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.identity = file_identity(path)
+        'identity of the archive file when it was indexed'
+        self.members = {}
+        'dictionary of :class:`ArchiveMember` by member name'
+        self._tar = self._zip = None
+        self._infos = {}  # member name -> TarInfo or ZipInfo
+        with open(path, 'rb') as fobj:
+            size = os.fstat(fobj.fileno()).st_size
+            self.mmap = mmap(fobj.fileno(), 0, prot=1) if size else b''
+        # check for a tar file first: an uncompressed tar file whose last
+        # member is a zip file ends with that zip file's directory, and
+        # would be taken for it
+        if tarfile.is_tarfile(path):
+            self._index_tar()
+        elif zipfile.is_zipfile(path):
+            self._index_zip()
+        else:
+            raise ValueError('%s is not a tar or zip archive' % path)
+
+    def _index_zip(self):
+        self._zip = zipfile.ZipFile(self.path)
+        for info in self._zip.infolist():
+            name = _member_name(info.filename)
+            if not name or info.filename.endswith('/'):
+                continue
+            stored = info.compress_type == zipfile.ZIP_STORED and \
+                not info.flag_bits & 0x1   # not encrypted
+            offset = None
+            if stored:
+                # the local header may have a different extra field from
+                # the central directory, so read its lengths in place
+                header = self.mmap[info.header_offset:info.header_offset +
+                                   _ZIP_LOCAL_HEADER.size]
+                fields = _ZIP_LOCAL_HEADER.unpack(header)
+                if fields[0] != _ZIP_LOCAL_MAGIC:
+                    raise ValueError('bad zip member header for %s in %s' %
+                                     (info.filename, self.path))
+                offset = info.header_offset + _ZIP_LOCAL_HEADER.size + \
+                    fields[9] + fields[10]
+            self.members[name] = ArchiveMember(name, offset, info.file_size,
+                                               stored)
+            self._infos[name] = info
+
+    def _index_tar(self):
+        try:
+            tar = tarfile.open(self.path, 'r:')
+            compressed = False
+        except tarfile.ReadError:
+            tar = tarfile.open(self.path, 'r:*')
+            compressed = True
+        self._tar = tar
+        for info in tar.getmembers():
+            if not info.isfile():
+                continue
+            name = _member_name(info.name)
+            stored = not compressed and not info.issparse()
+            self.members[name] = ArchiveMember(
+                name, info.offset_data if stored else None, info.size, stored)
+            self._infos[name] = info
+
+    def __contains__(self, name):
+        return _member_name(name) in self.members
+
+    def names(self, prefix=''):
+        '''Return a sorted list of the names of the members under a
+        directory prefix (all members by default).'''
+        prefix = _member_name(prefix)
+        if not prefix:
+            return sorted(self.members)
+        prefix += '/'
+        return sorted(name for name in self.members if name.startswith(prefix))
+
+    def map(self, name):
+        '''Return a window onto the data of a member, suitable as the `mm`
+        of a :class:`~eulcommon.binfile.BinaryStructure`: a
+        :class:`MapWindow` for stored members, or an
+        :class:`InflatedWindow` for compressed ones. Raises
+        :class:`KeyError` if there is no such member.'''
+        member = self.members.get(_member_name(name))
+        if member is None:
+            raise KeyError('%s is not a member of %s' % (name, self.path))
+        if member.stored:
+            return MapWindow(self.mmap, member.offset, member.size)
+        info = self._infos[member.name]
+        if self._zip is not None:
+            open_member = lambda: self._zip.open(info)
+        else:
+            open_member = lambda: self._tar.extractfile(info)
+        return InflatedWindow(open_member, member.size)
+
+    def member_identity(self, name):
+        '''Return a tuple identifying the current version of a member, for
+        use like :func:`~eulcommon.binfile.msgcache.file_identity`.'''
+        return self.identity + (_member_name(name),)
+
+    def close(self):
+        '''Close the archive. Windows onto stored members can no longer be
+        read.'''
+        for archive in (self._tar, self._zip):
+            if archive is not None:
+                archive.close()
+        if not isinstance(self.mmap, bytes):
+            self.mmap.close()
+
+
+_archives = {}
+_archives_lock = threading.Lock()
+
+
+def open_archive(path):
+    '''Return an :class:`Archive` for `path`, reusing one opened earlier in
+    this process unless the file has changed since, so that the member
+    index of each archive is read only once. An archive replaced because
+    its file has changed is closed.'''
+    key = os.path.realpath(path)
+    with _archives_lock:
+        archive = _archives.get(key)
+        if archive is None or archive.identity != file_identity(path):
+            if archive is not None:
+                archive.close()
+            archive = _archives[key] = Archive(path)
+        return archive
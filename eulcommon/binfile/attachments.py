@@ -0,0 +1,375 @@
+# file eulcommon/binfile/attachments.py
+#
+#   Copyright 2012 Emory University Libraries
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+'''Extract email attachments to disk without parsing whole messages.
+
+Parsing a message with :mod:`email` and then decoding its attachment
+payloads holds the entire message, and each decoded attachment, in memory
+at once. For archival mail folders with very large attachments that is
+often not practical. This module instead reads each message through a
+:class:`~eulcommon.binfile.RegionReader`, finds MIME part boundaries a line
+at a time, and decodes ``base64`` and ``quoted-printable`` content in
+chunks directly to output files, computing checksums as the data is
+written. Memory use depends on the chunk size, not the attachment size.
+
+Only the (small) header block of each part is handed to the :mod:`email`
+package for parsing.
+
+This module exports the following names:
+ * :class:`Attachment` -- information about a single extracted attachment
+ * :class:`AttachmentExtractor` -- streaming extractor for
+   :class:`~eulcommon.binfile.outlookexpress.MacMailMessage` content
+ * :func:`extract_attachments` -- convenience generator for extracting all
+   attachments in a :class:`~eulcommon.binfile.outlookexpress.MacFolder`
+'''
+
+import binascii
+from email.parser import HeaderParser
+import hashlib
+import io
+import logging
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['Attachment', 'AttachmentExtractor', 'extract_attachments']
+
+# longest line read whole when checking for a MIME boundary (RFC 5322
+# limits lines to 998 characters)
+_BOUNDARY_LINE = 1000
+
+
+class Attachment(object):
+    '''Information about a single attachment written to disk by an
+    :class:`AttachmentExtractor`.'''
+
+    def __init__(self, filename, path, content_type, size, checksums,
+                 message=None, part=None):
+        self.filename = filename
+        'filename as specified in the message (may be None)'
+        self.path = path
+        'full path to the extracted file'
+        self.content_type = content_type
+        'MIME content type of the attachment'
+        self.size = size
+        'size of the decoded attachment in bytes'
+        self.checksums = checksums
+        'dictionary of hex digests of the decoded data, keyed on algorithm'
+        self.message = message
+        'position of the containing message within its folder'
+        self.part = part
+        'dotted MIME part number of the attachment within its message'
+
+    def __repr__(self):
+        return '<Attachment %s (%s, %d bytes)>' % (self.path,
+                                                  self.content_type, self.size)
+
+
+# characters not allowed in output filenames
+_unsafe_filename_chars = re.compile(r'[^\w.\- ]+')
+
+
+def _safe_filename(name):
+    name = os.path.basename(name.replace('\\', '/')).strip()
+    name = _unsafe_filename_chars.sub('_', name)
+    return name.lstrip('.') or 'attachment'
+
+
+def _split_terminator(line):
+    # split a line into content and line ending
+    if line.endswith('\r\n'):
+        return line[:-2], '\r\n'
+    if line.endswith('\n'):
+        return line[:-1], '\n'
+    return line, ''
+
+
+class _Base64Decoder(object):
+    # accumulate base64 text and decode it in large, 4-character aligned
+    # blocks
+    def __init__(self, write, chunk_size):
+        self.write = write
+        self.chunk_size = chunk_size
+        self.pending = []
+        self.pending_len = 0
+
+    def feed(self, line):
+        line = ''.join(line.split())
+        self.pending.append(line)
+        self.pending_len += len(line)
+        if self.pending_len >= self.chunk_size:
+            self._decode()
+
+    def _decode(self, final=False):
+        data = ''.join(self.pending)
+        if final:
+            # pad any truncated final quantum so the decoder accepts it
+            data += '=' * (-len(data) % 4)
+            keep = ''
+        else:
+            cut = len(data) - len(data) % 4
+            data, keep = data[:cut], data[cut:]
+        if data:
+            try:
+                self.write(binascii.a2b_base64(data))
+            except binascii.Error as err:
+                logger.warning('Error decoding base64 attachment data: %s', err)
+        self.pending = [keep]
+        self.pending_len = len(keep)
+
+    def close(self):
+        self._decode(final=True)
+
+
+class _LineDecoder(object):
+    # write lines as-is (7bit, 8bit, binary) or decoded from
+    # quoted-printable.  The line ending before a MIME boundary belongs to
+    # the boundary, so each line ending is held back until another line
+    # of content arrives.  Lines longer than the read size arrive in
+    # pieces; a line ending or escape cut short at the end of a piece is
+    # carried over to the next one.
+    def __init__(self, write, quoted_printable=False):
+        self.write = write
+        self.quoted_printable = quoted_printable
+        self.held = ''
+        self.partial = ''
+
+    def feed(self, line):
+        content, terminator = _split_terminator(self.partial + line)
+        self.partial = ''
+        if not terminator:
+            keep = len(content) - content.endswith('\r')
+            if self.quoted_printable:
+                escape = content.find('=', max(keep - 2, 0), keep)
+                if escape != -1:
+                    keep = escape
+            content, self.partial = content[:keep], content[keep:]
+        if self.held:
+            self.write(self.held)
+        if self.quoted_printable:
+            if terminator and content.endswith('='):
+                # soft line break
+                content, terminator = content[:-1], ''
+            content = binascii.a2b_qp(content)
+        self.write(content)
+        self.held = terminator
+
+    def close(self):
+        # data ending without a line ending
+        if self.partial:
+            self.write(binascii.a2b_qp(self.partial)
+                       if self.quoted_printable else self.partial)
+            self.partial = ''
+
+
+class _LineReader(object):
+    # read a stream a line at a time, returning lines longer than
+    # chunk_size in pieces, so that content with no line breaks at all is
+    # still read a chunk at a time
+    def __init__(self, stream, chunk_size):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.at_start = True    # the next piece starts a line
+        self.line_start = True  # the last piece returned started a line
+
+    def readline(self):
+        piece = self.stream.readline(self.chunk_size)
+        self.line_start = self.at_start
+        if self.line_start and piece[:2] in ('-', '--'):
+            # a possible boundary line is read whole, up to a limit
+            while not piece.endswith('\n') and len(piece) < _BOUNDARY_LINE:
+                more = self.stream.readline(_BOUNDARY_LINE - len(piece))
+                if not more:
+                    break
+                piece += more
+        self.at_start = piece.endswith('\n')
+        return piece
+
+    def readfullline(self):
+        # a whole line, however long (for headers)
+        pieces = [self.readline()]
+        while pieces[-1] and not self.at_start:
+            pieces.append(self.readline())
+        return ''.join(pieces)
+
+
+class AttachmentExtractor(object):
+    '''Write attachments from
+    :class:`~eulcommon.binfile.outlookexpress.MacMailMessage` content to
+    files in a directory, without loading whole messages or whole
+    attachments into memory.
+
+    A MIME leaf part is treated as an attachment when it has a filename
+    (in either its ``Content-Disposition`` or ``Content-Type`` header) or
+    an ``attachment`` disposition.
+
+    :param output_dir: directory where attachment files will be written
+    :param algorithms: names of :mod:`hashlib` algorithms used to checksum
+        each decoded attachment
+    :param chunk_size: size of the buffered reads from the mail file, and
+        approximately the amount of encoded data decoded at a time; content
+        lines longer than this are read in pieces
+    '''
+
+    def __init__(self, output_dir, algorithms=('md5', 'sha1'),
+                 chunk_size=64 * 1024):
+        self.output_dir = output_dir
+        self.algorithms = algorithms
+        self.chunk_size = chunk_size
+
+    def extract_message(self, raw_msg, prefix='msg'):
+        '''Extract attachments from a single message.
+
+        :param raw_msg: a
+            :class:`~eulcommon.binfile.outlookexpress.MacMailMessage`, or
+            any object with an ``open()`` method returning a binary,
+            file-like object over the raw message content
+        :param prefix: prefix for output filenames, used to keep
+            attachments from different messages with the same name apart
+        :returns: list of :class:`Attachment`
+        '''
+        stream = _LineReader(io.BufferedReader(raw_msg.open(),
+                                               self.chunk_size),
+                             self.chunk_size)
+        found = []
+        headers = self._read_headers(stream)
+        self._process_entity(stream, headers, [], '1', prefix, found)
+        return found
+
+    def extract_folder(self, folder, skip_deleted=True):
+        '''Generator extracting attachments from every message in a
+        :class:`~eulcommon.binfile.outlookexpress.MacFolder`, yielding
+        an :class:`Attachment` for each file written.  Output files are
+        prefixed with the position of their message in the folder.
+
+        :param skip_deleted: skip messages marked as deleted (default)
+        '''
+        for i, raw_msg in enumerate(folder.raw_messages):
+            if skip_deleted and raw_msg.deleted:
+                continue
+            for attachment in self.extract_message(raw_msg, '%06d' % i):
+                attachment.message = i
+                yield attachment
+
+    def _read_headers(self, stream):
+        lines = []
+        while True:
+            line = stream.readfullline()
+            if not line or line in ('\n', '\r\n'):
+                break
+            lines.append(line)
+        return HeaderParser().parsestr(''.join(lines))
+
+    def _boundary(self, stream, line, boundaries):
+        # check a line against the active boundaries (innermost first);
+        # returns a tuple of boundary and end flag, or None
+        if not stream.line_start or not line.startswith('--'):
+            return None
+        marker = line.rstrip()
+        for boundary in boundaries:
+            delimiter = '--' + boundary
+            if marker == delimiter:
+                return (boundary, False)
+            if marker == delimiter + '--':
+                return (boundary, True)
+        return None
+
+    def _skip(self, stream, boundaries):
+        # read and discard lines up to the next boundary line
+        while True:
+            line = stream.readline()
+            if not line:
+                return None
+            found = self._boundary(stream, line, boundaries)
+            if found:
+                return found
+
+    def _process_entity(self, stream, headers, boundaries, part, prefix,
+                        found):
+        # process a MIME entity whose headers have already been read;
+        # returns the boundary line that ended it (or None at end of data)
+        boundary = headers.get_param('boundary')
+        if headers.get_content_maintype() == 'multipart' and boundary:
+            inner = [boundary] + boundaries
+            marker = self._skip(stream, inner)  # preamble
+            num = 0
+            while marker is not None and marker == (boundary, False):
+                num += 1
+                part_headers = self._read_headers(stream)
+                marker = self._process_entity(stream, part_headers, inner,
+                                              '%s.%d' % (part, num),
+                                              prefix, found)
+            if marker == (boundary, True):
+                marker = self._skip(stream, boundaries)  # epilogue
+            return marker
+
+        filename = headers.get_filename()
+        disposition = (headers.get('Content-Disposition') or '').split(';')[0]
+        if filename is None and disposition.strip().lower() != 'attachment':
+            return self._skip(stream, boundaries)
+        return self._write_attachment(stream, headers, filename, boundaries,
+                                      part, prefix, found)
+
+    def _write_attachment(self, stream, headers, filename, boundaries, part,
+                          prefix, found):
+        out_name = '%s-%s-%s' % (prefix, part,
+                                 _safe_filename(filename or 'attachment'))
+        path = os.path.join(self.output_dir, out_name)
+        hashes = [(algorithm, hashlib.new(algorithm))
+                  for algorithm in self.algorithms]
+        size = [0]
+
+        with open(path, 'wb') as outfile:
+            def write(data):
+                outfile.write(data)
+                for _, digest in hashes:
+                    digest.update(data)
+                size[0] += len(data)
+
+            encoding = (headers.get('Content-Transfer-Encoding') or '').strip().lower()
+            if encoding == 'base64':
+                decoder = _Base64Decoder(write, self.chunk_size)
+            else:
+                decoder = _LineDecoder(write,
+                                       encoding == 'quoted-printable')
+
+            marker = None
+            while True:
+                line = stream.readline()
+                if not line:
+                    break
+                marker = self._boundary(stream, line, boundaries)
+                if marker:
+                    break
+                decoder.feed(line)
+            decoder.close()
+
+        logger.debug('Extracted %d bytes to %s', size[0], path)
+        found.append(Attachment(filename, path, headers.get_content_type(),
+                                size[0],
+                                dict((algorithm, digest.hexdigest())
+                                     for algorithm, digest in hashes),
+                                part=part))
+        return marker
+
+
+def extract_attachments(folder, output_dir, **kwargs):
+    '''Generator extracting every attachment in a
+    :class:`~eulcommon.binfile.outlookexpress.MacFolder` to `output_dir`,
+    yielding an :class:`Attachment` for each one.  Additional keyword
+    arguments are passed to :class:`AttachmentExtractor`.'''
+    return AttachmentExtractor(output_dir, **kwargs).extract_folder(folder)
@@ -0,0 +1,332 @@
+# file eulcommon/binfile/byteprofile.py
+#
+#   Copyright 2012 Emory University Libraries
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+'''Profile the bytes of a :class:`~eulcommon.binfile.RecordTable` that are
+not yet mapped to fields, as an aid to reverse-engineering binary formats.
+
+Structures like :class:`eulcommon.binfile.eudora.Message` contain ranges
+of bytes whose meaning is not known. Looking at how the values at each of
+those offsets vary across many records is usually the quickest way to
+work out what they are: constant bytes are padding or magic numbers, a
+byte with two values may be a flag, an increasing value may be an id or a
+date. :func:`profile` computes these statistics for every byte offset in
+a record that is not covered by a declared field, and also decodes
+2- and 4-byte integers at those offsets in both byte orders to find
+counters and timestamps::
+
+    >>> from eulcommon.binfile import eudora, byteprofile
+    >>> toc = eudora.Toc('In.toc')
+    >>> print byteprofile.profile(toc.messages).report()
+
+Statistics are computed a column at a time over blocks of records read
+from the map, using strided slices and :mod:`array` decoding rather than
+accessing each record individually, so tables with millions of records
+can be profiled in seconds.
+
+This module exports the following names:
+ * :func:`profile` -- profile a :class:`~eulcommon.binfile.RecordTable`
+ * :func:`field_spans` -- the byte ranges covered by declared fields
+ * :class:`TableProfile` -- profile results for a table
+ * :class:`ByteStatistics` -- value distribution at a single byte offset
+ * :class:`IntegerCandidate` -- a possible integer at an unmapped offset
+'''
+
+from array import array
+import calendar
+import math
+import operator
+import sys
+try:
+    from itertools import imap, islice
+except ImportError:
+    # python 3
+    from itertools import islice
+    imap = map
+
+from eulcommon.binfile.core import ByteField, LengthPrependedStringField, \
+    _array_typecode
+
+__all__ = ['profile', 'field_spans', 'TableProfile', 'ByteStatistics',
+           'IntegerCandidate']
+
+# seconds between the Mac epoch (1904-01-01) and the Unix epoch
+MAC_EPOCH_OFFSET = 2082844800
+
+TIMESTAMP_YEARS = (1984, 2020)
+'''range of years in which integer values are reported as plausible
+timestamps'''
+
+BLOCK_RECORDS = 65536
+'''number of records read from the map and processed at a time'''
+
+
+def field_spans(record_class, table=None):
+    '''Return a sorted list of ``(start, end)`` byte ranges within a
+    record covered by the fields declared on `record_class` (including
+    inherited fields).
+
+    Fixed-length fields cover their ``start`` to ``end`` range. A
+    :class:`~eulcommon.binfile.LengthPrependedStringField` covers its length
+    byte plus the longest string stored in any record of `table`, or just
+    the length byte when no table is given.
+    '''
+    spans = []
+    seen = set()
+    for cls in record_class.__mro__:
+        for name, field in vars(cls).items():
+            if name in seen:
+                continue
+            seen.add(name)
+            if isinstance(field, ByteField):
+                spans.append((field.start, field.end))
+            elif isinstance(field, LengthPrependedStringField):
+                longest = 0
+                if table is not None and len(table):
+                    longest = max(bytearray(_column(table.data(), field.offset,
+                                                    table.length)))
+                spans.append((field.offset, field.offset + 1 + longest))
+    return sorted(spans)
+
+
+def _uncovered(length, spans):
+    covered = bytearray(length)
+    for start, end in spans:
+        for i in range(max(0, start), min(end, length)):
+            covered[i] = 1
+    return [i for i in range(length) if not covered[i]]
+
+
+def _column(data, offset, length):
+    # the byte at offset in every record of data, as one string
+    return data[offset::length]
+
+
+class ByteStatistics(object):
+    '''The distribution of values of a single byte offset across all of
+    the records in a table.'''
+
+    def __init__(self, offset):
+        self.offset = offset
+        'offset of the byte within each record'
+        self.counts = {}
+        'dictionary of occurrence counts keyed on byte value'
+        self.total = 0
+        'number of records examined'
+
+    def _update(self, column):
+        for value in set(column):
+            key = ord(value) if not isinstance(value, int) else value
+            self.counts[key] = self.counts.get(key, 0) + column.count(value)
+        self.total += len(column)
+
+    @property
+    def distinct(self):
+        'number of distinct values'
+        return len(self.counts)
+
+    @property
+    def constant(self):
+        'the value of this byte if it is the same in every record, else None'
+        if len(self.counts) == 1:
+            return list(self.counts)[0]
+        return None
+
+    @property
+    def entropy(self):
+        'Shannon entropy of the values, in bits (0 to 8)'
+        entropy = 0.0
+        for count in self.counts.values():
+            p = float(count) / self.total
+            entropy -= p * math.log(p, 2)
+        return entropy
+
+    def __repr__(self):
+        return '<ByteStatistics %d: %d distinct>' % (self.offset, self.distinct)
+
+
+class IntegerCandidate(object):
+    '''Summary of the values found when a range of unmapped bytes is
+    decoded as an unsigned integer.'''
+
+    def __init__(self, offset, width, byteorder):
+        self.offset = offset
+        'offset of the first byte within each record'
+        self.width = width
+        'size of the integer in bytes'
+        self.byteorder = byteorder
+        "``'big'`` or ``'little'``"
+        self.minimum = None
+        'smallest value'
+        self.maximum = None
+        'largest value'
+        self.min_nonzero = None
+        'smallest value other than zero'
+        self.nondecreasing = True
+        'True if the value never decreases from one record to the next'
+        self._last = None
+
+    def _update(self, values):
+        if not values:
+            return
+        low, high = min(values), max(values)
+        self.minimum = low if self.minimum is None else min(self.minimum, low)
+        self.maximum = high if self.maximum is None else max(self.maximum, high)
+        if low == 0:
+            low = min(filter(None, values)) if high else None
+        if low is not None:
+            self.min_nonzero = low if self.min_nonzero is None \
+                else min(self.min_nonzero, low)
+        if self.nondecreasing:
+            # stops at the first decrease, so random data costs little
+            if (self._last is not None and values[0] < self._last) or \
+               not all(imap(operator.le, values, islice(values, 1, None))):
+                self.nondecreasing = False
+            self._last = values[-1]
+
+    @property
+    def timestamp(self):
+        '''``'mac'`` or ``'unix'`` if every non-zero value falls within
+        :data:`TIMESTAMP_YEARS` when interpreted as seconds since the Mac
+        or Unix epoch; otherwise None'''
+        if self.width != 4 or self.min_nonzero is None:
+            return None
+        start = calendar.timegm((TIMESTAMP_YEARS[0], 1, 1, 0, 0, 0))
+        end = calendar.timegm((TIMESTAMP_YEARS[1] + 1, 1, 1, 0, 0, 0))
+        for kind, shift in (('mac', MAC_EPOCH_OFFSET), ('unix', 0)):
+            if start + shift <= self.min_nonzero and self.maximum < end + shift:
+                return kind
+        return None
+
+    def __repr__(self):
+        return '<IntegerCandidate %d+%d %s>' % (self.offset, self.width,
+                                               self.byteorder)
+
+
+class TableProfile(object):
+    '''Results of :func:`profile`.'''
+
+    def __init__(self, table, spans, byte_stats, integers):
+        self.record_class = table.record_class
+        'the record class profiled'
+        self.records = len(table)
+        'number of records profiled'
+        self.spans = spans
+        'byte ranges covered by declared fields, as from :func:`field_spans`'
+        self.bytes = byte_stats
+        'list of :class:`ByteStatistics`, one per unmapped byte offset'
+        self.integers = integers
+        '''list of :class:`IntegerCandidate` for unmapped ranges whose
+        values are not all the same'''
+
+    @property
+    def gaps(self):
+        'list of ``(start, end)`` ranges of unmapped bytes'
+        gaps = []
+        for stats in self.bytes:
+            if gaps and gaps[-1][1] == stats.offset:
+                gaps[-1] = (gaps[-1][0], stats.offset + 1)
+            else:
+                gaps.append((stats.offset, stats.offset + 1))
+        return gaps
+
+    def report(self):
+        '''A plain-text summary of the profile, one line per unmapped
+        byte followed by one line per interesting integer candidate.'''
+        lines = ['%s: %d records, unmapped bytes %s' % (
+            self.record_class.__name__, self.records,
+            ', '.join('%d-%d' % (start, end - 1) for start, end in self.gaps))]
+        for stats in self.bytes:
+            if stats.constant is not None:
+                desc = 'constant 0x%02x' % stats.constant
+            else:
+                desc = '%d values, entropy %.2f bits' % (stats.distinct,
+                                                        stats.entropy)
+            lines.append('  byte %3d: %s' % (stats.offset, desc))
+        for candidate in self.integers:
+            notes = []
+            if candidate.nondecreasing:
+                notes.append('non-decreasing')
+            if candidate.timestamp:
+                notes.append('%s timestamp' % candidate.timestamp)
+            lines.append('  %d-byte %s-endian int at %d: %d..%d%s' % (
+                candidate.width, candidate.byteorder, candidate.offset,
+                candidate.minimum, candidate.maximum,
+                ' (%s)' % ', '.join(notes) if notes else ''))
+        return '\n'.join(lines)
+
+
+def profile(table, widths=(2, 4), alignment=2, block_records=BLOCK_RECORDS):
+    '''Profile the unmapped bytes of a
+    :class:`~eulcommon.binfile.RecordTable`.
+
+    :param table: the :class:`~eulcommon.binfile.RecordTable` to profile
+    :param widths: integer sizes, in bytes, to decode at unmapped offsets
+    :param alignment: only decode integers starting at offsets that are a
+        multiple of this value
+    :param block_records: number of records processed at a time, which
+        bounds memory use
+    :rtype: :class:`TableProfile`
+    '''
+    length = table.length
+    spans = field_spans(table.record_class, table)
+    offsets = _uncovered(length, spans)
+    unmapped = set(offsets)
+    byte_stats = [ByteStatistics(offset) for offset in offsets]
+
+    integers = []
+    for width in widths:
+        typecode = _array_typecode(width)
+        if typecode is None:
+            raise ValueError('no array type for %d-byte integers' % width)
+        for offset in offsets:
+            if offset % alignment or \
+               not all(offset + i in unmapped for i in range(width)):
+                continue
+            for byteorder in ('big', 'little'):
+                integers.append((IntegerCandidate(offset, width, byteorder),
+                                 typecode))
+
+    for start in range(0, len(table), block_records):
+        data = table.data(start, start + block_records)
+        count = len(data) // length
+        columns = {}
+        constant = set()
+        for stats in byte_stats:
+            column = _column(data, stats.offset, length)
+            columns[stats.offset] = column
+            if column == column[:1] * len(column):
+                constant.add(stats.offset)
+            stats._update(column)
+        for candidate, typecode in integers:
+            rows = count
+            if all(candidate.offset + i in constant
+                   for i in range(candidate.width)):
+                # the same value in every record of this block; decode
+                # it only once
+                rows = 1
+            # interleave the byte columns into a contiguous buffer of
+            # integers and decode them all at once
+            buf = bytearray(rows * candidate.width)
+            for i in range(candidate.width):
+                buf[i::candidate.width] = columns[candidate.offset + i][:rows]
+            values = array(typecode, bytes(buf))
+            if candidate.byteorder != sys.byteorder:
+                values.byteswap()
+            candidate._update(values)
+
+    varying = [candidate for candidate, typecode in integers
+               if candidate.minimum != candidate.maximum]
+    return TableProfile(table, spans, byte_stats, varying)
@@ -0,0 +1,436 @@
+# file eulcommon/binfile/conversations.py
+#
+#   Copyright 2012 Emory University Libraries
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+'''Reconstruct email conversations (threads) in mail folders from
+message headers alone.
+
+Messages are threaded with the algorithm described by Jamie Zawinski
+(http://www.jwz.org/doc/threading.html): replies are linked to the
+messages named in their ``References`` and ``In-Reply-To`` headers,
+placeholders stand in for referenced messages that are not in the
+folder, and threads whose root messages share a subject (ignoring
+``Re:`` prefixes) are grouped together::
+
+    >>> from eulcommon.binfile import conversations, outlookexpress
+    >>> folder = outlookexpress.MacFolder('/path/to/folder')
+    >>> threads = conversations.thread_macfolder(folder)
+    >>> for thread in threads:
+    ...     print [threads.parent_of(msg) for msg in thread]
+
+Only the header block of each message is read: for Eudora folders the
+``.toc`` file records where each message body starts, and for Outlook
+Express folders headers are read from the ``Mail`` file until the first
+blank line. Nothing is parsed with the :mod:`email` package.
+
+Message ids are interned to integers as they are read, and all of the
+threading state is kept in :mod:`array` columns indexed by those
+integers, so memory use is a few dozen bytes per message. To bound memory
+further, message ids and subjects are interned by their hash values
+rather than stored; two different ids with the same hash (vanishingly
+unlikely with 64-bit hashes) would be treated as the same message.
+
+This module exports the following names:
+ * :class:`Threader` -- threads messages given their header fields
+ * :class:`Threads` -- the result of threading a set of messages
+ * :func:`parse_headers` -- extract threading fields from a header block
+ * :func:`base_subject` -- a subject with reply and forward prefixes removed
+ * :func:`thread_macfolder` -- thread an Outlook Express folder
+ * :func:`thread_eudora` -- thread a Eudora folder
+'''
+
+from array import array
+from bisect import bisect_left
+from mmap import mmap
+import os
+import re
+
+from eulcommon.binfile.eudora import Toc
+
+__all__ = ['Threader', 'Threads', 'parse_headers', 'base_subject',
+           'thread_macfolder', 'thread_eudora', 'macfolder_headers',
+           'eudora_headers']
+
+HEADER_CHUNK = 4096
+'''number of bytes read at a time when looking for the end of a header
+block'''
+
+MAX_HEADER_SIZE = 256 * 1024
+'''largest header block read for a single message'''
+
+_HEADER_END = re.compile(r'\r\n\r\n|\n\n|\r\r')
+_FIELD = re.compile(r'^(message-id|in-reply-to|references|subject)[ \t]*:(.*)$',
+                    re.IGNORECASE)
+_MSGID = re.compile(r'<([^<>\s]+)>')
+_REPLY_PREFIX = re.compile(r'^\s*(re|fwd?|aw|sv)(\[\d+\])?\s*:\s*', re.IGNORECASE)
+
+# array typecode for signed integers at least 64 bits wide, for hashes
+_HASH_TYPE = 'l' if array('l').itemsize >= 8 else 'q'
+
+
+def _split_lines(data):
+    # mail files from classic Mac OS use bare carriage returns
+    return data.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+
+
+def parse_headers(data):
+    '''Extract the fields used for threading from a message header block
+    (anything after the first blank line is ignored).
+
+    :returns: tuple of message id (without angle brackets, or None),
+        list of referenced message ids with the direct parent last, and
+        subject (or None)
+    '''
+    match = _HEADER_END.search(data)
+    if match:
+        data = data[:match.start()]
+    fields = {}
+    name = None
+    for line in _split_lines(data):
+        if line[:1] in (' ', '\t'):
+            # continuation of a folded header
+            if name is not None:
+                fields[name] += ' ' + line.strip()
+            continue
+        name = None
+        field = _FIELD.match(line)
+        if field:
+            name = field.group(1).lower()
+            if name not in fields:
+                fields[name] = field.group(2).strip()
+            else:
+                name = None
+
+    message_id = None
+    if 'message-id' in fields:
+        ids = _MSGID.findall(fields['message-id'])
+        message_id = ids[0] if ids else (fields['message-id'] or None)
+    references = _MSGID.findall(fields.get('references', ''))
+    in_reply_to = _MSGID.findall(fields.get('in-reply-to', ''))
+    if in_reply_to and (not references or references[-1] != in_reply_to[0]):
+        references.append(in_reply_to[0])
+    return message_id, references, fields.get('subject')
+
+
+def base_subject(subject):
+    '''Return a subject normalized for comparison (lower case, with
+    whitespace collapsed) and with any ``Re:`` or ``Fwd:`` prefixes
+    removed, and whether any prefixes were found, as a tuple.'''
+    if not subject:
+        return '', False
+    subject = ' '.join(subject.split()).lower()
+    if ':' not in subject:
+        return subject, False
+    reply = False
+    while True:
+        stripped = _REPLY_PREFIX.sub('', subject, 1)
+        if stripped == subject:
+            return subject, reply
+        subject, reply = stripped, True
+
+
+class Threads(object):
+    '''The result of :meth:`Threader.threads`. Iterating yields each
+    thread as a list of message numbers, in the order the messages were
+    added; threads are in order of their earliest message.'''
+
+    def __init__(self, numbers, thread, parent):
+        self.numbers = numbers
+        '''array of message numbers, in the order messages were added'''
+        self.thread = thread
+        '''array of thread numbers, parallel to :attr:`numbers`'''
+        self.parent = parent
+        '''array of the position in :attr:`numbers` of each message's
+        parent message, or -1 for messages at the top of their thread'''
+        self._sorted = all(a < b for a, b in zip(numbers, numbers[1:]))
+        self._positions = None
+
+    def __len__(self):
+        return max(self.thread) + 1 if self.thread else 0
+
+    def __iter__(self):
+        members = [[] for i in range(len(self))]
+        for number, thread in zip(self.numbers, self.thread):
+            members[thread].append(number)
+        return iter(members)
+
+    def _position(self, number):
+        if self._sorted:
+            pos = bisect_left(self.numbers, number)
+            if pos < len(self.numbers) and self.numbers[pos] == number:
+                return pos
+            raise KeyError(number)
+        if self._positions is None:
+            self._positions = dict((n, i) for i, n in enumerate(self.numbers))
+        return self._positions[number]
+
+    def thread_of(self, number):
+        '''Return the thread number of a message.'''
+        return self.thread[self._position(number)]
+
+    def parent_of(self, number):
+        '''Return the message number of a message's parent, or None if
+        it is at the top of its thread.'''
+        parent = self.parent[self._position(number)]
+        return None if parent == -1 else self.numbers[parent]
+
+
+class Threader(object):
+    '''Thread messages from their ``Message-ID``, ``References``,
+    ``In-Reply-To`` and ``Subject`` headers, using compact integer
+    structures. Add messages with :meth:`add` or :meth:`add_headers`, then
+    call :meth:`threads`.
+
+    :param group_by_subject: if True, group threads whose top messages
+        have the same :func:`base_subject`
+    '''
+
+    def __init__(self, group_by_subject=True):
+        self.group_by_subject = group_by_subject
+        self._ids = {}                  # hash of message id -> container
+        # one entry per container (a message, or a referenced message that
+        # may not be present)
+        self._parent = array('l')
+        self._message = array('l')      # message position, or -1
+        self._has_children = bytearray()
+        # one entry per message
+        self._numbers = array('l')
+        self._container = array('l')
+        self._subject = array(_HASH_TYPE)
+        self._reply = bytearray()
+
+    def __len__(self):
+        return len(self._numbers)
+
+    def _new_container(self):
+        self._parent.append(-1)
+        self._message.append(-1)
+        self._has_children.append(0)
+        return len(self._parent) - 1
+
+    def _is_ancestor(self, ancestor, container):
+        # is ancestor reachable by following parents from container?
+        if not self._has_children[ancestor]:
+            return ancestor == container
+        parent = self._parent
+        while container != -1:
+            if container == ancestor:
+                return True
+            container = parent[container]
+        return False
+
+    def add(self, number, message_id, references=(), subject=None):
+        '''Add a message.
+
+        :param number: message number reported in results, e.g. the
+            position of the message in its folder
+        :param message_id: the message id, or None if it has none
+        :param references: list of referenced message ids, with the
+            direct parent last (as from :func:`parse_headers`)
+        :param subject: the message subject, or None
+        '''
+        position = len(self._numbers)
+        ids, parent = self._ids, self._parent
+        container = -1
+        if message_id:
+            key = hash(message_id)
+            container = ids.get(key, -1)
+            if container == -1:
+                container = ids[key] = self._new_container()
+        if container == -1 or self._message[container] != -1:
+            # missing or duplicate message id
+            container = self._new_container()
+        self._message[container] = position
+
+        previous = -1
+        for ref in references:
+            key = hash(ref)
+            ref_container = ids.get(key, -1)
+            if ref_container == -1:
+                ref_container = ids[key] = self._new_container()
+            if previous != -1 and parent[ref_container] == -1 and \
+               not self._is_ancestor(ref_container, previous):
+                parent[ref_container] = previous
+                self._has_children[previous] = 1
+            previous = ref_container
+        if previous != -1:
+            if self._is_ancestor(container, previous):
+                previous = -1
+            else:
+                self._has_children[previous] = 1
+        parent[container] = previous
+
+        subject, reply = base_subject(subject)
+        self._numbers.append(number)
+        self._container.append(container)
+        self._subject.append(hash(subject) if subject else 0)
+        self._reply.append(reply)
+
+    def add_headers(self, number, data):
+        '''Add a message from its raw header block.'''
+        message_id, references, subject = parse_headers(data)
+        self.add(number, message_id, references, subject)
+
+    def threads(self):
+        '''Thread the messages added so far.
+
+        :rtype: :class:`Threads`
+        '''
+        parent, message = self._parent, self._message
+        # nearest ancestor with a message, and topmost ancestor, for each
+        # container; placeholders without messages are skipped over
+        nearest = array('l', [-1]) * len(parent)
+        top = array('l', [-2]) * len(parent)
+        for container in self._container:
+            path = []
+            while container != -1 and top[container] == -2:
+                path.append(container)
+                container = parent[container]
+            while path:
+                container = path.pop()
+                above = parent[container]
+                if above == -1:
+                    top[container] = container
+                else:
+                    top[container] = top[above]
+                    nearest[container] = above if message[above] != -1 \
+                        else nearest[above]
+
+        containers = self._container
+        msg_parent = array('l', [message[nearest[c]] if nearest[c] != -1
+                                 else -1 for c in containers])
+        root = [top[c] for c in containers]
+
+        groups = {}  # root container -> group root container
+        if self.group_by_subject:
+            self._group_roots(root, msg_parent, groups)
+
+        numbering = {}
+        thread = array('l', [numbering.setdefault(groups.get(key, key),
+                                                  len(numbering))
+                             for key in root])
+        return Threads(self._numbers, thread, msg_parent)
+
+    def _group_roots(self, root, msg_parent, groups):
+        # group threads by the subject of their first top-level message;
+        # where only one of two such messages is a reply, it becomes a
+        # reply to the other
+        seen = set()
+        by_subject = {}  # subject hash -> (root container, top message)
+        for position in range(len(root)):
+            key = root[position]
+            if msg_parent[position] != -1 or key in seen:
+                continue
+            seen.add(key)
+            subject = self._subject[position]
+            if not subject:
+                continue
+            if subject not in by_subject:
+                by_subject[subject] = (key, position)
+                continue
+            other_key, other_position = by_subject[subject]
+            groups[key] = groups.get(other_key, other_key)
+            if self._reply[position] and not self._reply[other_position]:
+                msg_parent[position] = other_position
+            elif self._reply[other_position] and not self._reply[position]:
+                msg_parent[other_position] = position
+                by_subject[subject] = (other_key, position)
+
+
+def _read_header(raw_msg):
+    # the header block of a MacMailMessage, read a chunk at a time
+    reader = raw_msg.open()
+    data = ''
+    while len(data) < MAX_HEADER_SIZE:
+        chunk = reader.read(HEADER_CHUNK)
+        if not chunk:
+            break
+        data += chunk
+        if _HEADER_END.search(data, max(0, len(data) - len(chunk) - 3)):
+            break
+    return data
+
+
+def macfolder_headers(folder, skip_deleted=True):
+    '''Generator yielding the position and raw header block of each
+    message in an :class:`~eulcommon.binfile.outlookexpress.MacFolder`.'''
+    if not folder.data:
+        return
+    for i, raw_msg in enumerate(folder.raw_messages):
+        if skip_deleted and raw_msg.deleted:
+            continue
+        yield i, _read_header(raw_msg)
+
+
+def eudora_headers(toc, data_path):
+    '''Generator yielding the position and raw header block of each
+    message in a Eudora folder, using the body offsets recorded in its
+    :class:`~eulcommon.binfile.eudora.Toc`.
+
+    :param toc: the :class:`~eulcommon.binfile.eudora.Toc` for the folder
+    :param data_path: path to the folder data file
+    '''
+    table = toc.messages
+    if not len(table):
+        return
+    with open(data_path, 'rb') as fobj:
+        if os.fstat(fobj.fileno()).st_size == 0:
+            return
+        mm = mmap(fobj.fileno(), 0, prot=1)
+    try:
+        offsets = table.column('offset')
+        sizes = table.column('size')
+        body_offsets = table.column('body_offset')
+        for i in range(len(table)):
+            start, size = offsets[i], sizes[i]
+            if 0 < body_offsets[i] <= size:
+                yield i, mm[start:start + body_offsets[i]]
+            else:
+                yield i, mm[start:start + min(size, MAX_HEADER_SIZE)]
+    finally:
+        mm.close()
+
+
+def _thread(headers, group_by_subject):
+    threader = Threader(group_by_subject)
+    for number, data in headers:
+        threader.add_headers(number, data)
+    return threader.threads()
+
+
+def thread_macfolder(folder, group_by_subject=True):
+    '''Thread the messages in an
+    :class:`~eulcommon.binfile.outlookexpress.MacFolder`, reading only
+    their headers. Messages are numbered by their position in the folder;
+    deleted messages are skipped.
+
+    :rtype: :class:`Threads`
+    '''
+    return _thread(macfolder_headers(folder), group_by_subject)
+
+
+def thread_eudora(toc_path, data_path=None, group_by_subject=True):
+    '''Thread the messages in a Eudora folder, reading only their
+    headers. Messages are numbered by their position in the ``.toc``
+    file.
+
+    :param toc_path: path to the ``.toc`` file
+    :param data_path: path to the folder data file; defaults to the
+        ``.toc`` path without its extension
+    :rtype: :class:`Threads`
+    '''
+    if data_path is None:
+        data_path = os.path.splitext(toc_path)[0]
+    return _thread(eudora_headers(Toc(toc_path), data_path), group_by_subject)
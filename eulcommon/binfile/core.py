@@ -55,19 +55,46 @@ advantages over :mod:`struct`, though:
 This package exports the following names:
  * :class:`~eulcommon.binfile.BinaryStructure` -- a base class for binary data
    structures
+ * :class:`~eulcommon.binfile.RecordTable` -- a sequence of fixed-length
+   :class:`~eulcommon.binfile.BinaryStructure` records stored back to back
  * :class:`~eulcommon.binfile.ByteField` -- a field that maps fixed-length
    binary data to Python strings
  * :class:`~eulcommon.binfile.LengthPrependedStringField` -- a field that maps
    variable-length binary strings to Python strings
  * :class:`~eulcommon.binfile.IntegerField` -- a field that maps fixed-length
    binary data to Python numbers
+ * :class:`~eulcommon.binfile.EnumField` -- a field that maps fixed-length
+   binary codes to named values
+ * :class:`~eulcommon.binfile.FlagField` -- a field that maps bits in
+   fixed-length binary data to named flags
+ * :class:`~eulcommon.binfile.StringChainField` -- a field that maps a
+   sequence of variable-length strings packed back to back
+ * :class:`~eulcommon.binfile.ChainItemField` -- a field that maps a single
+   string from a :class:`~eulcommon.binfile.StringChainField`
+ * :class:`~eulcommon.binfile.RegionReader` -- a read-only file-like object
+   over a range of bytes in a mapped file
+ * :func:`~eulcommon.binfile.cached_field` -- remember a field's decoded
+   value on each structure instance
+
+Fields can also pack values back into binary data, for building test
+fixtures or writing corrected copies of index files. See
+:meth:`~eulcommon.binfile.BinaryStructure.pack` and
+:func:`~eulcommon.binfile.pack_table`.
 '''
 # see eulcommon/binfile/__init__.py for more docs
 
+from array import array
+import io
 from mmap import mmap
+import numbers
+import struct
+import sys
 
-__all__ = [ 'BinaryStructure', 'ByteField', 'LengthPrependedStringField',
-            'IntegerField' ]
+__all__ = [ 'BinaryStructure', 'RecordTable', 'ByteField',
+            'LengthPrependedStringField', 'IntegerField', 'EnumField',
+            'FlagField', 'StringChainField',
+            'ChainItemField', 'StringChain', 'RegionReader', 'pack_table',
+            'cached_field' ]
 
 class BinaryStructure(object):
     """A superclass for binary data structures superimposed over files.
@@ -86,10 +113,20 @@ class BinaryStructure(object):
     `fobj`.
 
     :param fobj: a file object or filename to overlay
-    :param mm: a :class:`~mmap.mmap` object to overlay
+    :param mm: a :class:`~mmap.mmap` object to overlay, or another
+      read-only object that supports indexing, slicing, :func:`len` and
+      ``find`` in the same way (e.g., a window onto an archive member from
+      :meth:`eulcommon.binfile.archives.Archive.map`)
     :param offset: the offset into the file where the structured data begins
+
+    ``BinaryStructure`` declares its own attributes in ``__slots__``.
+    Subclasses have a per-instance ``__dict__`` as usual unless they also
+    declare ``__slots__``, which is worthwhile for small record
+    structures created in large numbers.
     """
 
+    __slots__ = ('mmap', '_offset', '_values', '__weakref__')
+
     def __init__(self, fobj=None, mm=None, offset=0):
         if mm is not None:
             self.mmap = mm
@@ -98,6 +135,226 @@ class BinaryStructure(object):
                 fobj = open(fobj)
             self.mmap = mmap(fobj.fileno(), 0, prot=1) # read-only for now
         self._offset = offset
+        self._values = None
+
+    @classmethod
+    def pack_into(cls, buf, pos, values):
+        """Pack field values into a writable buffer (e.g., a
+        :class:`bytearray` or a writable :class:`~mmap.mmap`) for a
+        structure starting at offset `pos`. `values` is a dictionary
+        mapping names of fields of this class to values; bytes not covered
+        by the named fields are left unchanged. Overlapping fields should
+        not both be given."""
+        for name, value in values.items():
+            field = getattr(cls, name, None)
+            pack = getattr(field, 'pack', None)
+            if pack is None:
+                raise TypeError('%s is not a packable field of %s' %
+                                (name, cls.__name__))
+            pack(buf, pos, value)
+
+    @classmethod
+    def pack(cls, **values):
+        """Return the binary data for a new structure of this class's
+        ``LENGTH`` with the given field values; all other bytes are
+        zero::
+
+            >>> Message.pack(offset=0, size=1732, subject='Welcome')
+        """
+        buf = bytearray(cls.LENGTH)
+        cls.pack_into(buf, 0, values)
+        return bytes(buf)
+
+    def serialize(self, **changes):
+        """Return the ``LENGTH`` bytes of binary data for this structure,
+        with any field values given as keywords packed in place of the
+        original values. The underlying file is not modified."""
+        buf = bytearray(self.mmap[self._offset:self._offset + self.LENGTH])
+        self.pack_into(buf, 0, changes)
+        return bytes(buf)
+
+
+class RecordTable(object):
+    """A sequence of fixed-length :class:`BinaryStructure` records stored
+    back to back in a mapped file, such as the message entries following
+    the header of an email folder index.
+
+    A ``RecordTable`` supports :func:`len`, iteration, and indexing by
+    position; records are created only as they are accessed. Slicing
+    returns a ``RecordTable`` over the selected records.
+
+    :param record_class: the :class:`BinaryStructure` subclass for each
+      record; its ``LENGTH`` attribute is the record size unless `length` is
+      specified
+    :param mm: the :class:`~mmap.mmap` containing the records
+    :param offset: the offset into `mm` of the first record
+    :param count: the number of records; defaults to as many complete
+      records as fit between `offset` and the end of `mm`. Records that
+      would extend past the end of `mm` are never included.
+    :param length: the size of each record, if not ``record_class.LENGTH``
+    """
+
+    def __init__(self, record_class, mm, offset=0, count=None, length=None):
+        self.record_class = record_class
+        self.mmap = mm
+        self.offset = offset
+        self.length = length or record_class.LENGTH
+        available = max(0, (len(mm) - offset) // self.length)
+        self.count = available if count is None else max(0, min(count, available))
+
+    @property
+    def end(self):
+        """the offset into the map one past the last record"""
+        return self.offset + self.count * self.length
+
+    def record_offset(self, index):
+        """the offset into the map of the record at position `index`"""
+        return self.offset + index * self.length
+
+    def data(self, start=0, stop=None):
+        """the raw bytes of the records from position `start` up to (but
+        not including) position `stop`"""
+        if stop is None or stop > self.count:
+            stop = self.count
+        return self.mmap[self.record_offset(start):self.record_offset(stop)]
+
+    def column(self, name, start=0, stop=None):
+        """Decode a single field for every record from position `start` up
+        to (but not including) position `stop`, all at once. `name` is the
+        name of a field on the record class that supports bulk decoding
+        (:class:`ByteField` and its subclasses, and
+        :class:`LengthPrependedStringField`). This is much faster than
+        accessing the field on each record in turn::
+
+            >>> toc.messages.column('size')
+            [1732, 2339]
+        """
+        field = getattr(self.record_class, name)
+        return field.column(self, start, stop)
+
+    def where(self, **conditions):
+        """Return a :class:`~eulcommon.binfile.query.TableQuery` over the
+        records matching the given conditions::
+
+            >>> big = toc.messages.where(size__gt=1024, to__contains='Somebody')
+            >>> [msg['subject'] for msg in big.order_by('-size').fields('subject')]
+        """
+        from eulcommon.binfile.query import TableQuery
+        return TableQuery(self).where(**conditions)
+
+    def order_by(self, *names):
+        """Return a :class:`~eulcommon.binfile.query.TableQuery` over all
+        records, sorted by the given fields."""
+        from eulcommon.binfile.query import TableQuery
+        return TableQuery(self).order_by(*names)
+
+    def fields(self, *names):
+        """Return a :class:`~eulcommon.binfile.query.TableQuery` over all
+        records, yielding a dictionary of the given field values for
+        each."""
+        from eulcommon.binfile.query import TableQuery
+        return TableQuery(self).fields(*names)
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self.record_class(mm=self.mmap, offset=self.record_offset(i))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.count)
+            if step != 1:
+                raise ValueError('RecordTable slices do not support steps')
+            return RecordTable(self.record_class, self.mmap,
+                               self.record_offset(start),
+                               max(0, stop - start), self.length)
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError('record index out of range')
+        return self.record_class(mm=self.mmap, offset=self.record_offset(index))
+
+
+def _write(buf, pos, data):
+    # write data into a buffer without ever resizing it
+    if pos < 0 or pos + len(data) > len(buf):
+        raise ValueError('%d bytes at offset %d do not fit in a %d byte buffer' %
+                         (len(data), pos, len(buf)))
+    buf[pos:pos + len(data)] = data
+
+
+def _pack_each(field, buf, offset, length, values):
+    # pack a column of values one record at a time
+    for i, value in enumerate(values):
+        field.pack(buf, offset + i * length, value)
+
+
+def _write_column(buf, offset, length, start, width, data):
+    # write width-byte values, concatenated in data, into the records at
+    # offset in buf, all at once with strided slice assignment
+    count = len(data) // width
+    end = offset + count * length
+    if count and end - length + start + width > len(buf):
+        raise ValueError('%d records at offset %d do not fit in a %d byte buffer'
+                         % (count, offset, len(buf)))
+    for i in range(width):
+        buf[offset + start + i:end:length] = data[i::width]
+
+
+def _value_cache(obj):
+    # the dictionary of values remembered on a structure instance, keyed
+    # on field; discarded whenever the instance's map is replaced
+    values = getattr(obj, '_values', None)
+    if values is None or values[0] is not obj.mmap:
+        values = (obj.mmap, {})
+        obj._values = values
+    return values[1]
+
+
+class _CachedValue(object):
+    # mixin for fields that remember their decoded value; see cached_field
+
+    def __get__(self, obj, owner):
+        if obj is None:
+            return self
+
+        values = _value_cache(obj)
+        try:
+            return values[self]
+        except KeyError:
+            value = super(_CachedValue, self).__get__(obj, owner)
+            values[self] = value
+            return value
+
+
+_cached_classes = {}
+
+
+def cached_field(field):
+    """Return a copy of `field` that decodes its value only once per
+    structure instance, for fields that are read many times (e.g., in
+    templates). The value is remembered on the instance until its
+    ``mmap`` is replaced; use this only for data that is not modified
+    while it is mapped. The copy is an instance of a subclass of the
+    field's own class, so it still supports bulk decoding and packing::
+
+        class Message(BinaryStructure):
+            subject = cached_field(LengthPrependedStringField(142))
+
+    Values are stored in a slot on :class:`BinaryStructure`, so caching
+    works for subclasses that declare ``__slots__``.
+    """
+    cls = type(field)
+    if issubclass(cls, _CachedValue):
+        return field
+    if cls not in _cached_classes:
+        _cached_classes[cls] = type('Cached' + cls.__name__,
+                                    (_CachedValue, cls), {})
+    copy = object.__new__(_cached_classes[cls])
+    copy.__dict__.update(field.__dict__)
+    return copy
 
 
 class ByteField(object):
@@ -135,6 +392,34 @@ class ByteField(object):
 
         return obj.mmap[self.start + obj._offset : self.end + obj._offset]
 
+    def column(self, table, start=0, stop=None):
+        """Return the value of this field for the records of a
+        :class:`RecordTable` from position `start` up to (but not
+        including) position `stop`, as a list."""
+        data = table.data(start, stop)
+        if self.end - self.start == 1:
+            return list(data[self.start::table.length])
+        return [data[offset + self.start:offset + self.end]
+                for offset in range(0, len(data), table.length)]
+
+    def _padded(self, value):
+        width = self.end - self.start
+        if len(value) > width:
+            raise ValueError('%r is longer than %d bytes' % (value, width))
+        return value + b'\0' * (width - len(value))
+
+    def pack(self, buf, offset, value):
+        """Write `value` into `buf` for a structure starting at `offset`.
+        Values shorter than the field are padded with NUL bytes."""
+        _write(buf, offset + self.start, self._padded(value))
+
+    def pack_column(self, buf, offset, length, values):
+        """Write a value for each of a sequence of `length`-byte records
+        starting at `offset` in `buf`, all at once."""
+        data = b''.join(self._padded(value) for value in values)
+        _write_column(buf, offset, length, self.start,
+                      self.end - self.start, data)
+
 
 class LengthPrependedStringField(object):
     """A field mapping variable-length binary strings to Python strings.
@@ -172,6 +457,29 @@ class LengthPrependedStringField(object):
         data_offset = length_offset + 1
         return obj.mmap[data_offset:data_offset + length]
 
+    def column(self, table, start=0, stop=None):
+        """Return the value of this field for the records of a
+        :class:`RecordTable` from position `start` up to (but not
+        including) position `stop`, as a list, reading the records from
+        the map all at once."""
+        data = table.data(start, stop)
+        lengths = bytearray(data[self.offset::table.length])
+        begin = self.offset + 1
+        return [data[pos + begin:pos + begin + length] for pos, length
+                in zip(range(0, len(data), table.length), lengths)]
+
+    def pack(self, buf, offset, value):
+        """Write `value`, prepended with its length, into `buf` for a
+        structure starting at `offset`."""
+        if len(value) > 255:
+            raise ValueError('%r is longer than 255 bytes' % (value,))
+        _write(buf, offset + self.offset, struct.pack('B', len(value)) + value)
+
+    def pack_column(self, buf, offset, length, values):
+        """Write a value for each of a sequence of `length`-byte records
+        starting at `offset` in `buf`."""
+        _pack_each(self, buf, offset, length, values)
+
 
 class IntegerField(ByteField):
     """A field mapping fixed-length binary data to Python numbers.
@@ -212,12 +520,649 @@ class IntegerField(ByteField):
         # this number field, and then interpret those bytes as a number.
 
         byte_data = ByteField.__get__(self, obj, owner)
+        return self._from_bytes(byte_data)
+
+    @staticmethod
+    def _from_bytes(byte_data):
         val = 0
         # we only support big-endian for now. big-endian integers are sort
         # of like base-256 numbers. in base 10 to get from 432 to 4326 we
         # multiply by 10 and add 6. so in base 256 we multiply by 256 and
         # add our next byte.
-        for byte in byte_data:
+        for byte in bytearray(byte_data):
             val *= 256
-            val += ord(byte)
+            val += byte
         return val
+
+    def column(self, table, start=0, stop=None):
+        """Return the value of this field for the records of a
+        :class:`RecordTable` from position `start` up to (but not
+        including) position `stop`. All of the values are decoded at once
+        rather than one record at a time; the result is a sequence of
+        integers (an :class:`array.array` or :class:`bytearray`)."""
+        return _integer_column(table.data(start, stop), self.start, self.end,
+                               table.length)
+
+    def _to_bytes(self, value):
+        width = self.end - self.start
+        if not 0 <= value < 256 ** width:
+            raise ValueError('%r does not fit in %d unsigned bytes' %
+                             (value, width))
+        data = bytearray(width)
+        for i in range(width - 1, -1, -1):
+            data[i] = value & 0xff
+            value >>= 8
+        return bytes(data)
+
+    def pack(self, buf, offset, value):
+        """Write the integer `value` into `buf` for a structure starting at
+        `offset`."""
+        _write(buf, offset + self.start, self._to_bytes(value))
+
+    def pack_column(self, buf, offset, length, values):
+        """Write a value for each of a sequence of `length`-byte records
+        starting at `offset` in `buf`. Values are encoded all at once with
+        :mod:`array` where possible."""
+        _write_column(buf, offset, length, self.start, self.end - self.start,
+                      _integer_bytes(values, self.end - self.start))
+
+
+def _array_typecode(width):
+    # array typecode for unsigned integers of the given size, or None
+    for code in ('B', 'H', 'I', 'L', 'Q'):
+        try:
+            if array(code).itemsize == width:
+                return code
+        except ValueError:
+            pass  # 'Q' is not available in python 2
+    return None
+
+
+def _integer_column(data, start, end, length):
+    # decode the big-endian unsigned integer at bytes start to end of
+    # each length-byte record in data, all at once
+    width = end - start
+    count = len(data) // length
+    if width == 1:
+        return bytearray(data[start::length])
+    # pad odd sizes (e.g., 3-byte integers) out to a size array supports
+    size = width
+    typecode = _array_typecode(size)
+    while typecode is None and size < 8:
+        size += 1
+        typecode = _array_typecode(size)
+    if typecode is None:
+        return [IntegerField._from_bytes(data[offset + start:offset + end])
+                for offset in range(0, count * length, length)]
+    # interleave the bytes of each integer into a contiguous buffer and
+    # decode them with array
+    buf = bytearray(count * size)
+    pad = size - width
+    for i in range(width):
+        buf[pad + i::size] = data[start + i::length][:count]
+    values = array(typecode, bytes(buf))
+    if sys.byteorder == 'little':
+        values.byteswap()
+    return values
+
+
+def _integer_bytes(values, width):
+    # encode a sequence of integers as concatenated width-byte big-endian
+    # unsigned integers
+    size = width
+    typecode = _array_typecode(size)
+    while typecode is None and size < 8:
+        size += 1
+        typecode = _array_typecode(size)
+    if typecode is None:
+        field = IntegerField(0, width)
+        return b''.join(field._to_bytes(value) for value in values)
+    try:
+        encoded = array(typecode, values)
+    except OverflowError:
+        raise ValueError('values do not fit in %d unsigned bytes' % width)
+    if encoded and size > width and max(encoded) >= 256 ** width:
+        raise ValueError('values do not fit in %d unsigned bytes' % width)
+    if sys.byteorder == 'little':
+        encoded.byteswap()
+    data = encoded.tobytes() if hasattr(encoded, 'tobytes') \
+        else encoded.tostring()
+    if size == width:
+        return data
+    # drop the padding bytes from the front of each integer
+    trimmed = bytearray(len(encoded) * width)
+    for i in range(width):
+        trimmed[i::width] = data[size - width + i::size]
+    return bytes(trimmed)
+
+
+def _value_counts(table, field, start=0, stop=None):
+    # dictionary of occurrence counts of the integer values of field in
+    # the records of table
+    data = table.data(start, stop)
+    counts = {}
+    if field.end - field.start == 1:
+        # count each distinct byte directly in the column
+        column = data[field.start::table.length]
+        for value in set(column):
+            counts[ord(value) if not isinstance(value, int) else value] = \
+                column.count(value)
+    else:
+        for value in _integer_column(data, field.start, field.end,
+                                     table.length):
+            counts[value] = counts.get(value, 0) + 1
+    return counts
+
+
+def _code(value, width):
+    # enumeration and flag codes may be given as integers or as the
+    # literal bytes found in the file
+    if isinstance(value, numbers.Integral):
+        return value
+    if len(value) != width:
+        raise ValueError('code %r is not %d bytes long' % (value, width))
+    if not isinstance(value, bytes):
+        # text literals (e.g. magic numbers) under python 3
+        value = value.encode('latin-1')
+    return IntegerField._from_bytes(value)
+
+
+class EnumField(IntegerField):
+    """A field mapping fixed-length binary codes to named values.
+
+    :param start: The offset into the structure of the beginning of the
+      code.
+    :param end: The offset into the structure of the end of the code.
+    :param values: A dictionary mapping codes to names. Codes may be given
+      either as integers (interpreted as by :class:`IntegerField`) or as
+      the literal bytes stored in the file.
+
+    Typical users will create an ``EnumField`` inside a
+    :class:`BinaryStructure` subclass definition::
+
+        class MyObject(BinaryStructure):
+            color = EnumField(0, 1, {0: 'red', 1: 'green', 2: 'blue'})
+
+    When you instantiate the subclass and access the field, its value will
+    be the name for the code at that location, or the integer code itself
+    if it has no name. So with a file whose first byte is ``'\\x01'``::
+
+        >>> o = MyObject('file.bin')
+        >>> o.color
+        'green'
+
+    Values for a whole :class:`RecordTable` can be decoded at once with
+    :meth:`column`, and tallied without decoding each record with
+    :meth:`counts`::
+
+        >>> MyObject.color.counts(table)
+        {'red': 1042, 'blue': 17}
+    """
+
+    def __init__(self, start, end, values):
+        super(EnumField, self).__init__(start, end)
+        self.values = dict((_code(code, end - start), name)
+                           for code, name in values.items())
+
+    def __get__(self, obj, owner):
+        if obj is None:
+            return self
+
+        value = IntegerField.__get__(self, obj, owner)
+        return self.values.get(value, value)
+
+    def column(self, table, start=0, stop=None):
+        """Return the names for this field for the records of a
+        :class:`RecordTable` from position `start` up to (but not
+        including) position `stop`, as a list."""
+        codes = IntegerField.column(self, table, start, stop)
+        if self.end - self.start == 1:
+            # translate through a lookup table of all possible bytes
+            names = [self.values.get(code, code) for code in range(256)]
+            return [names[code] for code in codes]
+        return [self.values.get(code, code) for code in codes]
+
+    def counts(self, table, start=0, stop=None):
+        """Return a dictionary of the number of records with each value
+        of this field in a :class:`RecordTable`, keyed on name."""
+        counts = {}
+        for code, count in _value_counts(table, self, start, stop).items():
+            name = self.values.get(code, code)
+            counts[name] = counts.get(name, 0) + count
+        return counts
+
+    def _code(self, value):
+        for code, name in self.values.items():
+            if name == value:
+                return code
+        if isinstance(value, numbers.Integral):
+            return value
+        raise ValueError('%r is not a value of this field' % (value,))
+
+    def pack(self, buf, offset, value):
+        """Write the code for `value` (a name or an integer code) into
+        `buf` for a structure starting at `offset`."""
+        IntegerField.pack(self, buf, offset, self._code(value))
+
+    def pack_column(self, buf, offset, length, values):
+        """Write a value (a name or an integer code) for each of a sequence
+        of `length`-byte records starting at `offset` in `buf`."""
+        codes = {}
+        for code, name in self.values.items():
+            codes.setdefault(name, code)
+        IntegerField.pack_column(self, buf, offset, length,
+            [codes[value] if value in codes else self._code(value)
+             for value in values])
+
+
+class FlagField(IntegerField):
+    """A field mapping bits in fixed-length binary data to named flags.
+
+    :param start: The offset into the structure of the beginning of the
+      flag data.
+    :param end: The offset into the structure of the end of the flag data.
+    :param flags: A dictionary mapping flag names to bit masks (as
+      integers, interpreted as by :class:`IntegerField`).
+
+    Typical users will create a ``FlagField`` inside a
+    :class:`BinaryStructure` subclass definition::
+
+        class MyObject(BinaryStructure):
+            options = FlagField(0, 1, {'bold': 0x01, 'italic': 0x02})
+
+    When you instantiate the subclass and access the field, its value will
+    be a :class:`frozenset` of the names of the flags that are set. So with
+    a file whose first byte is ``'\\x03'``::
+
+        >>> o = MyObject('file.bin')
+        >>> sorted(o.options)
+        ['bold', 'italic']
+
+    Flags for a whole :class:`RecordTable` can be tallied at once with
+    :meth:`counts`.
+    """
+
+    def __init__(self, start, end, flags):
+        super(FlagField, self).__init__(start, end)
+        self.flags = dict(flags)
+
+    def _names(self, value):
+        return frozenset(name for name, mask in self.flags.items()
+                         if value & mask == mask)
+
+    def __get__(self, obj, owner):
+        if obj is None:
+            return self
+
+        return self._names(IntegerField.__get__(self, obj, owner))
+
+    def column(self, table, start=0, stop=None):
+        """Return the set flags for the records of a :class:`RecordTable`
+        from position `start` up to (but not including) position `stop`,
+        as a list of :class:`frozenset`."""
+        cache = {}
+        result = []
+        for value in IntegerField.column(self, table, start, stop):
+            names = cache.get(value)
+            if names is None:
+                names = cache[value] = self._names(value)
+            result.append(names)
+        return result
+
+    def counts(self, table, start=0, stop=None):
+        """Return a dictionary of the number of records in a
+        :class:`RecordTable` with each flag set, keyed on flag name."""
+        counts = dict((name, 0) for name in self.flags)
+        for value, count in _value_counts(table, self, start, stop).items():
+            for name in self._names(value):
+                counts[name] += count
+        return counts
+
+    def _value(self, flags):
+        if isinstance(flags, numbers.Integral):
+            return flags
+        value = 0
+        for name in flags:
+            value |= self.flags[name]
+        return value
+
+    def pack(self, buf, offset, value):
+        """Write flags into `buf` for a structure starting at `offset`.
+        `value` may be a collection of flag names or an integer."""
+        IntegerField.pack(self, buf, offset, self._value(value))
+
+    def pack_column(self, buf, offset, length, values):
+        """Write flags for each of a sequence of `length`-byte records
+        starting at `offset` in `buf`."""
+        IntegerField.pack_column(self, buf, offset, length,
+                                 [self._value(value) for value in values])
+
+
+class StringChain(object):
+    """The value of a :class:`StringChainField`: a sequence of
+    variable-length strings stored back to back in an
+    :class:`~mmap.mmap`, where the location of each string depends on the
+    lengths of the strings before it.
+
+    Strings are located only as they are requested, and their locations
+    are remembered, so after a string has been accessed once, it and all of
+    the strings before it can be accessed again without rescanning.
+    """
+
+    def __init__(self, mm, offset, count=None, terminator=None):
+        self.mmap = mm
+        self.offset = offset
+        self.count = count
+        self.terminator = terminator
+        self._spans = []  # (data start, data end) of resolved strings
+        self._next = offset  # offset of the first unresolved string
+
+    def _resolve(self, index):
+        # locate strings up to and including index; returns False if the
+        # chain ends first
+        mm = self.mmap
+        while len(self._spans) <= index:
+            if self.count is not None and len(self._spans) >= self.count:
+                return False
+            start = self._next
+            if start >= len(mm):
+                return False
+            if self.terminator is not None:
+                end = mm.find(self.terminator, start)
+                if end == -1:
+                    end = len(mm)
+                self._next = min(end + len(self.terminator), len(mm))
+            else:
+                start += 1
+                end = min(start + ord(mm[start - 1]), len(mm))
+                self._next = end
+            self._spans.append((start, end))
+        return True
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if index < 0 or not self._resolve(index):
+            raise IndexError('string chain index out of range')
+        start, end = self._spans[index]
+        return self.mmap[start:end]
+
+    def __len__(self):
+        if self.count is not None:
+            self._resolve(self.count - 1)
+        else:
+            while self._resolve(len(self._spans)):
+                pass
+        return len(self._spans)
+
+    def __iter__(self):
+        i = 0
+        while self._resolve(i):
+            yield self[i]
+            i += 1
+
+    @property
+    def end(self):
+        """the offset into the map immediately after the last string in
+        the chain"""
+        len(self)
+        return self._next
+
+
+class StringChainField(object):
+    """A field mapping a sequence of variable-length binary strings packed
+    back to back, such that the offset of each string depends on the
+    strings before it.
+
+    Each string is either length-prepended, as in
+    :class:`LengthPrependedStringField`, or ends with a `terminator`.
+
+    :param offset: The offset of the first string in the chain.
+    :param count: The number of strings in the chain. If not specified,
+      the chain continues to the end of the mapped data.
+    :param terminator: The bytes marking the end of each string, e.g.
+      ``'\\0'``. If not specified, each string is encoded with its length
+      in its first byte.
+
+    Accessing the field returns a :class:`StringChain` sequence. The chain
+    is created once per structure instance, so string offsets resolved by
+    one access are reused by later ones. Use :meth:`item` to map
+    individual strings in the chain to their own attributes::
+
+        class MyObject(BinaryStructure):
+            names = StringChainField(0, count=2, terminator='\\0')
+            first = names.item(0)
+            last = names.item(1)
+
+    With a file whose first bytes are ``'Ada\\0Lovelace\\0'``::
+
+        >>> o = MyObject('file.bin')
+        >>> list(o.names)
+        ['Ada', 'Lovelace']
+        >>> o.last
+        'Lovelace'
+    """
+
+    def __init__(self, offset, count=None, terminator=None):
+        self.offset = offset
+        self.count = count
+        self.terminator = terminator
+
+    def __get__(self, obj, owner):
+        if obj is None:
+            return self
+
+        # the resolved chain is kept in the instance's value cache
+        values = _value_cache(obj)
+        chain = values.get(self)
+        if chain is None:
+            chain = StringChain(obj.mmap, self.offset + obj._offset,
+                                self.count, self.terminator)
+            values[self] = chain
+        return chain
+
+    def item(self, index):
+        """Return a :class:`ChainItemField` for the string at position
+        `index` in this chain."""
+        return ChainItemField(self, index)
+
+    def pack(self, buf, offset, values):
+        """Write a sequence of strings into `buf` for a structure starting
+        at `offset`."""
+        pos = offset + self.offset
+        for value in values:
+            if self.terminator is not None:
+                data = value + self.terminator
+            elif len(value) > 255:
+                raise ValueError('%r is longer than 255 bytes' % (value,))
+            else:
+                data = struct.pack('B', len(value)) + value
+            _write(buf, pos, data)
+            pos += len(data)
+
+    def pack_column(self, buf, offset, length, values):
+        """Write a sequence of strings for each of a sequence of
+        `length`-byte records starting at `offset` in `buf`."""
+        _pack_each(self, buf, offset, length, values)
+
+
+class ChainItemField(object):
+    """A field mapping a single string in a :class:`StringChainField`.
+    Typically created with :meth:`StringChainField.item`. Returns None if
+    the chain ends before the requested string.
+
+    :param chain: the :class:`StringChainField` containing the string
+    :param index: the position of the string in the chain
+    """
+
+    def __init__(self, chain, index):
+        self.chain = chain
+        self.index = index
+
+    def __get__(self, obj, owner):
+        if obj is None:
+            return self
+
+        try:
+            return self.chain.__get__(obj, owner)[self.index]
+        except IndexError:
+            return None
+
+
+class RegionReader(io.RawIOBase):
+    """A read-only, seekable file-like object over a range of bytes in an
+    :class:`~mmap.mmap`.
+
+    Reads are served directly from the mapped file, so large regions (e.g.,
+    a single email message inside a multi-gigabyte mail file) can be
+    consumed a chunk at a time without ever holding the whole region in
+    memory. Positions reported by :meth:`tell` and accepted by :meth:`seek`
+    are relative to the start of the region.
+
+    :param mm: the :class:`~mmap.mmap` to read from
+    :param start: the offset into `mm` where the region begins
+    :param end: the offset into `mm` one past the last byte of the region
+
+    Typical users will get a ``RegionReader`` from a
+    :class:`BinaryStructure` subclass rather than creating one directly,
+    and may wrap it in an :class:`io.BufferedReader` for line-oriented
+    access::
+
+        >>> reader = RegionReader(obj.mmap, 4, 8)
+        >>> reader.read()
+        '\\x04\\x05\\x06\\x07'
+    """
+
+    def __init__(self, mm, start, end):
+        super(RegionReader, self).__init__()
+        self.mmap = mm
+        self.start = start
+        self.end = max(start, min(end, len(mm)))
+        self._pos = self.start
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def _check_open(self):
+        if self.closed:
+            raise ValueError('I/O operation on closed file')
+
+    def __len__(self):
+        return self.end - self.start
+
+    def tell(self):
+        self._check_open()
+        return self._pos - self.start
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        self._check_open()
+        if whence == io.SEEK_SET:
+            pos = self.start + offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = self.end + offset
+        else:
+            raise ValueError('invalid whence (%r)' % (whence,))
+        if pos < self.start:
+            raise ValueError('negative seek position %d' % (pos - self.start,))
+        self._pos = pos
+        return self._pos - self.start
+
+    def read(self, size=-1):
+        # overridden so that reads slice the map directly instead of
+        # copying through a temporary buffer in readinto
+        self._check_open()
+        if size is None or size < 0:
+            size = self.end - self._pos
+        size = max(0, min(size, self.end - self._pos))
+        data = self.mmap[self._pos:self._pos + size]
+        self._pos += size
+        return data
+
+    def readall(self):
+        return self.read()
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+
+def pack_table(record_class, rows=None, columns=None, count=None, length=None,
+               buf=None, offset=0):
+    """Pack a whole table of fixed-length records at once, into a single
+    preallocated buffer.
+
+    Values may be given either as `rows`, an iterable of dictionaries
+    mapping field names to values for each record, or as `columns`, a
+    dictionary mapping field names to sequences of values with one value
+    per record. Columns are packed a field at a time rather than a record
+    at a time, which is much faster for integer and fixed-length fields.
+    Both may be given, in which case row values are packed last. Rows
+    with no length (e.g., a generator) are counted as they are packed,
+    and a new buffer grows to hold them.
+
+    :param record_class: the :class:`BinaryStructure` subclass of each
+      record
+    :param rows: an iterable of dictionaries of field values
+    :param columns: a dictionary of sequences of field values
+    :param count: the number of records; required only if it can't be
+      determined from the length of `rows` or `columns`
+    :param length: the size of each record, if not ``record_class.LENGTH``
+    :param buf: a writable buffer to pack into; by default a new
+      :class:`bytearray` of the required size is returned
+    :param offset: the offset in `buf` of the first record
+    :returns: the buffer
+
+    For example, to build a Eudora index file with a million messages::
+
+        header = Toc.pack(version=1, name='Big')
+        table = pack_table(Message, columns={
+            'offset': range(0, 1000000000, 1000),
+            'size': [1000] * 1000000,
+        })
+        with open('Big.toc', 'wb') as toc:
+            toc.write(header)
+            toc.write(table)
+    """
+    length = length or record_class.LENGTH
+    counting = False
+    if count is None:
+        if columns:
+            count = len(next(iter(columns.values())))
+        elif rows is None:
+            count = 0
+        elif hasattr(rows, '__len__'):
+            count = len(rows)
+        else:
+            # count the rows while packing them, growing a new buffer
+            counting = True
+            count = 0
+    grow = counting and buf is None
+    if buf is None:
+        buf = bytearray(offset + count * length)
+
+    for name, values in (columns or {}).items():
+        if len(values) != count:
+            raise ValueError('column %s has %d values, not %d' %
+                             (name, len(values), count))
+        field = getattr(record_class, name, None)
+        if getattr(field, 'pack_column', None) is None:
+            raise TypeError('%s is not a packable field of %s' %
+                            (name, record_class.__name__))
+        field.pack_column(buf, offset, length, values)
+
+    for i, row in enumerate(rows or ()):
+        if grow:
+            buf.extend(bytearray(length))
+        elif counting:
+            if offset + (i + 1) * length > len(buf):
+                raise ValueError('more rows than fit in the buffer')
+        elif i >= count:
+            raise ValueError('more than %d rows' % count)
+        record_class.pack_into(buf, offset + i * length, row)
+    return buf
@@ -0,0 +1,284 @@
+# file eulcommon/binfile/correspondents.py
+#
+#   Copyright 2012 Emory University Libraries
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+'''Build an index of who wrote to whom, and how often, across a
+collection of mail folders.
+
+The index is built from the header fields that mail clients cache in
+their folder index files, so no message data is read or parsed: the
+sender and recipient strings in the summary block of an Outlook Express
+:class:`~eulcommon.binfile.outlookexpress.MacIndex`, and the
+correspondent, status and date of each
+:class:`~eulcommon.binfile.eudora.Message` in a Eudora ``.toc`` file::
+
+    >>> from eulcommon.binfile import correspondents
+    >>> index = correspondents.CorrespondentIndex()
+    >>> correspondents.add_macfolder(index, '/path/to/oe/Inbox')
+    >>> correspondents.add_eudora(index, '/path/to/eudora/In.toc',
+    ...                           owner='donor@example.edu',
+    ...                           outgoing=[9])
+    >>> with open('edges.tsv', 'w') as out:
+    ...     index.write_edges(out)
+
+Addresses are normalized (see :func:`normalize_address`) and interned to
+integer ids, and the message count and date range of each
+sender-recipient pair are kept in :mod:`array` columns indexed by an
+integer edge id. Memory use therefore grows with the number of distinct
+correspondents and pairs, not with the number of messages, and edges are
+written out one at a time.
+
+This module exports the following names:
+ * :class:`CorrespondentIndex` -- sender-recipient edge counts and date
+   ranges
+ * :func:`normalize_address` -- a comparable form of a single address
+ * :func:`split_addresses` -- normalized addresses in a header value
+ * :func:`add_macfolder` -- add an Outlook Express folder to an index
+ * :func:`add_eudora` -- add a Eudora folder to an index
+'''
+
+from array import array
+from email.utils import getaddresses
+import os
+import re
+import time
+
+from eulcommon.binfile import dates
+from eulcommon.binfile.eudora import Toc
+from eulcommon.binfile.outlookexpress import MacIndex
+
+__all__ = ['CorrespondentIndex', 'normalize_address', 'split_addresses',
+           'add_macfolder', 'add_eudora']
+
+_SPACE = re.compile(r'\s+')
+_UNKNOWN_FIRST = float('inf')
+_UNKNOWN_LAST = float('-inf')
+_EDGE_SHIFT = 32
+
+# normalizing a header value is much slower than looking it up, and the
+# same few values recur across a folder; keep a bounded number of them
+_SPLIT_CACHE_SIZE = 65536
+_split_cache = {}
+
+
+def _normalize(value):
+    return _SPACE.sub(' ', value.replace('"', '')).strip().lower()
+
+
+def _split(value):
+    if not value:
+        # empty, or None for a field missing from a truncated index
+        return []
+    # a value with no address part at all, as Eudora often caches, is a
+    # single display name; the address parser would split it into words
+    if '@' not in value:
+        name = _normalize(value)
+        return [name] if name else []
+    return [_normalize(addr if '@' in addr else name or addr)
+            for name, addr in getaddresses([value])]
+
+
+def normalize_address(address):
+    '''Return a comparable form of a single address: the lowercased
+    address part if there is one (``"Somebody" <Somebody@Example.com>``
+    becomes ``somebody@example.com``), otherwise the lowercased display
+    name with runs of whitespace collapsed. Returns None for an empty
+    address, or None.'''
+    for address in _split(address):
+        return address or None
+    return None
+
+
+def split_addresses(value):
+    '''Return a tuple of the normalized addresses in a header value that
+    may list several, such as a ``To`` header. Returns an empty tuple for
+    None, as read from a truncated index file.'''
+    result = _split_cache.get(value)
+    if result is None:
+        result = []
+        for address in _split(value):
+            if address and address not in result:
+                result.append(address)
+        result = tuple(result)
+        if len(_split_cache) >= _SPLIT_CACHE_SIZE:
+            _split_cache.clear()
+        _split_cache[value] = result
+    return result
+
+
+def _format_date(timestamp):
+    if timestamp in (_UNKNOWN_FIRST, _UNKNOWN_LAST):
+        return ''
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(timestamp))
+
+
+class CorrespondentIndex(object):
+    '''Counts of the messages sent from each correspondent to each other,
+    with the dates of the first and last of them.
+
+    Correspondents are identified by integer ids, assigned in the order
+    their normalized addresses are first seen.'''
+
+    def __init__(self):
+        self.addresses = []
+        'normalized addresses of the correspondents, indexed by id'
+        self._ids = {}
+        self._edges = {}                # sender << 32 | recipient -> edge
+        self._senders = array('l')      # columns indexed by edge
+        self._recipients = array('l')
+        self._counts = array('l')
+        self._first = array('d')
+        self._last = array('d')
+        self.messages = 0
+        'number of messages added'
+
+    def __len__(self):
+        'number of distinct sender-recipient pairs'
+        return len(self._counts)
+
+    def intern(self, address):
+        '''Return the id for a normalized address, assigning one if it
+        has not been seen before.'''
+        id = self._ids.get(address)
+        if id is None:
+            id = self._ids[address] = len(self.addresses)
+            self.addresses.append(address)
+        return id
+
+    def add(self, sender, recipients, date=None):
+        '''Record a message.
+
+        :param sender: the ``From`` header value
+        :param recipients: a header value listing recipients (e.g.,
+            ``To``), or a list of them
+        :param date: time the message was sent, in seconds since the
+            epoch, or None if it is not known
+        '''
+        if isinstance(recipients, (list, tuple)):
+            recipients = ', '.join(value for value in recipients if value)
+        senders = split_addresses(sender)
+        if not senders:
+            return
+        self.add_ids(self.intern(senders[0]),
+                     [self.intern(address)
+                      for address in split_addresses(recipients)], date)
+
+    def add_ids(self, sender, recipients, date=None):
+        '''Record a message between correspondents already interned with
+        :meth:`intern`; arguments are as for :meth:`add`, except that
+        `recipients` is a sequence of ids.'''
+        self.messages += 1
+        edges = self._edges
+        for recipient in recipients:
+            key = sender << _EDGE_SHIFT | recipient
+            edge = edges.get(key)
+            if edge is None:
+                edge = edges[key] = len(self._counts)
+                self._senders.append(sender)
+                self._recipients.append(recipient)
+                self._counts.append(0)
+                self._first.append(_UNKNOWN_FIRST)
+                self._last.append(_UNKNOWN_LAST)
+            self._counts[edge] += 1
+            if date is not None:
+                if date < self._first[edge]:
+                    self._first[edge] = date
+                if date > self._last[edge]:
+                    self._last[edge] = date
+
+    def count(self, sender, recipient):
+        '''Number of messages from one normalized address to another.'''
+        ids = self._ids
+        if sender not in ids or recipient not in ids:
+            return 0
+        edge = self._edges.get(ids[sender] << _EDGE_SHIFT | ids[recipient])
+        return 0 if edge is None else self._counts[edge]
+
+    def edges(self):
+        '''Generator yielding ``(sender, recipient, count, first, last)``
+        for each pair of correspondents, in the order the pairs were
+        first seen. `first` and `last` are the earliest and latest message
+        dates, in seconds since the epoch, or None if no message between
+        the pair had a known date.'''
+        addresses = self.addresses
+        for edge in range(len(self._counts)):
+            first, last = self._first[edge], self._last[edge]
+            yield (addresses[self._senders[edge]],
+                   addresses[self._recipients[edge]], self._counts[edge],
+                   None if first == _UNKNOWN_FIRST else int(first),
+                   None if last == _UNKNOWN_LAST else int(last))
+
+    def write_edges(self, out, delimiter='\t'):
+        '''Write the edges to a file object as delimited text, one line
+        per pair of correspondents after a header line. Dates are written
+        as UTC ISO 8601 timestamps, or left empty if not known.'''
+        out.write(delimiter.join(['sender', 'recipient', 'count',
+                                  'first', 'last']) + '\n')
+        addresses = self.addresses
+        for edge in range(len(self._counts)):
+            out.write(delimiter.join([
+                addresses[self._senders[edge]],
+                addresses[self._recipients[edge]],
+                str(self._counts[edge]),
+                _format_date(self._first[edge]),
+                _format_date(self._last[edge])]) + '\n')
+
+
+def add_macfolder(index, folder_path):
+    '''Add the messages of an Outlook Express 4.5 for Mac folder to a
+    :class:`CorrespondentIndex`, using the sender and recipient strings
+    in the summary block of its ``Index`` file. The summaries include no
+    dates. Summaries cut short by a truncated index file are added as far
+    as they go, and those with no sender are skipped. Returns the number
+    of messages added.'''
+    before = index.messages
+    for summary in MacIndex(os.path.join(folder_path, 'Index')).summaries:
+        index.add(summary.sender, summary.to)
+    return index.messages - before
+
+
+def add_eudora(index, toc_path, owner, outgoing):
+    '''Add the messages of a Eudora folder to a
+    :class:`CorrespondentIndex`, using the fields cached in its ``.toc``
+    file. Returns the number of messages added.
+
+    A Eudora ``.toc`` file caches a single correspondent for each
+    message: the recipient of messages the mailbox owner wrote, and
+    otherwise the sender. The other side of each message is the mailbox
+    owner. Which status codes mark the messages the owner wrote has not
+    been established for every version of Eudora, so they must be given;
+    a wrong guess would reverse the direction of every edge.
+
+    :param owner: address of the mailbox owner
+    :param outgoing: the integer
+        :attr:`~eulcommon.binfile.eudora.Message.status` codes of
+        messages written by the mailbox owner
+    '''
+    before = index.messages
+    owners = split_addresses(owner)
+    if not owners:
+        raise ValueError('no owner address in %r' % (owner,))
+    outgoing = frozenset(outgoing)
+    owner_id = index.intern(owners[0])
+    for msg in Toc(toc_path).messages:
+        others = [index.intern(address) for address in split_addresses(msg.to)]
+        if not others:
+            continue
+        date = dates.default_parser.parse(msg.date)
+        if bytearray(msg.status)[0] in outgoing:
+            index.add_ids(owner_id, others, date)
+        else:
+            index.add_ids(others[0], [owner_id], date)
+    return index.messages - before
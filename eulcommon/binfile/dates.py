@@ -0,0 +1,212 @@
+# file eulcommon/binfile/dates.py
+#
+#   Copyright 2012 Emory University Libraries
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+'''Parse the free-form date strings cached in mail folder indexes, a
+whole record table at a time, and summarize them as timelines.
+
+Date header values such as :attr:`eulcommon.binfile.eudora.Message.date`
+are parsed into seconds since the epoch (UTC) by a :class:`DateParser`,
+with the same results as :func:`email.utils.parsedate_tz`. The parser
+remembers the strings it has already seen, and also the day, month, year
+and time zone part of each, so that only the time of day is parsed for
+further messages sent on the same day. :func:`parse_column` parses the
+dates of every record in a :class:`~eulcommon.binfile.RecordTable` in
+one call, and the resulting column can be used to sort or page through a
+folder by date, or counted into a :class:`Timeline`::
+
+    >>> from eulcommon.binfile import dates, eudora
+    >>> toc = eudora.Toc('/path/to/In.toc')
+    >>> times = dates.parse_column(toc.messages)
+    >>> first_page = dates.date_order(times)[:25]
+    >>> timeline = dates.Timeline()
+    >>> timeline.add(times)
+    >>> timeline.counts('year')
+    [('1996', 172), ('1997', 311)]
+
+Unparseable and missing dates are represented in columns by
+:data:`UNKNOWN`.
+
+This module exports the following names:
+ * :class:`DateParser` -- parses date strings with memoization
+ * :func:`parse_column` -- parse the dates of a whole record table
+ * :func:`date_order` -- record positions sorted by date
+ * :class:`Timeline` -- counts of dates by year, month or day
+ * :data:`UNKNOWN` -- the column value of a date that could not be parsed
+'''
+
+from array import array
+import calendar
+from datetime import date
+from email.utils import mktime_tz, parsedate_tz
+
+__all__ = ['DateParser', 'parse_column', 'date_order', 'Timeline',
+           'UNKNOWN', 'default_parser']
+
+UNKNOWN = -2 ** 62
+'''the value in a date column for a date that is missing or could not
+be parsed'''
+
+# seconds since the epoch don't fit a 32-bit long after 2038
+_TIME_TYPE = 'l' if array('l').itemsize >= 8 else 'd'
+
+_DAY = 86400
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+class DateParser(object):
+    '''Parses date header values into seconds since the epoch, UTC.
+
+    :param max_entries: number of distinct date strings to remember;
+        when full, all remembered strings are forgotten
+    '''
+
+    def __init__(self, max_entries=65536):
+        self.max_entries = max_entries
+        self._values = {}   # date string -> seconds or None
+        self._days = {}     # date string at midnight -> seconds or None
+
+    def parse(self, value):
+        '''Return the time given by a date string, in seconds since the
+        epoch, or None if it cannot be parsed.'''
+        try:
+            return self._values[value]
+        except KeyError:
+            pass
+        result = self._parse(value) if value else None
+        if len(self._values) >= self.max_entries:
+            self._values.clear()
+        self._values[value] = result
+        return result
+
+    def _parse(self, value):
+        # most of a date string (day, month, year and zone) is shared by
+        # every message sent the same day; parse that once, and add the
+        # time of day
+        tokens = value.split()
+        for position, token in enumerate(tokens):
+            if ':' in token:
+                clock = token.split(':')
+                if 2 <= len(clock) <= 3 and '' not in clock and \
+                   token.replace(':', '').isdigit():
+                    break
+                return _parse_email_date(value)
+        else:
+            return _parse_email_date(value)
+        tokens[position] = '00:00'
+        day = ' '.join(tokens)
+        midnight = self._days.get(day, False)
+        if midnight is False:
+            midnight = _parse_email_date(day)
+            if len(self._days) >= self.max_entries:
+                self._days.clear()
+            self._days[day] = midnight
+        if midnight is None:
+            return None
+        seconds = int(clock[0]) * 3600 + int(clock[1]) * 60
+        if len(clock) == 3:
+            seconds += int(clock[2])
+        return midnight + seconds
+
+
+def _parse_email_date(value):
+    try:
+        parsed = parsedate_tz(value)
+        if parsed is None:
+            return None
+        if parsed[9] is None:
+            return calendar.timegm(parsed[:9])
+        return mktime_tz(parsed)
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
+default_parser = DateParser()
+'''a :class:`DateParser` shared by the whole process'''
+
+
+def parse_column(table, name='date', parser=None, start=0, stop=None):
+    '''Parse a date field for every record of a
+    :class:`~eulcommon.binfile.RecordTable` from position `start` up to
+    (but not including) position `stop`.
+
+    :param name: name of the record field holding date strings
+    :param parser: the :class:`DateParser` to use; defaults to
+        :data:`default_parser`
+    :returns: an :class:`array.array` of seconds since the epoch, with
+        :data:`UNKNOWN` for dates that could not be parsed
+    '''
+    parse = (parser or default_parser).parse
+    times = array(_TIME_TYPE)
+    for value in table.column(name, start, stop):
+        result = parse(value)
+        times.append(UNKNOWN if result is None else result)
+    return times
+
+
+def date_order(times, reverse=False):
+    '''Return the positions of a date column (as from
+    :func:`parse_column`) sorted by date, as an :class:`array.array`.
+    Records with the same date keep their original order, and records
+    with unknown dates come last in either direction.'''
+    sign = -1 if reverse else 1
+    keys = [-UNKNOWN if time == UNKNOWN else sign * time for time in times]
+    return array('l', sorted(range(len(keys)), key=keys.__getitem__))
+
+
+class Timeline(object):
+    '''Counts of dates by day, reported by year, month or day. Add the
+    date columns of several folders to build a timeline of a whole
+    collection.'''
+
+    def __init__(self):
+        self._days = {}  # days since the epoch -> count
+        self.unknown = 0
+        'number of unknown dates added'
+
+    def __len__(self):
+        'number of known dates added'
+        return sum(self._days.values())
+
+    def add(self, times):
+        '''Count the dates in a column of seconds since the epoch, as from
+        :func:`parse_column`.'''
+        days = self._days
+        for time in times:
+            if time == UNKNOWN:
+                self.unknown += 1
+            else:
+                day = int(time // _DAY)
+                days[day] = days.get(day, 0) + 1
+
+    def update(self, other):
+        '''Add the counts of another :class:`Timeline`.'''
+        for day, count in other._days.items():
+            self._days[day] = self._days.get(day, 0) + count
+        self.unknown += other.unknown
+
+    def counts(self, unit='month'):
+        '''Return a sorted list of ``(period, count)`` for each period with
+        at least one date, where `unit` is ``'year'``, ``'month'`` or
+        ``'day'`` and periods are labeled ``'1996'``, ``'1996-06'`` or
+        ``'1996-06-16'`` respectively.'''
+        width = {'year': 4, 'month': 7, 'day': 10}.get(unit)
+        if width is None:
+            raise ValueError('unknown timeline unit %r' % (unit,))
+        periods = {}
+        for day, count in self._days.items():
+            label = date.fromordinal(day + _EPOCH_ORDINAL).isoformat()[:width]
+            periods[label] = periods.get(label, 0) + count
+        return sorted(periods.items())
@@ -65,6 +65,19 @@ This module exports the following names:
 
 from eulcommon import binfile
 
+STATUS_NAMES = {
+    2: 'read',
+}
+'''names for :attr:`Message.status` codes. Only codes verified against
+sample folders are named; other codes are left as numbers.'''
+
+PRIORITY_NAMES = {
+    0: 'unset',
+}
+'''names for :attr:`Message.priority` codes. Only codes verified against
+sample folders are named; other codes are left as numbers.'''
+
+
 class Toc(binfile.BinaryStructure):
     '''A :class:`~eulcommon.binfile.BinaryStructure` for an email folder index
     header.
@@ -83,17 +96,33 @@ class Toc(binfile.BinaryStructure):
 
     @property
     def messages(self):
-        '''a generator yielding the :class:`Message` structures in the index'''
+        '''a :class:`~eulcommon.binfile.RecordTable` of the :class:`Message`
+        structures in the index'''
 
         # the file contains the fixed-size file header followed by
         # fixed-size message structures. start after the file header and
         # then simply return the message structures in sequence until the
         # end of the file.
+        return binfile.RecordTable(Message, self.mmap, self.LENGTH)
 
-        offset = self.LENGTH
-        while offset < len(self.mmap):
-            yield Message(mm=self.mmap, offset=offset)
-            offset += Message.LENGTH
+    def aiter_messages(self, reader=None):
+        '''Asynchronous iterator over the :class:`Message` structures in
+        the index, for use with ``async for`` in :mod:`asyncio` code; see
+        :meth:`eulcommon.binfile.aio.AsyncMailReader.records`.
+
+        :param reader: the :class:`~eulcommon.binfile.aio.AsyncMailReader`
+            used to read the index; defaults to
+            :func:`eulcommon.binfile.aio.default_reader`
+        '''
+        from eulcommon.binfile import aio
+        if reader is None:
+            reader = aio.default_reader()
+        return reader.records(self.messages)
+
+    def status_counts(self):
+        '''a dictionary of the number of messages in the index with each
+        :attr:`Message.status_name`, computed for all messages at once'''
+        return Message.status_name.counts(self.messages)
 
 
 class Message(binfile.BinaryStructure):
@@ -104,6 +133,8 @@ class Message(binfile.BinaryStructure):
     interesting data but have not yet been reverse-engineered.
     '''
 
+    __slots__ = ()
+
     LENGTH = 220
     '''the size of a single message header'''
 
@@ -115,14 +146,20 @@ class Message(binfile.BinaryStructure):
     '''the offset of the body within the raw email data'''
     status = binfile.ByteField(12, 13)
     '''some kind of unspecified single-byte status field'''
-    date = binfile.LengthPrependedStringField(13)
+    status_name = binfile.EnumField(12, 13, STATUS_NAMES)
+    '''the :attr:`status` field as a name from :data:`STATUS_NAMES`
+    (e.g., ``'read'``), or the numeric code if it is not recognized'''
+    date = binfile.cached_field(binfile.LengthPrependedStringField(13))
     '''a date value copied from email headers'''
     # bytes 14-61 not reverse-engineered
     priority = binfile.ByteField(62, 63)
     '''some kind of unspecified single-byte priority field'''
+    priority_name = binfile.EnumField(62, 63, PRIORITY_NAMES)
+    '''the :attr:`priority` field as a name from :data:`PRIORITY_NAMES`,
+    or the numeric code if it is not recognized'''
     # bytes 63-77 not reverse-engineered
-    to = binfile.LengthPrependedStringField(78)
+    to = binfile.cached_field(binfile.LengthPrependedStringField(78))
     '''a recipient copied from email headers'''
     # bytes 79-141 not reverse-engieered
-    subject = binfile.LengthPrependedStringField(142)
+    subject = binfile.cached_field(binfile.LengthPrependedStringField(142))
     '''the email subject copied from email headers'''
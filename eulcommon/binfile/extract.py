@@ -0,0 +1,402 @@
+# file eulcommon/binfile/extract.py
+#
+#   Copyright 2012 Emory University Libraries
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+'''Extract every message in a tree of Outlook Express and Eudora folders
+to individual files, in a way that can be interrupted and resumed.
+
+This module provides the ``eulcommon-extract-mail`` command::
+
+    $ eulcommon-extract-mail /mnt/accession-42 /data/extracted/42 -j 8
+
+Folders are found with :func:`eulcommon.binfile.triage.scan`, and the
+messages of each folder are split into batches which are extracted by a
+pool of worker processes. Each message is written to
+``<output>/<folder>/<position>.eml``, where ``<folder>`` is the folder's
+path relative to the source directory (without the ``.toc`` extension for
+Eudora folders) and ``<position>`` is the message's position in the folder
+index. Messages are written to a temporary name and renamed when
+complete, so an interrupted run never leaves partial message files.
+
+After each batch is extracted, a line recording it is appended to a
+journal file in the output directory (``.extract-journal``) and flushed
+to disk. Running the same command again skips every batch in the journal
+and extracts only the rest, so a run can be interrupted at any point and
+resumed where it stopped. Progress, throughput and the estimated time
+remaining are reported as batches complete.
+
+Deleted Outlook Express messages are skipped unless
+``--include-deleted`` is given. Message data is written as stored in the
+folder data file, without any conversion.
+
+This module exports the following names:
+ * :class:`BatchExtractor` -- resumable extraction of a folder tree
+ * :class:`Journal` -- the record of completed batches
+ * :func:`find_folders` -- the mail folders in a directory tree
+ * :func:`folder_name` -- the name of a folder relative to its tree
+ * :func:`main` -- the ``eulcommon-extract-mail`` command
+'''
+
+import argparse
+from mmap import mmap
+from multiprocessing import Pool
+import os
+import sys
+import time
+
+from eulcommon.binfile import triage
+from eulcommon.binfile.eudora import Toc
+from eulcommon.binfile.outlookexpress import MacFolder
+
+__all__ = ['BatchExtractor', 'Journal', 'find_folders', 'folder_name', 'main',
+           'JOURNAL_NAME', 'OUTLOOK_EXPRESS', 'EUDORA']
+
+JOURNAL_NAME = '.extract-journal'
+'''name of the journal file in the output directory'''
+
+OUTLOOK_EXPRESS = 'oe'
+'folder kind for Outlook Express 4.5 for Mac folders'
+EUDORA = 'eudora'
+'folder kind for Eudora folders'
+
+DEFAULT_BATCH_SIZE = 500
+'''default number of messages extracted by a worker at a time'''
+
+
+def find_folders(top):
+    '''Return a sorted list of ``(kind, path)`` for the mail folders in a
+    directory tree, where `kind` is :data:`OUTLOOK_EXPRESS` (and `path` is
+    the folder directory) or :data:`EUDORA` (and `path` is the ``.toc``
+    file).'''
+    folders = set()
+    for result in triage.scan(top):
+        if result.format == triage.OE_INDEX:
+            folders.add((OUTLOOK_EXPRESS, os.path.dirname(result.path)))
+        elif result.format == triage.EUDORA_TOC:
+            folders.add((EUDORA, result.path))
+    return sorted(folders)
+
+
+def folder_name(kind, path, top):
+    '''Return the name of a folder found by :func:`find_folders`: its path
+    relative to `top`, without the ``.toc`` extension of a Eudora index
+    (``Eudora/In`` for ``Eudora/In.toc``). Messages are extracted to a
+    directory of this name, and manifests identify folders by it.'''
+    name = os.path.relpath(path, top)
+    if kind == EUDORA:
+        name = os.path.splitext(name)[0]
+    return name
+
+
+def _message_count(kind, path):
+    if kind == OUTLOOK_EXPRESS:
+        folder = MacFolder(path)
+        return len(folder.index.messages) if folder.data else 0
+    if not os.path.exists(os.path.splitext(path)[0]):
+        # no data file; nothing to extract
+        return 0
+    return len(Toc(path).messages)
+
+
+class Journal(object):
+    '''An append-only record of the batches completed by a
+    :class:`BatchExtractor`, one tab-separated line per batch: folder,
+    first and last message positions (the last exclusive), number of
+    messages written, and bytes written. The first line records the batch
+    size, since batches are only comparable between runs that use the
+    same size.
+
+    :param path: path to the journal file
+    :param batch_size: batch size for a new journal; an existing journal
+        keeps the batch size it was started with
+    '''
+
+    def __init__(self, path, batch_size=DEFAULT_BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+        self.done = set()
+        'set of ``(folder, start, stop)`` for the completed batches'
+        self.messages = 0
+        'number of messages written by the completed batches'
+        self.bytes = 0
+        'number of bytes written by the completed batches'
+        if os.path.exists(path):
+            self._read()
+        self._file = open(path, 'a')
+        if not os.path.getsize(path):
+            self._write('batch_size\t%d' % self.batch_size)
+
+    def _read(self):
+        complete = 0  # size of the complete lines
+        with open(self.path, 'rb') as journal:
+            for line in journal:
+                if not line.endswith(b'\n'):
+                    # a partly written last line; the batch is redone
+                    break
+                complete += len(line)
+                if bytes is not str:
+                    line = line.decode('utf-8')
+                fields = line.rstrip('\n').split('\t')
+                if fields[0] == 'batch_size':
+                    self.batch_size = int(fields[1])
+                elif fields[0] == 'done' and len(fields) == 6:
+                    self.done.add((fields[1], int(fields[2]), int(fields[3])))
+                    self.messages += int(fields[4])
+                    self.bytes += int(fields[5])
+        if complete < os.path.getsize(self.path):
+            with open(self.path, 'r+b') as journal:
+                journal.truncate(complete)
+
+    def _write(self, line):
+        self._file.write(line + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def __contains__(self, batch):
+        return batch in self.done
+
+    def record(self, folder, start, stop, messages, size):
+        '''Record a completed batch, flushing the journal to disk.'''
+        self._write('done\t%s\t%d\t%d\t%d\t%d' % (folder, start, stop,
+                                                  messages, size))
+        self.done.add((folder, start, stop))
+        self.messages += messages
+        self.bytes += size
+
+    def close(self):
+        self._file.close()
+
+
+# per-process state for extraction workers: the most recently opened
+# folder, since consecutive batches usually come from the same folder
+_open_folder = (None, None)
+
+
+def _folder_reader(kind, path):
+    global _open_folder
+    if _open_folder[0] != (kind, path):
+        _open_folder = ((kind, path), None)
+        if kind == OUTLOOK_EXPRESS:
+            folder = MacFolder(path)
+            _open_folder = ((kind, path), folder)
+        else:
+            with open(os.path.splitext(path)[0], 'rb') as fobj:
+                size = os.fstat(fobj.fileno()).st_size
+                data = mmap(fobj.fileno(), 0, prot=1) if size else b''
+            _open_folder = ((kind, path), (Toc(path), data))
+    return _open_folder[1]
+
+
+def _write_message(path, data):
+    partial = path + '.partial'
+    with open(partial, 'wb') as out:
+        out.write(data)
+    os.rename(partial, path)
+
+
+def _extract_batch(job):
+    kind, path, name, output_dir, start, stop, include_deleted = job
+    reader = _folder_reader(kind, path)
+    if not os.path.isdir(output_dir):
+        try:
+            os.makedirs(output_dir)
+        except OSError:
+            if not os.path.isdir(output_dir):
+                raise
+    messages = size = 0
+    if kind == OUTLOOK_EXPRESS:
+        table = reader.index.messages
+        offsets = table.column('offset', start, stop)
+        sizes = table.column('size', start, stop)
+        for i, (offset, length) in enumerate(zip(offsets, sizes)):
+            raw_msg = reader.data.get_message(offset, length)
+            if raw_msg.deleted and not include_deleted:
+                continue
+            data = raw_msg.data
+            _write_message(os.path.join(output_dir, '%d.eml' % (start + i)),
+                           data)
+            messages += 1
+            size += len(data)
+    else:
+        toc, mm = reader
+        table = toc.messages
+        offsets = table.column('offset', start, stop)
+        sizes = table.column('size', start, stop)
+        for i, (offset, length) in enumerate(zip(offsets, sizes)):
+            data = mm[offset:offset + length]
+            _write_message(os.path.join(output_dir, '%d.eml' % (start + i)),
+                           data)
+            messages += 1
+            size += len(data)
+    return job, messages, size
+
+
+def _duration(seconds):
+    seconds = int(seconds)
+    return '%d:%02d:%02d' % (seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+class BatchExtractor(object):
+    '''Extracts the messages of every mail folder under a directory to
+    files, recording progress in a :class:`Journal` so that an
+    interrupted extraction can be resumed.
+
+    :param source: directory containing mail folders
+    :param output_dir: directory to write messages and the journal to
+    :param processes: number of worker processes; 0 extracts in the
+        current process
+    :param batch_size: number of messages extracted by a worker at a time
+    :param include_deleted: if True, also extract deleted Outlook Express
+        messages
+    :param progress: file object for progress reports, or None for no
+        reports
+    :param report_interval: minimum number of seconds between progress
+        reports
+    '''
+
+    def __init__(self, source, output_dir, processes=None,
+                 batch_size=DEFAULT_BATCH_SIZE, include_deleted=False,
+                 progress=None, report_interval=5):
+        self.source = source
+        self.output_dir = output_dir
+        self.processes = processes
+        self.batch_size = batch_size
+        self.include_deleted = include_deleted
+        self.progress = progress
+        self.report_interval = report_interval
+
+    def batches(self, journal):
+        '''Return the jobs for the batches not yet in the journal, and the
+        total number of messages in all folders.'''
+        jobs = []
+        total = 0
+        for kind, path in find_folders(self.source):
+            name = folder_name(kind, path, self.source)
+            count = _message_count(kind, path)
+            total += count
+            output_dir = os.path.join(self.output_dir, name)
+            for start in range(0, count, journal.batch_size):
+                stop = min(start + journal.batch_size, count)
+                if (name, start, stop) not in journal:
+                    jobs.append((kind, path, name, output_dir, start, stop,
+                                 self.include_deleted))
+        return jobs, total
+
+    def run(self):
+        '''Extract every batch not already recorded in the journal,
+        returning the :class:`Journal`.'''
+        if not os.path.isdir(self.output_dir):
+            os.makedirs(self.output_dir)
+        journal = Journal(os.path.join(self.output_dir, JOURNAL_NAME),
+                          self.batch_size)
+        try:
+            jobs, total = self.batches(journal)
+            remaining = sum(job[5] - job[4] for job in jobs)
+            self._report_start(total, remaining)
+            if self.processes == 0:
+                results = (_extract_batch(job) for job in jobs)
+                self._record(journal, results, remaining)
+            else:
+                pool = Pool(self.processes)
+                try:
+                    self._record(journal,
+                                 pool.imap_unordered(_extract_batch, jobs),
+                                 remaining)
+                    pool.close()
+                finally:
+                    pool.terminate()
+        finally:
+            journal.close()
+        return journal
+
+    def _record(self, journal, results, remaining):
+        started = last_report = time.time()
+        processed = written = size = 0
+        for job, messages, batch_size in results:
+            name, start, stop = job[2], job[4], job[5]
+            journal.record(name, start, stop, messages, batch_size)
+            processed += stop - start
+            written += messages
+            size += batch_size
+            now = time.time()
+            if now - last_report >= self.report_interval or \
+               processed == remaining:
+                last_report = now
+                self._report(processed, remaining, written, size,
+                             now - started)
+
+    def _report_start(self, total, remaining):
+        if self.progress is not None:
+            self.progress.write('%d messages in folders, %d to extract\n' %
+                                (total, remaining))
+            self.progress.flush()
+
+    def _report(self, processed, remaining, written, size, elapsed):
+        if self.progress is None:
+            return
+        rate = processed / elapsed if elapsed > 0 else 0
+        eta = _duration((remaining - processed) / rate) if rate else '?'
+        self.progress.write(
+            '%d/%d messages (%.1f%%), %.1f msg/s, %.2f MB/s, '
+            '%d written, ETA %s\n' % (
+                processed, remaining, 100.0 * processed / remaining, rate,
+                size / elapsed / 1048576 if elapsed > 0 else 0, written,
+                eta))
+        self.progress.flush()
+
+
+def main(argv=None):
+    '''Run the ``eulcommon-extract-mail`` command with the given
+    arguments (by default, the command line). Returns the exit status.'''
+    parser = argparse.ArgumentParser(
+        prog='eulcommon-extract-mail',
+        description='Extract every message in a tree of Outlook Express '
+        'and Eudora mail folders to files. An interrupted extraction is '
+        'resumed by running the same command again.')
+    parser.add_argument('source', help='directory containing mail folders')
+    parser.add_argument('output', help='directory to extract messages to')
+    parser.add_argument('-j', '--processes', type=int, default=None,
+                        help='number of worker processes (default: number '
+                        'of CPUs)')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help='messages per checkpointed batch (default: '
+                        '%(default)s); ignored when resuming')
+    parser.add_argument('--include-deleted', action='store_true',
+                        help='also extract deleted Outlook Express messages')
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help='do not report progress')
+    args = parser.parse_args(argv)
+    if not os.path.isdir(args.source):
+        parser.error('%s is not a directory' % args.source)
+    if args.batch_size < 1:
+        parser.error('batch size must be positive')
+
+    extractor = BatchExtractor(
+        args.source, args.output, processes=args.processes,
+        batch_size=args.batch_size, include_deleted=args.include_deleted,
+        progress=None if args.quiet else sys.stderr)
+    try:
+        journal = extractor.run()
+    except KeyboardInterrupt:
+        sys.stderr.write('interrupted; run again to resume\n')
+        return 130
+    if not args.quiet:
+        sys.stderr.write('%d messages (%d bytes) extracted in total\n' %
+                         (journal.messages, journal.bytes))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,277 @@
+# file eulcommon/binfile/fixity.py
+#
+#   Copyright 2012 Emory University Libraries
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+'''Compute fixity checksums for mail folder files and the messages
+stored in them.
+
+Each file or byte range is read from a memory map exactly once, with every
+chunk fed to all of the requested :mod:`hashlib` algorithms in turn, so
+recording MD5, SHA-1 and SHA-256 costs one pass over the data instead of
+three. :mod:`hashlib` releases the global interpreter lock while hashing
+large buffers, so ranges are checksummed concurrently in a pool of
+threads.
+
+Checksums can be computed for whole files (e.g., an Outlook Express
+``Index`` or ``Mail`` file, or a Eudora ``.toc``) and for the individual
+messages inside a data file, as located by
+:class:`~eulcommon.binfile.outlookexpress.MacIndexMessage` or
+:class:`~eulcommon.binfile.eudora.Message` offsets and sizes.
+
+This module exports the following names:
+ * :class:`Fixity` -- checksums for a single file or byte range
+ * :class:`FixityCalculator` -- computes :class:`Fixity` for files,
+   messages, and mail folders
+ * :func:`checksum_range` -- single-pass multi-algorithm checksum of part of
+   a memory map
+ * :func:`write_manifest` -- write :class:`Fixity` records as a
+   tab-separated manifest
+'''
+
+from collections import deque
+import hashlib
+from mmap import mmap
+from multiprocessing.pool import ThreadPool
+import os
+
+from eulcommon.binfile.eudora import Toc
+from eulcommon.binfile.outlookexpress import MacIndex
+
+__all__ = ['Fixity', 'FixityCalculator', 'checksum_range', 'write_manifest',
+           'DEFAULT_ALGORITHMS']
+
+DEFAULT_ALGORITHMS = ('md5', 'sha1', 'sha256')
+'''checksum algorithms calculated by default'''
+
+CHUNK_SIZE = 1024 * 1024
+'''number of bytes passed to the checksum algorithms at a time'''
+
+JOBS_PER_THREAD = 4
+'''number of checksum jobs queued per thread ahead of the results being
+read'''
+
+try:
+    buffer
+except NameError:
+    # python 3
+    def _window(mm, offset, size):
+        return memoryview(mm)[offset:offset + size]
+else:
+    def _window(mm, offset, size):
+        # buffer objects allow hashing part of a map without copying it
+        return buffer(mm, offset, size)
+
+
+def checksum_range(mm, offset=0, size=None, algorithms=DEFAULT_ALGORITHMS,
+                   chunk_size=CHUNK_SIZE):
+    '''Calculate checksums for a range of bytes in an
+    :class:`~mmap.mmap`, reading the data only once regardless of how
+    many algorithms are requested.
+
+    :param mm: the :class:`~mmap.mmap` to read from
+    :param offset: offset of the first byte to checksum
+    :param size: number of bytes to checksum; defaults to everything
+        from `offset` to the end of `mm`
+    :param algorithms: names of :mod:`hashlib` algorithms
+    :returns: dictionary of hex digests keyed on algorithm name
+    '''
+    hashes = [(algorithm, hashlib.new(algorithm)) for algorithm in algorithms]
+    end = len(mm) if size is None else min(offset + size, len(mm))
+    pos = offset
+    while pos < end:
+        chunk = _window(mm, pos, min(chunk_size, end - pos))
+        for _, digest in hashes:
+            digest.update(chunk)
+        pos += chunk_size
+    return dict((algorithm, digest.hexdigest()) for algorithm, digest in hashes)
+
+
+class Fixity(object):
+    '''Checksums for a single file, or for a message within a file.'''
+
+    def __init__(self, path, offset, size, checksums, message=None):
+        self.path = path
+        'path to the file'
+        self.offset = offset
+        'offset of the checksummed data within the file'
+        self.size = size
+        'number of bytes checksummed'
+        self.checksums = checksums
+        'dictionary of hex digests keyed on algorithm name'
+        self.message = message
+        '''position of the message within its folder, or None for a
+        whole file'''
+
+    def __repr__(self):
+        return '<Fixity %s [%d:%d]>' % (self.path, self.offset,
+                                        self.offset + self.size)
+
+
+def _map_file(path):
+    with open(path, 'rb') as fobj:
+        if os.fstat(fobj.fileno()).st_size == 0:
+            # empty files can't be mapped
+            return None
+        return mmap(fobj.fileno(), 0, prot=1)
+
+
+class FixityCalculator(object):
+    '''Calculate single-pass, multi-algorithm fixity information for
+    files and the messages within them, using a pool of threads.
+
+    Methods that compute more than one :class:`Fixity` return
+    generators, yielding results in order as they become available, so
+    they can be written to a manifest without being collected in memory.
+
+    :param algorithms: names of :mod:`hashlib` algorithms to calculate
+    :param threads: number of threads used to calculate checksums
+    :param chunk_size: number of bytes hashed at a time
+    '''
+
+    def __init__(self, algorithms=DEFAULT_ALGORITHMS, threads=4,
+                 chunk_size=CHUNK_SIZE):
+        self.algorithms = tuple(algorithms)
+        self.threads = threads
+        self.chunk_size = chunk_size
+
+    def _checksum(self, mm, offset, size):
+        if mm is None:
+            # nothing to read; checksums of empty data
+            return dict((algorithm, hashlib.new(algorithm).hexdigest())
+                        for algorithm in self.algorithms)
+        return checksum_range(mm, offset, size, self.algorithms,
+                              self.chunk_size)
+
+    def _run(self, func, jobs):
+        # run jobs in a thread pool, yielding results in input order as
+        # they complete. Only a few jobs per thread are queued at a time,
+        # so a long sequence of jobs is not read into memory all at once;
+        # and the pool is joined before returning (or closing early), so no
+        # thread is still reading a map when the caller closes it.
+        pool = ThreadPool(self.threads)
+        window = max(1, self.threads * JOBS_PER_THREAD)
+        pending = deque()
+        try:
+            for job in jobs:
+                pending.append(pool.apply_async(func, (job,)))
+                if len(pending) >= window:
+                    yield pending.popleft().get()
+            while pending:
+                yield pending.popleft().get()
+        finally:
+            pool.close()
+            pool.join()
+
+    def file_fixity(self, path):
+        '''Calculate :class:`Fixity` for an entire file.'''
+        mm = _map_file(path)
+        try:
+            size = len(mm) if mm is not None else 0
+            return Fixity(path, 0, size, self._checksum(mm, 0, size))
+        finally:
+            if mm is not None:
+                mm.close()
+
+    def files_fixity(self, paths):
+        '''Generator yielding :class:`Fixity` for each of a sequence of
+        files, checksummed concurrently.'''
+        return self._run(self.file_fixity, paths)
+
+    def messages_fixity(self, path, messages):
+        '''Generator yielding :class:`Fixity` for each message stored in
+        a data file.
+
+        :param path: path to the data file containing the messages, e.g.
+            an Outlook Express ``Mail`` file
+        :param messages: iterable of objects with ``offset`` and ``size``
+            attributes locating each message within the data file, such
+            as :class:`~eulcommon.binfile.outlookexpress.MacIndexMessage`
+            or :class:`~eulcommon.binfile.eudora.Message`
+        '''
+        mm = _map_file(path)
+
+        def message_fixity(job):
+            i, offset, size = job
+            return Fixity(path, offset, size,
+                          self._checksum(mm, offset, size), message=i)
+
+        jobs = ((i, msg.offset, msg.size) for i, msg in enumerate(messages))
+        results = self._run(message_fixity, jobs)
+        try:
+            for result in results:
+                yield result
+        finally:
+            # stop the pool and wait for its threads before unmapping
+            results.close()
+            if mm is not None:
+                mm.close()
+
+    def macfolder_fixity(self, folder_path):
+        '''Generator yielding :class:`Fixity` for the ``Index`` and
+        ``Mail`` files of an Outlook Express 4.5 for Mac folder, followed
+        by each message in the ``Mail`` file.'''
+        index_path = os.path.join(folder_path, 'Index')
+        mail_path = os.path.join(folder_path, 'Mail')
+        paths = [p for p in (index_path, mail_path) if os.path.exists(p)]
+        for result in self.files_fixity(paths):
+            yield result
+        if mail_path in paths:
+            index = MacIndex(index_path)
+            for result in self.messages_fixity(mail_path, index.messages):
+                yield result
+
+    def toc_fixity(self, toc_path, data_path=None):
+        '''Generator yielding :class:`Fixity` for a Eudora ``.toc``
+        file and its folder data file, followed by each message in the
+        data file.
+
+        :param toc_path: path to the ``.toc`` file
+        :param data_path: path to the folder data file; defaults to the
+            ``.toc`` path without its extension, if that file exists
+        '''
+        if data_path is None:
+            base, ext = os.path.splitext(toc_path)
+            if ext.lower() == '.toc' and os.path.exists(base):
+                data_path = base
+        paths = [toc_path] + ([data_path] if data_path else [])
+        for result in self.files_fixity(paths):
+            yield result
+        if data_path:
+            for result in self.messages_fixity(data_path, Toc(toc_path).messages):
+                yield result
+
+
+def write_manifest(records, fileobj, algorithms=DEFAULT_ALGORITHMS):
+    '''Write :class:`Fixity` records to a file object as a tab-separated
+    manifest, one line per record, with a header line naming the
+    columns: path, message, offset, size, and one column per checksum
+    algorithm.  Records are written as they are read, so a generator
+    from :class:`FixityCalculator` can be written without holding the
+    whole manifest in memory.
+
+    :returns: number of records written
+    '''
+    fileobj.write('\t'.join(('path', 'message', 'offset', 'size') +
+                            tuple(algorithms)) + '\n')
+    count = 0
+    for record in records:
+        row = [record.path,
+               '' if record.message is None else str(record.message),
+               str(record.offset), str(record.size)]
+        row.extend(record.checksums.get(algorithm, '')
+                   for algorithm in algorithms)
+        fileobj.write('\t'.join(row) + '\n')
+        count += 1
+    return count
@@ -0,0 +1,177 @@
+# file eulcommon/binfile/msgcache.py
+#
+#   Copyright 2012 Emory University Libraries
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+'''Cache parsed email messages and other values derived from them, such
+as rendered summaries, within a single process.
+
+Web views that display archived messages one at a time (e.g., by
+position in an Outlook Express folder) would otherwise parse a popular
+message with :meth:`~eulcommon.binfile.outlookexpress.MacMailMessage.as_email`
+on every request. A :class:`MessageCache` keeps recently used values in
+memory up to a total size budget, discarding the least recently used
+values first. Entries are keyed on the identity of the data file (device,
+inode, size and modification time) together with the offset and size of
+the message within it, so a file replaced on disk is never served from
+stale entries::
+
+    >>> from eulcommon.binfile import msgcache, outlookexpress
+    >>> folder = outlookexpress.MacFolder('/path/to/folder')
+    >>> msg = folder.get_email(3, cache=msgcache.message_cache)
+    >>> msgcache.message_cache.hits, msgcache.message_cache.misses
+    (0, 1)
+
+Caches are safe to share between threads. Cached values are shared by
+every caller that retrieves them, so they should be treated as
+read-only.
+
+This module exports the following names:
+ * :class:`MessageCache` -- a thread-safe, size-bounded LRU cache
+ * :func:`file_identity` -- identify the current version of a file
+ * :func:`message_key` -- build a cache key for a message
+ * :data:`message_cache` -- a shared cache for the current process
+'''
+
+from collections import OrderedDict
+import os
+import threading
+
+__all__ = ['MessageCache', 'file_identity', 'message_key', 'message_cache',
+           'DEFAULT_MAX_BYTES']
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+'''default size budget for a :class:`MessageCache`, in bytes'''
+
+EMAIL_SIZE_FACTOR = 3
+'''estimated memory used by a parsed :class:`email.message.Message`, as a
+multiple of the size of the raw message'''
+
+
+def file_identity(path):
+    '''Return a tuple identifying the current version of a file: its
+    device, inode, size and modification time.'''
+    info = os.stat(path)
+    return (info.st_dev, info.st_ino, info.st_size, info.st_mtime)
+
+
+def message_key(file_id, offset, size, kind='email'):
+    '''Return a cache key for a value derived from the message stored at
+    `offset` and `size` within the file identified by `file_id` (as from
+    :func:`file_identity`).  `kind` distinguishes different values for
+    the same message, e.g. ``'email'`` for a parsed message and
+    ``'summary'`` for rendered summary text.'''
+    return (file_id, offset, size, kind)
+
+
+def _estimate_size(value):
+    try:
+        return len(value)
+    except TypeError:
+        return 1
+
+
+class MessageCache(object):
+    '''A thread-safe cache of values that discards the least recently
+    used values when their total estimated size exceeds `max_bytes`.
+
+    :param max_bytes: size budget for all cached values, in bytes
+    '''
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        'number of lookups that found a cached value'
+        self.misses = 0
+        'number of lookups that did not find a cached value'
+        self.evictions = 0
+        'number of values discarded to stay within the size budget'
+        self.size = 0
+        'estimated total size of the cached values, in bytes'
+        self._entries = OrderedDict()  # key -> (value, size), oldest first
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        '''Return the cached value for `key`, or `default` if there is
+        none.  A found value becomes the most recently used.'''
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries[key] = entry
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, size=None):
+        '''Cache `value` for `key`, replacing any existing value.  `size`
+        is the estimated memory used by the value, in bytes; by default
+        the length of the value.  Values larger than the whole budget
+        are not cached.'''
+        if size is None:
+            size = _estimate_size(value)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.size -= evicted_size
+                self.evictions += 1
+
+    def get_or_set(self, key, create, size=None):
+        '''Return the cached value for `key`; if there is none, call
+        `create` with no arguments and cache and return its result.
+        `size` is as for :meth:`set`.
+
+        `create` is called without holding the cache lock, so that slow
+        parsing does not block other threads; two threads missing the
+        same key at once may both call it.'''
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = create()
+            self.set(key, value, size)
+        return value
+
+    def clear(self):
+        '''Discard all cached values and reset the counters.'''
+        with self._lock:
+            self._entries.clear()
+            self.size = self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        '''Return a dictionary of the cache counters: ``hits``,
+        ``misses``, ``evictions``, ``entries``, ``size`` and
+        ``max_bytes``.'''
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions,
+                    'entries': len(self._entries), 'size': self.size,
+                    'max_bytes': self.max_bytes}
+
+
+message_cache = MessageCache()
+'''a :class:`MessageCache` shared by the whole process, with the default
+size budget; set :attr:`~MessageCache.max_bytes` to change it'''
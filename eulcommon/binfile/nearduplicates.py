@@ -0,0 +1,312 @@
+# file eulcommon/binfile/nearduplicates.py
+#
+#   Copyright 2012 Emory University Libraries
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+'''Find messages whose bodies are nearly the same, such as forwarded or
+lightly edited copies, across mail folders.
+
+Each message body is reduced to a set of word shingles (runs of
+:attr:`~MinHasher.shingle_size` consecutive words), and the set is
+summarized by a MinHash signature, whose positions agree between two
+messages with probability equal to the Jaccard similarity of their
+shingle sets. Signatures are computed in a pool of processes; each worker
+maps the folder data files itself, so only message locations are sent to
+workers and only signatures are sent back.
+
+Similar signatures are found with locality-sensitive hashing: signatures
+are split into bands, and messages sharing any band are candidates. A
+candidate is compared with one member of each cluster already sharing
+that band (the first of the cluster's messages seen with it), and
+messages whose estimated similarity reaches the threshold are merged into
+a cluster. The work done for each message therefore grows with the number
+of distinct clusters sharing its bands, not with the number of messages,
+so a large group of near-identical messages costs little more than a
+small one; the price is that a message similar only to a later member of
+a cluster, and not to its representative, is not joined to it::
+
+    >>> from eulcommon.binfile import nearduplicates as nd
+    >>> jobs = itertools.chain(nd.macfolder_jobs('/path/to/oe/Inbox'),
+    ...                        nd.eudora_jobs('/path/to/eudora/In.toc'))
+    >>> for cluster in nd.find_near_duplicates(jobs, threshold=0.8):
+    ...     print cluster
+    [('/path/to/oe/Inbox', 3), ('/path/to/eudora/In.toc', 17)]
+
+Message bodies are compared as stored, without MIME decoding, so
+identical attachments encoded the same way also count as similar text.
+
+This module exports the following names:
+ * :func:`find_near_duplicates` -- cluster near-duplicate messages
+ * :func:`macfolder_jobs` -- message locations in an Outlook Express folder
+ * :func:`eudora_jobs` -- message locations in a Eudora folder
+ * :class:`MinHasher` -- computes MinHash signatures for text
+ * :class:`LSHIndex` -- clusters signatures with locality-sensitive hashing
+'''
+
+from array import array
+from mmap import mmap
+from multiprocessing import Pool
+import os
+import random
+import re
+import zlib
+
+from eulcommon.binfile.eudora import Toc
+from eulcommon.binfile.outlookexpress import MacIndex, MacMailMessage
+
+__all__ = ['find_near_duplicates', 'macfolder_jobs', 'eudora_jobs',
+           'MinHasher', 'LSHIndex']
+
+OUTLOOK_EXPRESS = 'oe'
+'job kind for messages in an Outlook Express ``Mail`` file'
+EUDORA = 'eudora'
+'job kind for messages in a Eudora folder data file'
+
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_WORD = re.compile(r'\w+')
+_HEADER_END = re.compile(r'\r\n\r\n|\n\n|\r\r')
+
+
+class MinHasher(object):
+    '''Computes MinHash signatures of the word shingles in text.
+
+    :param num_perm: number of hash functions, and so the length of each
+        signature
+    :param shingle_size: number of consecutive words in each shingle
+    :param seed: seed for choosing the hash functions; signatures are
+        only comparable if they were computed with the same settings
+    '''
+
+    def __init__(self, num_perm=64, shingle_size=5, seed=1):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = random.Random(seed)
+        self._permutations = [(rng.randrange(1, _PRIME), rng.randrange(_PRIME))
+                              for i in range(num_perm)]
+
+    def shingles(self, text):
+        '''Return the set of 32-bit hashes of the word shingles in
+        `text`. Text with fewer words than a shingle is one shingle.'''
+        words = _WORD.findall(text.lower())
+        size = min(self.shingle_size, len(words))
+        return set(zlib.crc32(' '.join(words[i:i + size])) & _MAX_HASH
+                   for i in range(len(words) - size + 1)) if words else set()
+
+    def signature(self, text):
+        '''Return the MinHash signature of `text` as an :class:`array`
+        of :attr:`num_perm` integers, or None if it contains no words.'''
+        hashes = self.shingles(text)
+        if not hashes:
+            return None
+        return array('L', [min([((a * h + b) % _PRIME) & _MAX_HASH
+                                for h in hashes])
+                           for a, b in self._permutations])
+
+
+class LSHIndex(object):
+    '''Clusters MinHash signatures using locality-sensitive hashing.
+
+    :param num_perm: length of the signatures
+    :param bands: number of bands each signature is split into; more
+        bands find less similar candidates. Must divide `num_perm`.
+    :param threshold: minimum estimated similarity (the fraction of
+        signature positions that agree) for two messages to be clustered
+    '''
+
+    def __init__(self, num_perm=64, bands=16, threshold=0.8):
+        if num_perm % bands:
+            raise ValueError('%d bands do not divide %d permutations' %
+                             (bands, num_perm))
+        self.num_perm = num_perm
+        self.bands = bands
+        self.threshold = threshold
+        self.rows = num_perm // bands
+        self.keys = []
+        'keys of the signatures added, in order'
+        self._buckets = [{} for i in range(bands)]
+        self._signatures = []
+        self._parent = array('l')
+
+    def __len__(self):
+        return len(self.keys)
+
+    def similarity(self, first, second):
+        '''Estimated similarity of the signatures at two positions.'''
+        a, b = self._signatures[first], self._signatures[second]
+        return sum(1 for x, y in zip(a, b) if x == y) / float(self.num_perm)
+
+    def _find(self, i):
+        parent = self._parent
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def add(self, key, signature):
+        '''Add the signature of the message identified by `key`.'''
+        if len(signature) != self.num_perm:
+            raise ValueError('signature has %d values, not %d' %
+                             (len(signature), self.num_perm))
+        position = len(self.keys)
+        self.keys.append(key)
+        self._signatures.append(array('L', signature))
+        self._parent.append(position)
+        rows = self.rows
+        compared = set()
+        for band, bucket in enumerate(self._buckets):
+            band_key = hash(tuple(signature[band * rows:(band + 1) * rows]))
+            members = bucket.get(band_key)
+            if members is None:
+                bucket[band_key] = [position]
+                continue
+            # the bucket holds one representative of each cluster in it;
+            # compare with each one, and become a representative only if
+            # not joined to a cluster already in the bucket
+            represented = False
+            for other in members:
+                if other not in compared and \
+                   self._find(other) != self._find(position):
+                    compared.add(other)
+                    if self.similarity(other, position) >= self.threshold:
+                        self._parent[self._find(position)] = \
+                            self._find(other)
+                if self._find(other) == self._find(position):
+                    represented = True
+            if not represented:
+                members.append(position)
+
+    def clusters(self):
+        '''Return a list of clusters of two or more similar messages, each
+        a list of keys in the order they were added.'''
+        members = {}
+        for position in range(len(self.keys)):
+            members.setdefault(self._find(position), []).append(position)
+        return [[self.keys[i] for i in group]
+                for root, group in sorted(members.items())
+                if len(group) > 1]
+
+
+def macfolder_jobs(folder_path, label=None):
+    '''Generator yielding a job for :func:`find_near_duplicates` for each
+    message in an Outlook Express 4.5 for Mac folder. Messages are keyed
+    by ``(label, position)``; `label` defaults to `folder_path`.'''
+    mail_path = os.path.join(folder_path, 'Mail')
+    if not os.path.exists(mail_path):
+        return
+    table = MacIndex(os.path.join(folder_path, 'Index')).messages
+    label = folder_path if label is None else label
+    offsets, sizes = table.column('offset'), table.column('size')
+    for i in range(len(table)):
+        yield ((label, i), OUTLOOK_EXPRESS, mail_path, offsets[i], sizes[i], 0)
+
+
+def eudora_jobs(toc_path, data_path=None, label=None):
+    '''Generator yielding a job for :func:`find_near_duplicates` for each
+    message in a Eudora folder. Messages are keyed by ``(label,
+    position)``; `label` defaults to `toc_path`, and `data_path` to the
+    ``.toc`` path without its extension.'''
+    if data_path is None:
+        data_path = os.path.splitext(toc_path)[0]
+    table = Toc(toc_path).messages
+    label = toc_path if label is None else label
+    offsets, sizes = table.column('offset'), table.column('size')
+    body_offsets = table.column('body_offset')
+    for i in range(len(table)):
+        yield ((label, i), EUDORA, data_path, offsets[i], sizes[i],
+               body_offsets[i])
+
+
+def _body(data):
+    match = _HEADER_END.search(data)
+    return data[match.end():] if match else ''
+
+
+def _message_body(mm, kind, offset, size, body_offset):
+    # body of a message located by a job; None for deleted messages
+    if kind == OUTLOOK_EXPRESS:
+        msg = MacMailMessage(size, mm=mm, offset=offset)
+        if msg.deleted:
+            return None
+        return _body(msg.data)
+    if 0 < body_offset <= size:
+        return mm[offset + body_offset:offset + size]
+    return _body(mm[offset:offset + size])
+
+
+# per-process state for signature workers
+_hasher = None
+_maps = {}
+
+
+def _init_worker(num_perm, shingle_size, seed):
+    global _hasher
+    _hasher = MinHasher(num_perm, shingle_size, seed)
+    _close_maps()
+
+
+def _close_maps():
+    for mm in _maps.values():
+        mm.close()
+    _maps.clear()
+
+
+def _map(path):
+    if path not in _maps:
+        with open(path, 'rb') as fobj:
+            _maps[path] = mmap(fobj.fileno(), 0, prot=1)
+    return _maps[path]
+
+
+def _signature_job(job):
+    key, kind, path, offset, size, body_offset = job
+    body = _message_body(_map(path), kind, offset, size, body_offset)
+    return key, (_hasher.signature(body) if body else None)
+
+
+def find_near_duplicates(jobs, processes=None, num_perm=64, bands=16,
+                         shingle_size=5, threshold=0.8, seed=1, chunksize=32):
+    '''Cluster near-duplicate messages.
+
+    :param jobs: iterable of message locations, as generated by
+        :func:`macfolder_jobs` and :func:`eudora_jobs`
+    :param processes: number of worker processes computing signatures;
+        defaults to the number of CPUs. Use 0 to compute signatures in
+        the current process.
+    :param threshold: minimum estimated similarity of clustered messages
+    :param chunksize: number of jobs sent to a worker at a time
+
+    `num_perm`, `shingle_size` and `seed` are passed to
+    :class:`MinHasher`, and `bands` to :class:`LSHIndex`.
+
+    :returns: list of clusters, each a list of two or more message keys
+    '''
+    index = LSHIndex(num_perm, bands, threshold)
+    if processes == 0:
+        _init_worker(num_perm, shingle_size, seed)
+        results = (_signature_job(job) for job in jobs)
+    else:
+        pool = Pool(processes, _init_worker, (num_perm, shingle_size, seed))
+        # results in job order, so clusters do not depend on timing
+        results = pool.imap(_signature_job, jobs, chunksize)
+    try:
+        for key, signature in results:
+            if signature is not None:
+                index.add(key, signature)
+    finally:
+        if processes == 0:
+            _close_maps()
+        else:
+            pool.terminate()
+    return index.clusters()
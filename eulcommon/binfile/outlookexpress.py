@@ -28,9 +28,17 @@ mail folder is empty).
 '''
 
 import email
+try:
+    from email.feedparser import BytesFeedParser
+except ImportError:
+    # python 2 feedparser handles byte strings directly
+    from email.feedparser import FeedParser as BytesFeedParser
 from eulcommon import binfile
+from eulcommon.binfile.msgcache import EMAIL_SIZE_FACTOR, file_identity, \
+     message_key
 import logging
 import os
+import posixpath
 
 logger = logging.getLogger(__name__)
 
@@ -60,37 +68,96 @@ class MacIndex(binfile.BinaryStructure):
 
     @property
     def messages(self):
-        '''A generator yielding the :class:`MacIndexMessage`
-        structures in this index file.'''
+        '''A :class:`~eulcommon.binfile.RecordTable` of the
+        :class:`MacIndexMessage` structures in this index file.'''
 
         # The file contains the fixed-size file header followed by
         # fixed-size message structures, followed by minimal message
         # information (subject, from, to).  Start after the file
         # header and then simply return the message structures in
         # sequence until we have returned the number of messages in
-        # this folder, ignoring the minimal message information at the
-        # end of the file.
+        # this folder; see summaries for the minimal message
+        # information at the end of the file.
+        return binfile.RecordTable(MacIndexMessage, self.mmap,
+                                   self.header_length, self.total_messages)
 
-        offset = self.header_length # initial offset
-        # how much of the data in this file we expect to use, based on
-        # the number of messages in this folder and the index message block size
-        maxlen = self.header_length + self.total_messages * MacIndexMessage.LENGTH
-        while offset < maxlen:
-             yield MacIndexMessage(mm=self.mmap, offset=offset)
-             offset += MacIndexMessage.LENGTH
+    def get_message(self, index):
+        '''Get the :class:`MacIndexMessage` at a particular position in
+        this index file.'''
+        return self.messages[index]
 
+    @property
+    def summary_block_offset(self):
+        '''offset of the block of minimal message information at the
+        end of the index file, immediately after the last
+        :class:`MacIndexMessage`'''
+        return self.header_length + self.total_messages * MacIndexMessage.LENGTH
+
+    @property
+    def summaries(self):
+        '''A generator yielding a :class:`MacIndexSummary` for each
+        message in this index file, in the same order as
+        :attr:`messages`.  Summaries are read from the end of the
+        index file, so a listing of a folder's messages can be
+        generated without accessing the (potentially very large)
+        ``Mail`` file.'''
+        offset = self.summary_block_offset
+        for i in range(self.total_messages):
+            if offset >= len(self.mmap):
+                break
+            summary = MacIndexSummary(mm=self.mmap, offset=offset)
+            yield summary
+            offset = summary.end
+
+    def get_summary(self, index):
+        '''Get the :class:`MacIndexSummary` for the message at a
+        particular position in this index file, using the summary
+        location stored in its :class:`MacIndexMessage`.'''
+        msginfo = self.get_message(index)
+        return MacIndexSummary(mm=self.mmap,
+            offset=self.summary_block_offset + msginfo.summary_offset)
 
 
 class MacIndexMessage(binfile.BinaryStructure):
     '''Information about a single email message within the
     :class:`MacIndex`.'''
 
+    __slots__ = ()
+
     LENGTH = 52
     '''size of a single message information block'''
     offset = binfile.IntegerField(13, 16)
     '''the offset of the raw email data in the folder data file'''
     size = binfile.IntegerField(17, 20)
     '''the size of the raw email data in the folder data file'''
+    summary_offset = binfile.IntegerField(24, 28)
+    '''the offset of the :class:`MacIndexSummary` for this message,
+    relative to the start of the summary block at the end of the
+    index file'''
+
+
+class MacIndexSummary(binfile.BinaryStructure):
+    '''Minimal information about a single email message, stored in a
+    block at the end of the :class:`MacIndex` file.  Each summary
+    consists of the message subject, sender, and recipient as
+    consecutive NUL-terminated strings.'''
+
+    __slots__ = ()
+
+    _strings = binfile.StringChainField(0, count=3, terminator='\0')
+
+    subject = _strings.item(0)
+    '''the email subject'''
+    sender = _strings.item(1)
+    '''the sender of the email (from the ``From`` header)'''
+    to = _strings.item(2)
+    '''the recipient of the email (from the ``To`` header)'''
+
+    @property
+    def end(self):
+        '''the offset immediately after this summary, where the next
+        summary begins'''
+        return self._strings.end
 
 
 class MacMail(binfile.BinaryStructure):
@@ -149,10 +216,18 @@ class MacMailMessage(binfile.BinaryStructure):
     DELETED_MESSAGE = 'MDel'
     'Header string indicating a deleted message'
 
-    content_offset = binfile.IntegerField(5, 8)
+    kind = binfile.EnumField(0, 4, {MESSAGE: 'message',
+                                    DELETED_MESSAGE: 'deleted'})
+    ''':attr:`header_type` as a name: ``'message'`` or ``'deleted'``'''
+
+    content_offset = binfile.cached_field(binfile.IntegerField(5, 8))
     '''offset within this message block where the message summary
     header ends and message content begins'''
 
+    chunk_size = 64 * 1024
+    '''number of bytes fed to the email parser at a time by
+    :meth:`as_email`'''
+
     def __init__(self, size, *args, **kwargs):
         self.size = size
         super(MacMailMessage, self).__init__(*args, **kwargs)
@@ -169,10 +244,33 @@ class MacMailMessage(binfile.BinaryStructure):
         # skip header, up to the size of this message
         return self.mmap[self.content_offset + self._offset: self._offset + self.size]
 
+    def open(self):
+        '''Return a read-only, file-like
+        :class:`~eulcommon.binfile.RegionReader` over the email
+        content for this message (the same bytes as :attr:`data`).
+        Content is read from the mapped Mail file as it is requested,
+        so very large messages can be processed incrementally::
+
+            reader = msg.open()
+            for chunk in iter(lambda: reader.read(65536), ''):
+                parser.feed(chunk)
+        '''
+        return binfile.RegionReader(self.mmap,
+                                    self._offset + self.content_offset,
+                                    self._offset + self.size)
+
     def as_email(self):
         '''Return message data as a :class:`email.message.Message`
-        object.'''
-        return email.message_from_string(self.data)
+        object.  Message content is fed to the parser in chunks of
+        :attr:`chunk_size` bytes rather than read into memory all at
+        once.'''
+        parser = BytesFeedParser()
+        reader = self.open()
+        chunk = reader.read(self.chunk_size)
+        while chunk:
+            parser.feed(chunk)
+            chunk = reader.read(self.chunk_size)
+        return parser.close()
 
 
 class MacFolder(object):
@@ -182,13 +280,24 @@ class MacFolder(object):
     :param folder_path: path to the Outlook Express 4.5 folder
         directory, which must contain at least an ``Index`` file (and
         probably a ``Mail`` file, for non-empty folders)
+    :param archive: optional tar or zip file containing the folder, as
+        a path or an :class:`~eulcommon.binfile.archives.Archive`; if
+        given, `folder_path` is the folder's directory within the archive,
+        and the folder files are read without extracting them
 
     '''
 
     index = None
     data = None
-
-    def __init__(self, folder_path):
+    data_identity = None
+    '''identity of the ``Mail`` file when it was opened, as from
+    :func:`~eulcommon.binfile.msgcache.file_identity`; used to key cached
+    messages'''
+
+    def __init__(self, folder_path, archive=None):
+        if archive is not None:
+            self._open_archived(folder_path, archive)
+            return
         index_filename = os.path.join(folder_path, 'Index')
         data_filename = os.path.join(folder_path, 'Mail')
         if os.path.exists(index_filename):
@@ -199,12 +308,34 @@ class MacFolder(object):
         # data file will not be present for empty folders
         if os.path.exists(data_filename):
             self.data = MacMail(data_filename)
+            self.data_identity = file_identity(data_filename)
+
+    def _open_archived(self, folder_path, archive):
+        from eulcommon.binfile.archives import Archive, open_archive
+        if not isinstance(archive, Archive):
+            archive = open_archive(archive)
+        index_name = posixpath.join(folder_path, 'Index')
+        data_name = posixpath.join(folder_path, 'Mail')
+        if index_name not in archive:
+            raise RuntimeError('Outlook Express Folder Index does not exist at "%s" in %s' % \
+                            (index_name, archive.path))
+        self.index = MacIndex(mm=archive.map(index_name))
+        if data_name in archive:
+            self.data = MacMail(mm=archive.map(data_name))
+            self.data_identity = archive.member_identity(data_name)
 
     @property
     def count(self):
         'Number of email messages in this folder'
         return self.index.total_messages
 
+    @property
+    def summaries(self):
+        '''A generator yielding a :class:`MacIndexSummary` (subject,
+        sender, and recipient) for each message in this folder.  Only
+        the Index file is read.'''
+        return self.index.summaries
+
     skipped_chunks = None
     '''Number of data chunks skipped between raw messages, based on
     offset and size.  (Only set after iterating through messages.)'''
@@ -248,6 +379,44 @@ class MacFolder(object):
         '''Same as :attr:`messages` except deleted messages are included.'''
         return self._messages(skip_deleted=False)
 
+    def aiter_messages(self, reader=None, skip_deleted=True):
+        '''Asynchronous iterator over the messages in this folder, for
+        use with ``async for`` in :mod:`asyncio` code; see
+        :meth:`eulcommon.binfile.aio.AsyncMailReader.messages`.
+
+        :param reader: the :class:`~eulcommon.binfile.aio.AsyncMailReader`
+            used to read and parse messages; defaults to
+            :func:`eulcommon.binfile.aio.default_reader`
+        :param skip_deleted: if False, include deleted messages
+        '''
+        from eulcommon.binfile import aio
+        if reader is None:
+            reader = aio.default_reader()
+        return reader.messages(self, skip_deleted)
+
+    def get_raw_message(self, index):
+        '''Get the :class:`MacMailMessage` at a particular position in
+        this folder, without parsing it.'''
+        msginfo = self.index.get_message(index)
+        return self.data.get_message(msginfo.offset, msginfo.size)
+
+    def get_email(self, index, cache=None):
+        '''Get the message at a particular position in this folder as an
+        :class:`email.message.Message`.
+
+        :param index: position of the message in the folder
+        :param cache: optional :class:`~eulcommon.binfile.msgcache.MessageCache`
+            (e.g., :data:`eulcommon.binfile.msgcache.message_cache`); if
+            given, a message parsed earlier from the same version of the
+            ``Mail`` file is returned instead of parsing it again
+        '''
+        raw_msg = self.get_raw_message(index)
+        if cache is None:
+            return raw_msg.as_email()
+        key = message_key(self.data_identity, raw_msg._offset, raw_msg.size)
+        return cache.get_or_set(key, raw_msg.as_email,
+                                raw_msg.size * EMAIL_SIZE_FACTOR)
+
     def _messages(self, skip_deleted=True):
         # common logic for messages / all_messages
         for raw_msg in self.raw_messages:
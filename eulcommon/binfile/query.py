@@ -0,0 +1,248 @@
+# file eulcommon/binfile/query.py
+#
+#   Copyright 2012 Emory University Libraries
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+'''Filter, sort, and project the records of a
+:class:`~eulcommon.binfile.RecordTable`.
+
+Queries are built with a small, Django-like API, starting from a record
+table::
+
+    >>> toc = eudora.Toc('In.toc')
+    >>> query = toc.messages.where(size__gt=10 * 1024 * 1024,
+    ...                            to__contains='Somebody')
+    >>> for msg in query.order_by('-size').fields('subject', 'size'):
+    ...     print msg['subject'], msg['size']
+
+Only the fields referenced by a query's conditions, ordering, and
+projection are decoded. Conditions on fixed-width fields (e.g.
+:class:`~eulcommon.binfile.IntegerField` or
+:class:`~eulcommon.binfile.EnumField`) are evaluated first, a block of
+records at a time, using the fields' bulk column decoding; conditions on
+variable-length strings or other attributes are then evaluated only for
+the records that are still candidates. Unordered queries generate results
+as they are found, without collecting them in memory.
+
+Conditions are given as keyword arguments of the form
+``field__lookup=value``; a field name with no lookup tests for equality.
+Multiple conditions, and chained calls to :meth:`TableQuery.where`, must
+all match. Supported lookups are:
+
+ * ``exact``, ``gt``, ``gte``, ``lt``, ``lte`` -- comparisons
+ * ``in`` -- the value is one of a collection of values
+ * ``range`` -- the value is between two values, inclusive
+ * ``contains``, ``icontains`` -- the value contains a string (the ``i``
+   version ignores case)
+ * ``startswith``, ``endswith`` -- the value starts or ends with a string
+
+This module exports the following names:
+ * :class:`TableQuery` -- a query over a record table
+'''
+
+from itertools import compress, repeat
+import operator
+
+from eulcommon.binfile.core import ByteField
+
+__all__ = ['TableQuery']
+
+BLOCK_RECORDS = 65536
+'''number of records whose fixed-width fields are decoded at a time'''
+
+
+def _icontains(value, arg):
+    return arg.lower() in value.lower()
+
+
+def _startswith(value, arg):
+    return value.startswith(arg)
+
+
+def _endswith(value, arg):
+    return value.endswith(arg)
+
+
+def _range(value, arg):
+    return arg[0] <= value <= arg[1]
+
+
+def _in(value, arg):
+    return value in arg
+
+
+LOOKUPS = {
+    'exact': operator.eq,
+    'gt': operator.gt,
+    'gte': operator.ge,
+    'lt': operator.lt,
+    'lte': operator.le,
+    'in': _in,
+    'range': _range,
+    'contains': operator.contains,
+    'icontains': _icontains,
+    'startswith': _startswith,
+    'endswith': _endswith,
+}
+'''lookup functions by name; each is called with a record value and the
+condition value'''
+
+
+class _Condition(object):
+
+    def __init__(self, record_class, key, arg):
+        name, lookup = key, 'exact'
+        if '__' in key:
+            name, lookup = key.rsplit('__', 1)
+            if lookup not in LOOKUPS:
+                name, lookup = key, 'exact'
+        if lookup == 'in':
+            arg = frozenset(arg)
+        self.name = name
+        self.test = LOOKUPS[lookup]
+        self.arg = arg
+        self.field = _field(record_class, name)
+
+    def matches(self, values):
+        # boolean for each value, computed with C-level iteration
+        return list(map(self.test, values, repeat(self.arg, len(values))))
+
+
+def _field(record_class, name):
+    try:
+        return getattr(record_class, name)
+    except AttributeError:
+        raise ValueError('%s has no field %s' % (record_class.__name__, name))
+
+
+def _is_fixed(field):
+    # fixed-width fields support bulk decoding over a whole table
+    return isinstance(field, ByteField)
+
+
+def _take(values, indices, total):
+    if len(indices) == total:
+        return values
+    return [values[i] for i in indices]
+
+
+class TableQuery(object):
+    '''A query over the records of a
+    :class:`~eulcommon.binfile.RecordTable`.  Typically created with
+    :meth:`RecordTable.where() <eulcommon.binfile.RecordTable.where>`.
+
+    Query methods return a new query, so queries can be refined without
+    changing the original.  Iterating a query yields the matching
+    records, or dictionaries of field values if :meth:`fields` was used.
+    '''
+
+    def __init__(self, table, conditions=(), ordering=(), projection=None):
+        self.table = table
+        self._conditions = tuple(conditions)
+        self._ordering = tuple(ordering)
+        self._projection = projection
+
+    def _clone(self, **kwargs):
+        options = {'conditions': self._conditions,
+                   'ordering': self._ordering,
+                   'projection': self._projection}
+        options.update(kwargs)
+        return TableQuery(self.table, **options)
+
+    def where(self, **conditions):
+        '''Return a new query restricted to records that also match the
+        given conditions.'''
+        record_class = self.table.record_class
+        added = [_Condition(record_class, key, arg)
+                 for key, arg in sorted(conditions.items())]
+        return self._clone(conditions=self._conditions + tuple(added))
+
+    def order_by(self, *names):
+        '''Return a new query whose results are sorted by the given
+        fields.  Prefix a field name with ``-`` to sort in descending
+        order.  Ordered queries must find all of their results before
+        returning the first one.'''
+        for name in names:
+            _field(self.table.record_class, name.lstrip('-'))
+        return self._clone(ordering=names)
+
+    def fields(self, *names):
+        '''Return a new query yielding a dictionary of the given field
+        values for each matching record, instead of the record itself.'''
+        for name in names:
+            _field(self.table.record_class, name)
+        return self._clone(projection=names)
+
+    def _values(self, name, start, stop, indices):
+        # values of a field for the records at indices within a block
+        field = _field(self.table.record_class, name)
+        if _is_fixed(field):
+            return _take(field.column(self.table, start, stop), indices,
+                         stop - start)
+        return [getattr(self.table[start + i], name) for i in indices]
+
+    def _block_matches(self, start, stop):
+        # indices (relative to start) of matching records in a block
+        indices = list(range(stop - start))
+        fixed = [c for c in self._conditions if _is_fixed(c.field)]
+        other = [c for c in self._conditions if not _is_fixed(c.field)]
+        for condition in fixed + other:
+            if not indices:
+                break
+            values = self._values(condition.name, start, stop, indices)
+            indices = list(compress(indices, condition.matches(values)))
+        return indices
+
+    def _matches(self):
+        # generate (block start, block stop, indices) for matching records
+        total = len(self.table)
+        for start in range(0, total, BLOCK_RECORDS):
+            stop = min(start + BLOCK_RECORDS, total)
+            indices = self._block_matches(start, stop)
+            if indices:
+                yield start, stop, indices
+
+    def count(self):
+        '''Return the number of matching records.'''
+        return sum(len(indices) for start, stop, indices in self._matches())
+
+    def _results(self, start, stop, indices):
+        if self._projection is None:
+            return [self.table[start + i] for i in indices]
+        columns = [self._values(name, start, stop, indices)
+                   for name in self._projection]
+        return [dict(zip(self._projection, row)) for row in zip(*columns)]
+
+    def __iter__(self):
+        if not self._ordering:
+            for start, stop, indices in self._matches():
+                for result in self._results(start, stop, indices):
+                    yield result
+            return
+
+        # collect sort keys for the matching records, then sort them
+        keyed = []
+        names = [name.lstrip('-') for name in self._ordering]
+        for start, stop, indices in self._matches():
+            keys = zip(*[self._values(name, start, stop, indices)
+                         for name in names])
+            keyed.extend(zip(keys, [start + i for i in indices]))
+        # stable sorts from the last key to the first allow mixed
+        # ascending and descending keys
+        for position in range(len(names) - 1, -1, -1):
+            keyed.sort(key=lambda item: item[0][position],
+                       reverse=self._ordering[position].startswith('-'))
+        for key, index in keyed:
+            for result in self._results(index, index + 1, [0]):
+                yield result
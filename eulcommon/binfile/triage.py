@@ -0,0 +1,245 @@
+# file eulcommon/binfile/triage.py
+#
+#   Copyright 2012 Emory University Libraries
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+'''Find files that can be read with :mod:`eulcommon.binfile` structures
+in large directory trees, such as mounted disk images.
+
+Files are identified from their size and the first few bytes of their
+content only:
+
+ * Outlook Express 4.5 for Mac ``Index`` and ``Mail`` files start with
+   the magic numbers :attr:`MacIndex.MAGIC_NUMBER
+   <eulcommon.binfile.outlookexpress.MacIndex.MAGIC_NUMBER>` and
+   :attr:`MacMail.MAGIC_NUMBER
+   <eulcommon.binfile.outlookexpress.MacMail.MAGIC_NUMBER>`.
+ * Eudora ``.toc`` files have no magic number, but consist of a
+   :attr:`Toc.LENGTH <eulcommon.binfile.eudora.Toc.LENGTH>` byte header
+   followed by :attr:`Message.LENGTH <eulcommon.binfile.eudora.Message.LENGTH>`
+   byte records, start with a small format version number, and contain a
+   short, printable folder name.
+
+Directories are walked with :func:`os.scandir` where it is available (or
+the ``scandir`` backport), and file headers are read in a pool of threads
+so that slow storage is kept busy. Results are generated as files are
+classified, so reports on trees with millions of files can be written
+incrementally.
+
+This module exports the following names:
+ * :func:`identify` -- identify file content from its first bytes and size
+ * :func:`classify` -- identify a single file
+ * :func:`scan` -- generator identifying files in a directory tree
+ * :func:`write_report` -- write scan results as tab-separated lines
+ * :class:`TriageResult` -- scan result for a single file
+'''
+
+from multiprocessing.pool import ThreadPool
+import logging
+import os
+import stat
+
+from eulcommon.binfile.eudora import Toc, Message
+from eulcommon.binfile.outlookexpress import MacIndex, MacIndexMessage, \
+     MacMail
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['identify', 'classify', 'scan', 'write_report', 'TriageResult',
+           'OE_INDEX', 'OE_MAIL', 'EUDORA_TOC']
+
+OE_INDEX = 'outlookexpress-index'
+'format name for Outlook Express 4.5 for Mac ``Index`` files'
+OE_MAIL = 'outlookexpress-mail'
+'format name for Outlook Express 4.5 for Mac ``Mail`` files'
+EUDORA_TOC = 'eudora-toc'
+'format name for Eudora ``.toc`` files'
+
+HEADER_SIZE = 96
+'''number of bytes read from the beginning of each file; enough to
+include the Eudora folder name'''
+
+MAX_TOC_VERSION = 255
+'''largest Eudora ``.toc`` format version considered plausible'''
+
+# offset of the length-prepended folder name in a Eudora toc header
+_TOC_NAME_OFFSET = Toc.name.offset
+
+
+class TriageResult(object):
+    '''The result of classifying a single file.'''
+
+    def __init__(self, path, size, format):
+        self.path = path
+        'path to the file'
+        self.size = size
+        'size of the file in bytes'
+        self.format = format
+        '''identified format (:data:`OE_INDEX`, :data:`OE_MAIL`, or
+        :data:`EUDORA_TOC`), or None if the file was not recognized'''
+
+    def __repr__(self):
+        return '<TriageResult %s: %s>' % (self.path, self.format)
+
+
+def _int(data):
+    # big-endian unsigned integer, as in IntegerField
+    val = 0
+    for byte in data:
+        val = val * 256 + ord(byte)
+    return val
+
+
+def _is_toc(header, size):
+    if size < Toc.LENGTH or (size - Toc.LENGTH) % Message.LENGTH:
+        return False
+    if not 0 < _int(header[0:2]) <= MAX_TOC_VERSION:
+        return False
+    name_length = ord(header[_TOC_NAME_OFFSET])
+    name = header[_TOC_NAME_OFFSET + 1:_TOC_NAME_OFFSET + 1 + name_length]
+    # Mac folder names are at most 31 characters
+    if not 0 < name_length <= 31 or len(name) < name_length:
+        return False
+    return all(32 <= ord(c) != 127 for c in name)
+
+
+def _is_macindex(header, size):
+    if header[:4] != MacIndex.MAGIC_NUMBER or size < MacIndex.header_length:
+        return False
+    total = _int(header[13:16])
+    return size >= MacIndex.header_length + total * MacIndexMessage.LENGTH
+
+
+def identify(header, size):
+    '''Identify file content from its first :data:`HEADER_SIZE` bytes and
+    its total size.  Returns a format name, or None.'''
+    if _is_macindex(header, size):
+        return OE_INDEX
+    if header[:4] == MacMail.MAGIC_NUMBER:
+        return OE_MAIL
+    if _is_toc(header, size):
+        return EUDORA_TOC
+    return None
+
+
+# smallest file that could be any of the recognized formats
+_MIN_SIZE = 4
+
+
+def classify(path, size=None):
+    '''Identify a single file, reading at most :data:`HEADER_SIZE` bytes.
+
+    :param path: path to the file
+    :param size: size of the file, if already known
+    :rtype: :class:`TriageResult`
+    '''
+    if size is None:
+        size = os.path.getsize(path)
+    format = None
+    if size >= _MIN_SIZE:
+        try:
+            with open(path, 'rb') as fobj:
+                header = fobj.read(HEADER_SIZE)
+        except (IOError, OSError) as err:
+            logger.warning('Error reading %s: %s', path, err)
+        else:
+            format = identify(header, size)
+    return TriageResult(path, size, format)
+
+
+def _walk(top):
+    # generate (path, size) for every regular file under top, without
+    # following symbolic links
+    dirs = [top]
+    while dirs:
+        current = dirs.pop()
+        try:
+            if scandir is not None:
+                for entry in scandir(current):
+                    if entry.is_dir(follow_symlinks=False):
+                        dirs.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        yield entry.path, entry.stat(follow_symlinks=False).st_size
+                continue
+
+            for name in os.listdir(current):
+                path = os.path.join(current, name)
+                info = os.lstat(path)
+                if stat.S_ISDIR(info.st_mode):
+                    dirs.append(path)
+                elif stat.S_ISREG(info.st_mode):
+                    yield path, info.st_size
+        except (IOError, OSError) as err:
+            logger.warning('Error reading directory %s: %s', current, err)
+
+
+def _classify_entry(entry):
+    return classify(*entry)
+
+
+def scan(top, threads=8, batch_size=1000, include_unknown=False):
+    '''Generator identifying files in a directory tree, yielding a
+    :class:`TriageResult` for each recognized file.  Results are yielded
+    as they become available, not in directory order.
+
+    :param top: directory to scan
+    :param threads: number of threads reading file headers
+    :param batch_size: number of files handed to the thread pool at a
+        time; limits how far directory walking runs ahead of
+        classification
+    :param include_unknown: if True, also yield results for files that
+        were not recognized
+    '''
+    pool = ThreadPool(threads)
+    try:
+        batch = []
+        for entry in _walk(top):
+            batch.append(entry)
+            if len(batch) >= batch_size:
+                for result in _classify_batch(pool, batch, include_unknown):
+                    yield result
+                batch = []
+        for result in _classify_batch(pool, batch, include_unknown):
+            yield result
+    finally:
+        pool.terminate()
+
+
+def _classify_batch(pool, batch, include_unknown):
+    for result in pool.imap_unordered(_classify_entry, batch):
+        if include_unknown or result.format is not None:
+            yield result
+
+
+def write_report(results, fileobj):
+    '''Write :class:`TriageResult` records to a file object as they are
+    generated, one tab-separated line per file: format, size, and path.
+    Unrecognized files are reported with a format of ``unknown``.
+
+    :returns: number of results written
+    '''
+    count = 0
+    for result in results:
+        fileobj.write('%s\t%d\t%s\n' % (result.format or 'unknown',
+                                        result.size, result.path))
+        count += 1
+    return count
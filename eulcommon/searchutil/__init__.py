@@ -18,93 +18,150 @@
 
 """This module contains utilities for searching."""
 
+from collections import OrderedDict
 import logging
-from ply import lex, yacc
 import re
+import threading
 
-__all__ = ('search_terms', 'pages_to_show', 'parse_search_terms')
+__all__ = ('search_terms', 'pages_to_show', 'parse_search_terms',
+           'canonical_query', 'ParseCache', 'parse_cache')
 
 logger = logging.getLogger(__name__)
 
-# lex rules
-
-tokens = ('WORD', 'PHRASE', 'COLON', 'SPACE')
-
-t_COLON = r':'
-t_SPACE = r'\s+'
-t_WORD = r'[^\s:"]+'
-
-
-@lex.TOKEN(r'"[^"]*"')
-def t_PHRASE(t):
-    # strip off the outer quotes - we just want the text value
-    t.value = t.value[1:-1]
-    return t
-
-
-def t_error(t):
-    logger.debug('skipping illegal/unmatched character ' + repr(t.value[0]))
-    t.lexer.skip(1)
-
-# parse rules
-
-
-def p_terms_empty(p):
-    '''
-    Terms :
-    '''
-    p[0] = []
-
-def p_terms_single(p):
-    '''
-    Terms : Term
-    '''
-    p[0] = [p[1]]
-
-
-def p_terms_leading_space(p):
-    '''
-    Terms : SPACE Terms
-    '''
-    p[0] = p[2]
-
-
-def p_terms_multiple(p):
-    '''
-    Terms : Term SPACE Terms
-    '''
-    p[0] = [p[1]]
-    p[0].extend(p[3])
+# Search strings are a sequence of terms separated by whitespace:
+#
+#   Terms : [SPACE] [Term (SPACE Term)* [SPACE]]
+#   Term  : WORD | PHRASE | WORD COLON [WORD | PHRASE]
+#
+# A single pattern matches every token: whitespace, a quoted phrase
+# (captured without its quotes), a colon, a word, or a quote with no
+# closing quote, which is skipped.
+_TOKEN = re.compile(r'(?P<SPACE>\s+)|"(?P<PHRASE>[^"]*)"|(?P<COLON>:)'
+                    r'|(?P<WORD>[^\s:"]+)|"')
+
+_SPACE = re.compile(r'\s+')
+_NEEDS_QUOTES = re.compile(r'[\s:]')
+
+# parser states: expecting a term, after a word, after a field name and
+# colon, after a complete term
+_TERM, _WORD, _FIELD, _END = range(4)
+
+
+def _syntax_error(kind, value, position):
+    # same message as the ply parser this replaced
+    token = 'LexToken(%s,%r,%d,%d)' % (kind, value, 1, position)
+    return RuntimeError("Syntax error at '%s'" % token)
+
+
+def _parse(q):
+    terms = []
+    state = _TERM
+    word = None
+    for match in _TOKEN.finditer(q):
+        kind = match.lastgroup
+        if kind is None:
+            logger.debug('skipping unmatched character %r', match.group())
+            continue
+        if kind == 'SPACE':
+            if state == _WORD:
+                terms.append((None, word))
+            elif state == _FIELD:
+                terms.append((word, None))
+            state = _TERM
+            continue
+        value = match.group(kind)
+        if state == _TERM and kind == 'WORD':
+            word = value
+            state = _WORD
+        elif state == _TERM and kind == 'PHRASE':
+            terms.append((None, value))
+            state = _END
+        elif state == _WORD and kind == 'COLON':
+            state = _FIELD
+        elif state == _FIELD and kind != 'COLON':
+            terms.append((word, value))
+            state = _END
+        else:
+            raise _syntax_error(kind, value, match.start())
+    # a word or incomplete field at the end of the string
+    if state == _WORD:
+        terms.append((None, word))
+    elif state == _FIELD:
+        terms.append((word, None))
+    return terms
 
 
-def p_term_single(p):
-    '''
-    Term : WORD
-         | PHRASE
-    '''
-    p[0] = (None, p[1])
+DEFAULT_CACHE_SIZE = 1024
+'''default number of search strings kept by a :class:`ParseCache`'''
 
 
-def p_term_field(p):
-    '''
-    Term : WORD COLON WORD
-         | WORD COLON PHRASE
-    '''
-    p[0] = (p[1], p[3])
-
+class ParseCache(object):
+    '''A thread-safe cache of parsed search strings that discards the
+    least recently used ones when it holds more than `max_entries`.
 
-def p_term_incomplete_field(p):
-    '''
-    Term : WORD COLON
+    :param max_entries: number of search strings to keep; 0 disables
+        caching
     '''
-    p[0] = (p[1], None)
-
-
-def p_error(p):
-    raise RuntimeError("Syntax error at '%s'" % repr(p))
 
-searchlexer = lex.lex()
-searchparser = yacc.yacc()
+    def __init__(self, max_entries=DEFAULT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.hits = 0
+        'number of parses answered from the cache'
+        self.misses = 0
+        'number of parses not answered from the cache'
+        self.evictions = 0
+        'number of parsed strings discarded to stay within max_entries'
+        self._entries = OrderedDict()  # search string -> terms, oldest first
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, q):
+        return q in self._entries
+
+    def parse(self, q):
+        '''Return the terms of a search string as from
+        :meth:`parse_search_terms`, parsing it only if it is not already
+        cached. Strings with syntax errors are not cached.'''
+        with self._lock:
+            terms = self._entries.pop(q, None)
+            if terms is not None:
+                self._entries[q] = terms
+                self.hits += 1
+                # callers get their own list to modify
+                return list(terms)
+            self.misses += 1
+        # parse without holding the lock, so that other threads are not
+        # blocked; two threads missing the same string may both parse it
+        terms = tuple(_parse(q))
+        with self._lock:
+            if self.max_entries > 0:
+                self._entries[q] = terms
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return list(terms)
+
+    def clear(self):
+        '''Discard all parsed strings and reset the counters.'''
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        '''Return a dictionary of the cache counters: ``hits``,
+        ``misses``, ``evictions``, ``entries`` and ``max_entries``.'''
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions,
+                    'entries': len(self._entries),
+                    'max_entries': self.max_entries}
+
+
+parse_cache = ParseCache()
+'''the :class:`ParseCache` used by :meth:`parse_search_terms`; set
+:attr:`~ParseCache.max_entries` to change its size'''
 
 
 def parse_search_terms(q):
@@ -122,8 +179,14 @@ def parse_search_terms(q):
 
       [(None,'grahame'), (None, 'frog and toad'), ('title', 'willows')]
 
+    Raises :class:`RuntimeError` for terms that are not separated by
+    whitespace, such as ``title:"a b"c`` or ``a:b:c``.
+
+    Parsing keeps no state outside of each call, so search strings can be
+    parsed in any number of threads at once. Recently parsed strings are
+    kept in :data:`parse_cache`.
     '''
-    return searchparser.parse(q, lexer=searchlexer)
+    return parse_cache.parse(q)
 
 
 def search_terms(q):
@@ -150,6 +213,41 @@ def search_terms(q):
     return values
 
 
+def _canonical_value(value):
+    # phrases without whitespace or colons are equivalent to words
+    if value is None:
+        return ''
+    value = _SPACE.sub(' ', value).strip()
+    if not value or _NEEDS_QUOTES.search(value):
+        return '"%s"' % value
+    return value
+
+
+def canonical_query(q):
+    '''Return a canonical form of a search string, as a key for caching
+    search results: strings that differ only in whitespace, unnecessary
+    quoting, term order or repeated terms have the same canonical form.
+    Whitespace within phrases is collapsed to single spaces, words come
+    before field terms, and terms are otherwise sorted. The canonical
+    form is itself a search string with the same terms. For example::
+
+      canonical_query(' title:"willows"  "frog  and toad" grahame')
+
+    Would result in::
+
+      '"frog and toad" grahame title:willows'
+
+    Raises :class:`RuntimeError` for search strings that cannot be
+    parsed, as :meth:`parse_search_terms` does.
+    '''
+    terms = set()
+    for field, value in parse_search_terms(q):
+        value = _canonical_value(value)
+        terms.add((field is not None, field or '', value))
+    return ' '.join('%s:%s' % (field, value) if has_field else value
+                    for has_field, field, value in sorted(terms))
+
+
 def pages_to_show(paginator, page, page_labels=None):
     """Generate a dictionary of pages to show around the current page. Show
     3 numbers on either side of the specified page, or more if close to end or
@@ -0,0 +1,288 @@
+# file eulcommon/searchutil/predicates.py
+#
+#   Copyright 2012 Emory University Libraries
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+'''Filter Python objects, or columns of values, with search strings in the
+syntax of :meth:`~eulcommon.searchutil.parse_search_terms`.
+
+A :class:`PredicateCompiler` is configured once with the search fields
+allowed and the attributes each one searches, and compiles a search into
+a :class:`Predicate`::
+
+    >>> from eulcommon.binfile import outlookexpress
+    >>> from eulcommon.searchutil.predicates import PredicateCompiler
+    >>> compiler = PredicateCompiler({'from': 'sender', 'to': 'to',
+    ...                               'subject': 'subject'},
+    ...                              default=('subject', 'sender'))
+    >>> match = compiler.compile('"quarterly report" from:smith')
+    >>> index = outlookexpress.MacIndex('/path/to/folder/Index')
+    >>> reports = list(match.filter(index.summaries))
+
+As with :mod:`eulcommon.searchutil.query`, a term matches if any of its
+field's attributes contains the value, ignoring case, and a record must
+match every term. Each term is compiled once to a regular expression on
+casefolded text (a phrase matches its words separated by any
+whitespace), and attributes are read with :func:`operator.attrgetter`
+(or another getter, such as :func:`operator.itemgetter` for
+dictionaries), so nothing about the search is interpreted again for each
+record.
+
+For large numbers of records, :meth:`Predicate.filter_columns` and
+:meth:`Predicate.filter_table` work a column of values at a time instead:
+each column is casefolded and joined into a single string, and each term
+is found with one regular expression scan of that string, so the
+per-record work done in Python is proportional to the number of matches
+rather than the number of records.
+
+This module exports the following names:
+ * :class:`PredicateCompiler` -- compiles search terms into predicates
+ * :class:`Predicate` -- a compiled search
+'''
+
+from operator import attrgetter, methodcaller
+import re
+
+from eulcommon.searchutil import parse_search_terms
+
+__all__ = ['PredicateCompiler', 'Predicate']
+
+BLOCK_SIZE = 65536
+'''number of records whose columns are read at a time by
+:meth:`Predicate.filter_table`'''
+
+# separates values in a joined column; neither \s nor any search word
+# matches it, so a match never spans two values. The character is treated
+# as a space within values (binfile strings are often padded with it).
+_SEPARATOR = u'\0'
+
+if hasattr(u'', 'casefold'):
+    _fold = methodcaller('casefold')
+else:
+    # python 2
+    _fold = methodcaller('lower')
+
+
+def _text(value):
+    # searchable text of an attribute value
+    if value is None:
+        return u''
+    if isinstance(value, bytes):
+        return value.decode('latin-1')
+    if isinstance(value, type(u'')):
+        return value
+    return u'%s' % (value,)
+
+
+def _fold_text(value):
+    return _fold(_text(value)).replace(_SEPARATOR, u' ')
+
+
+def _fold_column(values):
+    try:
+        # the common case, a column of text
+        folded = list(map(_fold, values))
+    except (AttributeError, TypeError):
+        folded = None
+    if folded is None or \
+       not all(isinstance(value, type(u'')) for value in folded):
+        return [_fold_text(value) for value in values]
+    return folded
+
+
+def _join_column(values):
+    folded = _fold_column(values)
+    text = _SEPARATOR.join(folded)
+    if folded and text.count(_SEPARATOR) != len(folded) - 1:
+        text = _SEPARATOR.join(value.replace(_SEPARATOR, u' ')
+                               for value in folded)
+    return text
+
+
+def _pattern(value):
+    # a value's words, casefolded, separated by any whitespace
+    words = _fold_text(value).split()
+    if not words:
+        return None
+    return re.compile(r'\s+'.join(re.escape(word) for word in words),
+                      re.UNICODE)
+
+
+class Predicate(object):
+    '''A compiled search, as returned by :meth:`PredicateCompiler.compile`.
+    Call it with a record to test whether the record matches.'''
+
+    def __init__(self, checks, getters):
+        self.checks = checks
+        '''list of ``(names, pattern)`` for each term: the attribute names
+        searched, and the compiled regular expression searched for'''
+        self._getters = getters  # attribute name -> getter
+
+    def __repr__(self):
+        return '<Predicate: %d terms>' % len(self.checks)
+
+    def __call__(self, record):
+        getters = self._getters
+        texts = {}
+        for names, pattern in self.checks:
+            for name in names:
+                text = texts.get(name)
+                if text is None:
+                    text = texts[name] = _fold_text(getters[name](record))
+                if pattern.search(text) is not None:
+                    break
+            else:
+                return False
+        return True
+
+    @property
+    def names(self):
+        'the attribute names searched, in the order they are first used'
+        names = []
+        for check_names, pattern in self.checks:
+            names.extend(name for name in check_names if name not in names)
+        return names
+
+    def filter(self, records):
+        '''Generator yielding the records that match.'''
+        for record in records:
+            if self(record):
+                yield record
+
+    def filter_columns(self, columns, count=None):
+        '''Return a sorted list of the positions of the matching records,
+        given their values as columns.
+
+        :param columns: dictionary of equal-length sequences of values
+            by attribute name, including every name in :attr:`names`
+        :param count: number of records; required only when the search
+            has no terms
+        '''
+        if not self.checks:
+            if count is None:
+                count = len(next(iter(columns.values()))) if columns else 0
+            return list(range(count))
+        texts = {}
+        candidates = None
+        for names, pattern in self.checks:
+            matched = set()
+            for name in names:
+                text = texts.get(name)
+                if text is None:
+                    text = texts[name] = _join_column(columns[name])
+                matched.update(_find_rows(pattern, text))
+            candidates = matched if candidates is None \
+                else candidates & matched
+            if not candidates:
+                break
+        return sorted(candidates)
+
+    def filter_table(self, table, block_size=BLOCK_SIZE):
+        '''Generator yielding the positions of the matching records of a
+        :class:`~eulcommon.binfile.RecordTable`, where the searched
+        attribute names are record field names. Fields are decoded a block
+        of records at a time with
+        :meth:`~eulcommon.binfile.RecordTable.column`.'''
+        total = len(table)
+        for start in range(0, total, block_size):
+            stop = min(start + block_size, total)
+            columns = dict((name, table.column(name, start, stop))
+                           for name in self.names)
+            for position in self.filter_columns(columns, stop - start):
+                yield start + position
+
+
+def _find_rows(pattern, text):
+    # positions of the values in a joined column that the pattern matches
+    rows = []
+    row = 0     # position of the value starting at offset `last`
+    last = 0
+    match = pattern.search(text)
+    while match is not None:
+        found = match.start()
+        row += text.count(_SEPARATOR, last, found)
+        rows.append(row)
+        # continue from the start of the next value
+        end = text.find(_SEPARATOR, match.end())
+        if end == -1:
+            break
+        last = end + 1
+        row += 1
+        match = pattern.search(text, last)
+    return rows
+
+
+class PredicateCompiler(object):
+    '''Compiles search terms into :class:`Predicate` objects.
+
+    :param fields: dictionary of the allowed search field names; each
+        value is the attribute name (or a dotted path, for
+        :func:`~operator.attrgetter`) searched, or a sequence of them.
+        Only these fields can be searched, so that a search string cannot
+        read any other attribute of the records.
+    :param default: the attribute name or names searched by words and
+        phrases with no field
+    :param getter: callable that takes an attribute name and returns a
+        function getting that attribute from a record; use
+        :func:`operator.itemgetter` to search dictionaries
+    '''
+
+    def __init__(self, fields, default=None, getter=attrgetter):
+        self.fields = dict((name, self._names(names))
+                           for name, names in fields.items())
+        self.default = None if default is None else self._names(default)
+        self.getter = getter
+
+    def _names(self, names):
+        if isinstance(names, str) or not hasattr(names, '__iter__'):
+            return (names,)
+        return tuple(names)
+
+    def compile(self, terms):
+        '''Return a :class:`Predicate` matching records that match every
+        search term. `terms` is a search string, or a list of terms as
+        from :meth:`~eulcommon.searchutil.parse_search_terms`; with no
+        terms, every record matches. Incomplete terms (``title:``) and
+        repeated terms are ignored. Raises :class:`ValueError` for terms
+        with fields that are not allowed, or with no field if there is no
+        `default`.'''
+        if isinstance(terms, str) or not hasattr(terms, '__iter__'):
+            terms = parse_search_terms(terms)
+        checks = []
+        seen = set()
+        getters = {}
+        for field, value in terms:
+            if value is None:
+                continue
+            if field is None:
+                names = self.default
+                if names is None:
+                    raise ValueError('searching without a field is not '
+                                     'allowed')
+            elif field in self.fields:
+                names = self.fields[field]
+            else:
+                raise ValueError('%s is not a search field' % field)
+            pattern = _pattern(value)
+            if pattern is None:
+                # an empty phrase matches anything
+                continue
+            if (names, pattern.pattern) in seen:
+                continue
+            seen.add((names, pattern.pattern))
+            for name in names:
+                if name not in getters:
+                    getters[name] = self.getter(name)
+            checks.append((names, pattern))
+        return Predicate(checks, getters)
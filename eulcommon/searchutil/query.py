@@ -0,0 +1,302 @@
+# file eulcommon/searchutil/query.py
+#
+#   Copyright 2012 Emory University Libraries
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+'''Compile search terms, as parsed by
+:meth:`~eulcommon.searchutil.parse_search_terms`, into Django
+:class:`~django.db.models.Q` objects, combining as many terms as possible
+into a single query condition.
+
+A :class:`QueryCompiler` is configured once with the search fields a site
+allows, the model field paths (which may follow relations) each one
+searches, and the lookup used to compare values::
+
+    >>> from eulcommon.searchutil.query import QueryCompiler, SearchField
+    >>> compiler = QueryCompiler({
+    ...     'title': 'title',
+    ...     'author': ('authors__last_name', 'authors__first_name'),
+    ...     'year': SearchField('published__year', lookup='exact'),
+    ... }, default=('title', 'authors__last_name'))
+    >>> books = compiler.filter(Book.objects.all(),
+    ...                         'grahame "frog and toad" title:willows')
+
+A term matches if any of its field's paths matches, and a record must
+match every term. Words and phrases with no field search the `default`
+paths. Terms that add nothing are dropped before the query is built:
+repeated terms, and terms implied by another term for the same field
+(with a ``contains`` lookup, ``title:frog`` is implied by
+``title:frogs``).
+
+Terms on the model's own fields and on single-valued relations (foreign
+keys followed forwards, and one-to-one relations) are combined into one
+:class:`~django.db.models.Q` object and applied in a single
+:meth:`~django.db.models.query.QuerySet.filter` call. Terms on
+multi-valued relations (many-to-many relations, and foreign keys followed
+backwards) are applied in a separate ``filter()`` call each, so that
+``author:smith author:jones`` finds books by both authors rather than
+requiring a single author to match both terms. Where that stricter
+meaning is wanted, a :class:`SearchField` with ``shared_join=True``
+combines its terms with the others, sharing one join.
+
+With a `search_vector`, words and phrases with no field are matched by
+PostgreSQL full-text search instead, combined into a single
+:class:`~django.contrib.postgres.search.SearchQuery`. This requires
+Django 1.10 or later and :mod:`psycopg2`.
+
+This module exports the following names:
+ * :class:`QueryCompiler` -- compiles search terms into
+   :class:`~django.db.models.Q` objects
+ * :class:`SearchField` -- the model field paths and lookup searched by a
+   search field
+'''
+
+from django import VERSION as django_version
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from django.db.models import Q
+
+from eulcommon.searchutil import parse_search_terms
+
+try:
+    from django.contrib.postgres.search import SearchQuery
+except ImportError:
+    # django before 1.10, or psycopg2 not installed
+    SearchQuery = None
+
+__all__ = ['QueryCompiler', 'SearchField']
+
+# SearchQuery supports phrase searches as of django 2.2
+_PHRASE_SEARCH = django_version >= (2, 2)
+
+# for lookups that match part of a value, one value can imply another:
+# a title containing "frogs" also contains "frog"
+_IMPLIED = {
+    'contains': lambda short, value: short in value,
+    'startswith': lambda short, value: value.startswith(short),
+    'endswith': lambda short, value: value.endswith(short),
+}
+
+
+class SearchField(object):
+    '''The model field paths searched by a search field, and how values
+    are compared with them.
+
+    :param paths: a model field path, which may follow relations (e.g.,
+        ``authors__last_name``), or a sequence of them; a term matches if
+        any of them matches
+    :param lookup: the lookup used to compare the search value with each
+        path, e.g. ``icontains``, ``iexact`` or ``istartswith``
+    :param shared_join: if True, terms for this field are combined with
+        the other terms even when a path follows a multi-valued relation,
+        so that all of them must match the same related record
+    '''
+
+    def __init__(self, paths, lookup='icontains', shared_join=False):
+        if isinstance(paths, str) or not hasattr(paths, '__iter__'):
+            paths = (paths,)
+        self.paths = tuple(paths)
+        self.lookup = lookup
+        self.shared_join = shared_join
+
+    def __repr__(self):
+        return 'SearchField(%r, lookup=%r, shared_join=%r)' % (
+            self.paths, self.lookup, self.shared_join)
+
+    @property
+    def case_insensitive(self):
+        'whether the lookup ignores case'
+        return self.lookup.startswith('i')
+
+    def key(self, value):
+        '''Return the form of a search value that decides whether two
+        values are the same search.'''
+        return value.lower() if self.case_insensitive else value
+
+    def implies(self, value, other):
+        '''Return True if every record matching `value` also matches
+        `other`, so that `other` can be dropped from a search that
+        includes both.'''
+        value, other = self.key(value), self.key(other)
+        implied = _IMPLIED.get(self.lookup[1:] if self.case_insensitive
+                               else self.lookup)
+        if implied is None:
+            return value == other
+        return implied(other, value)
+
+    def q(self, value):
+        '''Return a :class:`~django.db.models.Q` object matching records
+        where any of the paths matches `value`.'''
+        result = None
+        for path in self.paths:
+            q = Q(**{'%s__%s' % (path, self.lookup): value})
+            result = q if result is None else result | q
+        return result
+
+
+def _multivalued(model, path):
+    # whether a field path follows a relation with many records per record
+    opts = model._meta
+    for name in path.split('__'):
+        try:
+            field = opts.get_field(name)
+        except FieldDoesNotExist:
+            # a transform, such as the year of a date
+            return False
+        if field.many_to_many or field.one_to_many:
+            return True
+        if not field.is_relation:
+            return False
+        opts = field.related_model._meta
+    return False
+
+
+class QueryCompiler(object):
+    '''Compiles search terms into :class:`~django.db.models.Q` objects.
+
+    :param fields: dictionary of the allowed search field names; each
+        value is a :class:`SearchField`, or the paths to search with the
+        default `lookup`
+    :param default: the :class:`SearchField` (or paths) searched by words
+        and phrases with no field
+    :param lookup: the lookup used by fields given only as paths
+    :param search_vector: if given, the name of a field or annotation
+        holding a PostgreSQL search vector; words and phrases with no field
+        are matched against it with full-text search instead of searching
+        `default`
+    :param config: the PostgreSQL text search configuration (e.g.,
+        ``'english'``) used for full-text search
+    '''
+
+    def __init__(self, fields, default=None, lookup='icontains',
+                 search_vector=None, config=None):
+        self.fields = dict((name, self._field(field, lookup))
+                           for name, field in fields.items())
+        'dictionary of :class:`SearchField` by search field name'
+        self.default = None if default is None else \
+            self._field(default, lookup)
+        ':class:`SearchField` searched by terms with no field'
+        self.search_vector = search_vector
+        self.config = config
+        if search_vector is not None and SearchQuery is None:
+            raise ImproperlyConfigured('full-text search requires django '
+                                       '1.10 or later and psycopg2')
+
+    def _field(self, field, lookup):
+        if isinstance(field, SearchField):
+            return field
+        return SearchField(field, lookup)
+
+    def merge(self, terms):
+        '''Return a list of ``(field, values)`` for the search terms
+        (a search string, or a list of terms as from
+        :meth:`~eulcommon.searchutil.parse_search_terms`), with the values
+        of each field that add nothing to the search dropped. Fields are
+        in the order they first appear in the terms, and `field` is None
+        for words and phrases. Incomplete terms (``title:``) are ignored.
+        Raises :class:`ValueError` for terms with fields that are not
+        allowed.'''
+        if isinstance(terms, str) or not hasattr(terms, '__iter__'):
+            terms = parse_search_terms(terms)
+        merged = []
+        values = {}  # field -> list of values
+        for name, value in terms:
+            if value is None:
+                continue
+            if name is not None and name not in self.fields:
+                raise ValueError('%s is not a search field' % name)
+            if name not in values:
+                values[name] = []
+                merged.append((name, values[name]))
+            values[name].append(value)
+
+        for name, field_values in merged:
+            if name is None and self.search_vector is not None:
+                # full-text queries are only deduplicated
+                field = SearchField((), 'exact')
+            elif name is None:
+                field = self.default
+                if field is None:
+                    raise ValueError('searching without a field is not '
+                                     'allowed')
+            else:
+                field = self.fields[name]
+            kept = []
+            for index, value in enumerate(field_values):
+                # drop a value implied by any other value, and the later of
+                # two equivalent values
+                if any(field.implies(other, value) and
+                       (not field.implies(value, other) or
+                        other_index < index)
+                       for other_index, other in enumerate(field_values)
+                       if other_index != index):
+                    continue
+                kept.append(value)
+            field_values[:] = kept
+        return merged
+
+    def search_query(self, values):
+        '''Return a :class:`~django.contrib.postgres.search.SearchQuery`
+        matching all of a list of words and phrases, or None if the list
+        is empty.'''
+        if SearchQuery is None:
+            raise ImproperlyConfigured('full-text search requires django '
+                                       '1.10 or later and psycopg2')
+        result = None
+        for value in values:
+            options = {}
+            if self.config is not None:
+                options['config'] = self.config
+            if _PHRASE_SEARCH and len(value.split()) > 1:
+                options['search_type'] = 'phrase'
+            query = SearchQuery(value, **options)
+            result = query if result is None else result & query
+        return result
+
+    def compile(self, terms, model):
+        '''Return a list of :class:`~django.db.models.Q` objects that
+        together match records of `model` that match every search term,
+        each to be applied in its own
+        :meth:`~django.db.models.query.QuerySet.filter` call (see
+        :meth:`filter`). The first combines every term that can share
+        joins; each of the rest is a term on a multi-valued relation.
+        `terms` is a search string, or a list of terms as from
+        :meth:`~eulcommon.searchutil.parse_search_terms`; with no terms,
+        the result is ``[Q()]``, which matches every record.'''
+        combined = Q()
+        separate = []
+        for name, values in self.merge(terms):
+            if name is None and self.search_vector is not None:
+                combined &= Q(**{self.search_vector:
+                                 self.search_query(values)})
+                continue
+            field = self.default if name is None else self.fields[name]
+            shared = field.shared_join or not any(
+                _multivalued(model, path) for path in field.paths)
+            for value in values:
+                if shared:
+                    combined &= field.q(value)
+                else:
+                    separate.append(field.q(value))
+        return [combined] + separate
+
+    def filter(self, queryset, terms):
+        '''Return `queryset` filtered by the search terms: one
+        :meth:`~django.db.models.query.QuerySet.filter` call for all the
+        terms that can share joins, and one for each other term on a
+        multi-valued relation. Use
+        :meth:`~django.db.models.query.QuerySet.distinct` on the result
+        when searching multi-valued relations.'''
+        for q in self.compile(terms, queryset.model):
+            queryset = queryset.filter(q)
+        return queryset
@@ -37,7 +37,6 @@ for path, dirs, files in os.walk('eulcommon'):
 
 test_requirements = [
     'mock',
-    'ply',
     'pytest',
     'pytest-cov',
     'pytest-django',
@@ -65,6 +64,11 @@ setup(
         'test': test_requirements,
         'dev': dev_requirements
     },
+    entry_points={
+        'console_scripts': [
+            'eulcommon-extract-mail = eulcommon.binfile.extract:main',
+        ],
+    },
     description='A collection of small python utilities for working with binary files and Django',
     long_description=LONG_DESCRIPTION,
     classifiers=CLASSIFIERS,
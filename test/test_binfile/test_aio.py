@@ -0,0 +1,212 @@
+# file test_binfile/test_aio.py
+#
+#   Copyright 2012 Emory University Libraries
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from eulcommon import binfile
+from eulcommon.binfile import aio, eudora, outlookexpress
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+class FakeTable(object):
+    # stands in for MacIndex.messages
+    def __init__(self, entries):
+        self.entries = entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def column(self, name, start, stop):
+        pos = 0 if name == 'offset' else 1
+        return [entry[pos] for entry in self.entries[start:stop]]
+
+
+class FakeRawMessage(object):
+    def __init__(self, folder, offset, size):
+        self.folder = folder
+        self.offset = offset
+        self.size = size
+        self.deleted = offset in folder.deleted
+
+    def as_email(self):
+        folder = self.folder
+        with folder.lock:
+            folder.inflight.append(folder.reader.inflight_bytes)
+        return 'message at %d' % self.offset
+
+
+class FakeFolder(object):
+    # stands in for outlookexpress.MacFolder
+    def __init__(self, reader, entries, deleted=()):
+        self.reader = reader
+        self.deleted = set(deleted)
+        self.inflight = []
+        self.lock = threading.Lock()
+        self.index = self
+        self.messages = FakeTable(entries)
+        self.data = self
+
+    def get_message(self, offset, size):
+        return FakeRawMessage(self, offset, size)
+
+
+@unittest.skipIf(aio.asyncio is None, 'asyncio is not available')
+class TestAsyncMailReader(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = aio.asyncio.new_event_loop()
+        aio.asyncio.set_event_loop(self.loop)
+        self.reader = aio.AsyncMailReader(max_workers=3, max_inflight_bytes=250,
+                                          prefetch=4)
+        self._index_batch = aio.INDEX_BATCH
+        aio.INDEX_BATCH = 7
+
+    def tearDown(self):
+        aio.INDEX_BATCH = self._index_batch
+        self.reader.close()
+        self.loop.close()
+
+    def collect(self, iterator):
+        results = []
+        while True:
+            try:
+                results.append(self.loop.run_until_complete(
+                    iterator.__anext__()))
+            except StopAsyncIteration:
+                return results
+
+    def test_messages(self):
+        entries = [(i * 100, 100) for i in range(30)]
+        folder = FakeFolder(self.reader, entries, deleted=[300, 2900])
+        results = self.collect(self.reader.messages(folder))
+        expected = ['message at %d' % offset for offset, size in entries
+                    if offset not in folder.deleted]
+        self.assertEqual(expected, results)
+        # messages are parsed ahead only within the byte limit
+        self.assertTrue(max(folder.inflight) <= 300)
+        self.assertEqual(0, self.reader.inflight_bytes)
+
+        folder = FakeFolder(self.reader, entries, deleted=[300])
+        results = self.collect(self.reader.messages(folder, skip_deleted=False))
+        self.assertEqual(30, len(results))
+
+    def test_large_message(self):
+        # a message larger than the byte limit is still read
+        folder = FakeFolder(self.reader, [(0, 1000), (1000, 10)])
+        self.assertEqual(['message at 0', 'message at 1000'],
+                         self.collect(self.reader.messages(folder)))
+
+    def test_empty_folder(self):
+        folder = FakeFolder(self.reader, [])
+        folder.data = None
+        self.assertEqual([], self.collect(self.reader.messages(folder)))
+
+    def test_close(self):
+        folder = FakeFolder(self.reader, [(i, 1) for i in range(20)])
+        iterator = self.reader.messages(folder)
+        self.assertEqual('message at 0',
+                         self.loop.run_until_complete(iterator.__anext__()))
+        iterator.close()
+        self.assertEqual([], self.collect(iterator))
+        self.assertEqual(0, self.reader.inflight_bytes)
+
+    def test_records(self):
+        table = binfile.RecordTable(binfile.BinaryStructure, b'\0' * 50,
+                                    length=10)
+        records = self.collect(self.reader.records(table, batch_size=2))
+        self.assertEqual([0, 10, 20, 30, 40],
+                         [record._offset for record in records])
+
+    def test_walk(self):
+        top = tempfile.mkdtemp()
+        try:
+            os.mkdir(os.path.join(top, 'sub'))
+            for name in ('a', os.path.join('sub', 'b')):
+                with open(os.path.join(top, name), 'wb') as out:
+                    out.write(b'data')
+            results = self.collect(self.reader.walk(top, batch_size=1,
+                                                    include_unknown=True))
+            self.assertEqual(sorted([os.path.join(top, 'a'),
+                                     os.path.join(top, 'sub', 'b')]),
+                             sorted(result.path for result in results))
+        finally:
+            shutil.rmtree(top)
+
+
+class TestFixtureFolders(unittest.TestCase):
+    # runs with or without asyncio, against the real fixture folders
+
+    def setUp(self):
+        self.toc = eudora.Toc(os.path.join(FIXTURES, 'In.toc'))
+        self.folder = outlookexpress.MacFolder(os.path.join(FIXTURES,
+                                                            'oemacfolder'))
+
+    def collect(self, iterator):
+        results = []
+        while True:
+            try:
+                results.append(self.loop.run_until_complete(
+                    iterator.__anext__()))
+            except StopAsyncIteration:
+                return results
+
+    def test_blocking_reads(self):
+        # the work done in the reader's thread pool
+        self.assertEqual([msg._offset for msg in self.toc.messages],
+                         [msg._offset for msg in
+                          aio._paged_records(self.toc.messages, 3)])
+
+        table = self.folder.index.messages
+        entries = aio._index_entries(table, 0, len(table))
+        self.assertEqual([(msg.offset, msg.size) for msg in table], entries)
+
+        parsed = [aio._parse_message(self.folder, offset, size, True)
+                  for offset, size in entries]
+        self.assertEqual([msg.items() for msg in self.folder.messages],
+                         [msg.items() for msg in parsed if msg is not None])
+        self.assertEqual(len(entries),
+                         len([aio._parse_message(self.folder, offset, size,
+                                                 False)
+                              for offset, size in entries]))
+
+    def test_aiter_messages(self):
+        if aio.asyncio is None:
+            # python 2: the iterators need an AsyncMailReader, which
+            # requires asyncio
+            self.assertRaises(RuntimeError, self.toc.aiter_messages)
+            self.assertRaises(RuntimeError, self.folder.aiter_messages)
+            self.assertEqual(None, aio._default_reader)
+            return
+
+        self.loop = aio.asyncio.new_event_loop()
+        aio.asyncio.set_event_loop(self.loop)
+        reader = aio.AsyncMailReader(max_workers=2, prefetch=2)
+        try:
+            records = self.collect(self.toc.aiter_messages(reader))
+            self.assertEqual([msg._offset for msg in self.toc.messages],
+                             [msg._offset for msg in records])
+            messages = self.collect(self.folder.aiter_messages(reader))
+            self.assertEqual([msg.items() for msg in self.folder.messages],
+                             [msg.items() for msg in messages])
+            self.assertEqual(0, reader.inflight_bytes)
+        finally:
+            reader.close()
+            self.loop.close()
@@ -0,0 +1,146 @@
+# file test_binfile/test_archives.py
+#
+#   Copyright 2012 Emory University Libraries
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import os
+import shutil
+import time
+import tarfile
+import tempfile
+import unittest
+import zipfile
+
+from eulcommon.binfile import archives, eudora, outlookexpress
+
+TEST_ROOT = os.path.dirname(__file__)
+FIXTURES = os.path.join(TEST_ROOT, 'fixtures')
+FIXTURE_FOLDER = os.path.join(FIXTURES, 'oemacfolder')
+FIXTURE_TOC = os.path.join(FIXTURES, 'In.toc')
+
+
+class TestArchives(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.files = {
+            'donor/Outlook/Inbox/Index': os.path.join(FIXTURE_FOLDER, 'Index'),
+            'donor/Outlook/Inbox/Mail': os.path.join(FIXTURE_FOLDER, 'Mail'),
+            'donor/Eudora/In.toc': FIXTURE_TOC,
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def make_tar(self, name, mode):
+        path = os.path.join(self.tmpdir, name)
+        tar = tarfile.open(path, mode)
+        for member, filename in sorted(self.files.items()):
+            tar.add(filename, './' + member)
+        tar.close()
+        return path
+
+    def make_zip(self, name, compression):
+        path = os.path.join(self.tmpdir, name)
+        archive = zipfile.ZipFile(path, 'w', compression)
+        for member, filename in sorted(self.files.items()):
+            archive.write(filename, member)
+        archive.close()
+        return path
+
+    def archive_paths(self):
+        return [self.make_tar('bundle.tar', 'w'),
+                self.make_tar('bundle.tar.gz', 'w:gz'),
+                self.make_zip('stored.zip', zipfile.ZIP_STORED),
+                self.make_zip('deflated.zip', zipfile.ZIP_DEFLATED)]
+
+    def test_windows(self):
+        for path in self.archive_paths():
+            archive = archives.Archive(path)
+            self.assertEqual(['donor/Outlook/Inbox/Index',
+                              'donor/Outlook/Inbox/Mail'],
+                             archive.names('donor/Outlook/Inbox/'))
+            self.assertEqual(3, len(archive.names()))
+            stored = path.endswith(('.tar', 'stored.zip'))
+            with open(os.path.join(FIXTURE_FOLDER, 'Mail'), 'rb') as fobj:
+                expected = fobj.read()
+            window = archive.map('donor/Outlook/Inbox/Mail')
+            self.assertEqual(stored, isinstance(window, archives.MapWindow))
+            self.assertEqual(len(expected), len(window))
+            self.assertEqual(expected[100:200], window[100:200])
+            self.assertEqual(expected[:4], window[:4])
+            self.assertEqual(expected[-1], window[-1])
+            self.assertEqual(expected.find(b'Subject', 10),
+                             window.find(b'Subject', 10))
+            self.assertRaises(IndexError, window.__getitem__, len(expected))
+            self.assertRaises(KeyError, archive.map, 'donor/missing')
+            archive.close()
+
+    def test_inflated_window(self):
+        archive = archives.Archive(self.make_zip('deflated.zip',
+                                                 zipfile.ZIP_DEFLATED))
+        window = archive.map('donor/Outlook/Inbox/Mail')
+        window.chunk_size = 16
+        self.assertEqual(4, len(window[:4]))
+        # decompressed only as far as needed
+        self.assertTrue(window.buffered < len(window))
+        window[len(window) - 1]
+        self.assertEqual(len(window), window.buffered)
+
+    def test_folders(self):
+        direct = outlookexpress.MacFolder(FIXTURE_FOLDER)
+        expected = [msg.as_string() for msg in direct.messages]
+        for path in self.archive_paths():
+            folder = outlookexpress.MacFolder('donor/Outlook/Inbox',
+                                              archive=path)
+            self.assertEqual(2, folder.count)
+            self.assertEqual(expected,
+                             [msg.as_string() for msg in folder.messages])
+            self.assertEqual(archives.open_archive(path).member_identity(
+                'donor/Outlook/Inbox/Mail'), folder.data_identity)
+            self.assertRaises(RuntimeError, outlookexpress.MacFolder,
+                              'donor/Eudora', archive=path)
+
+            toc = eudora.Toc(mm=archives.open_archive(path).map(
+                'donor/Eudora/In.toc'))
+            self.assertEqual(['Somebody ', ''], [msg.to for msg in toc.messages])
+
+    def test_open_archive(self):
+        path = self.make_tar('bundle.tar', 'w')
+        archive = archives.open_archive(path)
+        self.assertTrue(archive is archives.open_archive(path))
+        self.assertRaises(ValueError, archives.Archive, FIXTURE_TOC)
+
+        # a changed file is indexed again, and the old archive closed
+        self.files['donor/extra'] = FIXTURE_TOC
+        os.remove(path)
+        self.make_tar('bundle.tar', 'w')
+        os.utime(path, (time.time() + 10, time.time() + 10))
+        replaced = archives.open_archive(path)
+        self.assertFalse(replaced is archive)
+        self.assertEqual(4, len(replaced.names()))
+        self.assertRaises(ValueError, archive.mmap.__getitem__, 0)
+        replaced.close()
+
+    def test_tar_ending_with_zip(self):
+        # an uncompressed tar whose last member is a zip file is a tar
+        zip_path = self.make_zip('last.zip', zipfile.ZIP_STORED)
+        self.files['donor/z.zip'] = zip_path
+        path = self.make_tar('bundle.tar', 'w')
+        archive = archives.Archive(path)
+        self.assertEqual(sorted(self.files), archive.names())
+        folder = outlookexpress.MacFolder('donor/Outlook/Inbox',
+                                          archive=archive)
+        self.assertEqual(2, folder.count)
+        archive.close()
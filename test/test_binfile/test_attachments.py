@@ -0,0 +1,122 @@
+# file test_binfile/test_attachments.py
+#
+#   Copyright 2012 Emory University Libraries
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from eulcommon.binfile import attachments, outlookexpress
+
+
+TEST_ROOT = os.path.dirname(__file__)
+FIXTURE_FOLDER = os.path.join(TEST_ROOT, 'fixtures', 'oemacfolder')
+
+
+class RawMessage(object):
+    # minimal stand-in for MacMailMessage
+    deleted = False
+
+    def __init__(self, data):
+        self.data = data
+
+    def open(self):
+        return io.BytesIO(self.data)
+
+
+class TestAttachmentExtractor(unittest.TestCase):
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        # small chunk size to exercise chunked decoding
+        self.extractor = attachments.AttachmentExtractor(self.output_dir,
+                                                         chunk_size=64)
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def test_extract_message(self):
+        binary_data = ''.join(chr(i % 256) for i in range(5000))
+        text_data = 'caf\xe9 = tr\xe8s bien\n' * 20
+
+        msg = MIMEMultipart()
+        msg['Subject'] = 'attachments'
+        msg.attach(MIMEText('see attached'))
+        msg.attach(MIMEApplication(binary_data, Name='data.bin'))
+        # latin-1 text is quoted-printable encoded
+        text_part = MIMEText(text_data, 'plain', 'latin-1')
+        text_part.add_header('Content-Disposition', 'attachment',
+                             filename='../notes.txt')
+        msg.attach(text_part)
+
+        found = self.extractor.extract_message(RawMessage(msg.as_string()))
+        self.assertEqual(2, len(found))
+
+        binary, text = found
+        self.assertEqual('data.bin', binary.filename)
+        self.assertEqual('application/octet-stream', binary.content_type)
+        self.assertEqual('1.2', binary.part)
+        self.assertEqual(len(binary_data), binary.size)
+        self.assertEqual(hashlib.md5(binary_data).hexdigest(),
+                         binary.checksums['md5'])
+        self.assertEqual(hashlib.sha1(binary_data).hexdigest(),
+                         binary.checksums['sha1'])
+        with open(binary.path, 'rb') as extracted:
+            self.assertEqual(binary_data, extracted.read())
+
+        # path components in attachment names should not escape output dir
+        self.assertEqual(self.output_dir, os.path.dirname(text.path))
+        self.assertEqual('msg-1.3-notes.txt', os.path.basename(text.path))
+        with open(text.path, 'rb') as extracted:
+            self.assertEqual(text_data, extracted.read())
+
+    def test_long_lines(self):
+        # quoted-printable lines of 76 characters, and header lines, longer
+        # than the read size are read in pieces
+        text_data = '\xe9t\xe9 = summer ' * 120
+        msg = MIMEMultipart()
+        msg['Subject'] = 'a subject line much longer than the read size'
+        text_part = MIMEText(text_data, 'plain', 'latin-1')
+        text_part.add_header('Content-Disposition', 'attachment',
+                             filename='a-rather-long-file-name.txt')
+        msg.attach(text_part)
+        data = msg.as_string()
+        self.assertTrue('=E9=\n' in data)
+        self.assertTrue(max(len(line) for line in data.splitlines()) >= 76)
+
+        for chunk_size in range(16, 80):
+            extractor = attachments.AttachmentExtractor(self.output_dir,
+                                                        chunk_size=chunk_size)
+            found = extractor.extract_message(RawMessage(data))
+            self.assertEqual(['a-rather-long-file-name.txt'],
+                             [attachment.filename for attachment in found])
+            with open(found[0].path, 'rb') as extracted:
+                self.assertEqual(text_data, extracted.read(),
+                                 'chunk size %d' % chunk_size)
+
+    def test_no_attachments(self):
+        folder = outlookexpress.MacFolder(FIXTURE_FOLDER)
+        self.assertEqual([], list(self.extractor.extract_folder(folder)))
+        self.assertEqual([], os.listdir(self.output_dir))
+
+
+if __name__ == '__main__':
+    main()
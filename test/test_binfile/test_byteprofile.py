@@ -0,0 +1,107 @@
+# file test_binfile/test_byteprofile.py
+#
+#   Copyright 2012 Emory University Libraries
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import os
+import struct
+import unittest
+
+from eulcommon import binfile
+from eulcommon.binfile import byteprofile, eudora
+
+
+TEST_ROOT = os.path.dirname(__file__)
+def fixture(fname):
+    return os.path.join(TEST_ROOT, 'fixtures', fname)
+
+
+class Record(binfile.BinaryStructure):
+    LENGTH = 12
+    kind = binfile.IntegerField(0, 2)
+    name = binfile.LengthPrependedStringField(8)
+
+
+def records(count):
+    # byte 2 is constant, byte 3 is a flag, bytes 4-7 are a big-endian
+    # counter, and the name uses up to 2 of its 3 bytes; byte 11 is unused
+    data = []
+    for i in range(count):
+        data.append(struct.pack('>HBBIB2sB', i % 5, 0x7f, i % 2, 1000 + i,
+                                2, 'ab', 0))
+    return ''.join(data)
+
+
+class TestProfile(unittest.TestCase):
+
+    def test_field_spans(self):
+        self.assertEqual([(0, 2), (8, 9)], byteprofile.field_spans(Record))
+        table = binfile.RecordTable(Record, records(3))
+        self.assertEqual([(0, 2), (8, 11)],
+                         byteprofile.field_spans(Record, table))
+
+    def test_profile(self):
+        table = binfile.RecordTable(Record, records(1000))
+        # small blocks to exercise accumulating statistics
+        result = byteprofile.profile(table, block_records=64)
+
+        self.assertEqual(1000, result.records)
+        self.assertEqual([(2, 8), (11, 12)], result.gaps)
+        stats = dict((s.offset, s) for s in result.bytes)
+        self.assertEqual(0x7f, stats[2].constant)
+        self.assertEqual(2, stats[3].distinct)
+        self.assertAlmostEqual(1.0, stats[3].entropy)
+        self.assertEqual(0, stats[11].constant)
+
+        candidates = dict(((c.offset, c.width, c.byteorder), c)
+                          for c in result.integers)
+        counter = candidates[(4, 4, 'big')]
+        self.assertEqual((1000, 1999), (counter.minimum, counter.maximum))
+        self.assertTrue(counter.nondecreasing)
+        self.assertEqual(None, counter.timestamp)
+        self.assertFalse(candidates[(4, 4, 'little')].nondecreasing)
+        # constant ranges are not reported as integer candidates
+        self.assertFalse((10, 2, 'big') in candidates)
+
+        report = result.report()
+        self.assertTrue('byte   2: constant 0x7f' in report)
+        self.assertTrue('4-byte big-endian int at 4: 1000..1999 (non-decreasing)'
+                        in report)
+
+    def test_timestamp(self):
+        # Mac epoch seconds for 1998
+        data = ''.join(struct.pack('>HBBIB2sB', 0, 0, 0, 2966000000 + i * 60,
+                                   0, '', 0) for i in range(10))
+        result = byteprofile.profile(binfile.RecordTable(Record, data))
+        candidates = dict(((c.offset, c.width, c.byteorder), c)
+                          for c in result.integers)
+        self.assertEqual('mac', candidates[(4, 4, 'big')].timestamp)
+
+    def test_unsupported_width(self):
+        table = binfile.RecordTable(Record, '\0' * 24)
+        self.assertRaises(ValueError, byteprofile.profile, table, widths=(3,))
+
+    def test_eudora(self):
+        toc = eudora.Toc(fixture('In.toc'))
+        result = byteprofile.profile(toc.messages)
+        self.assertEqual(2, result.records)
+        offsets = [s.offset for s in result.bytes]
+        # declared fields are not profiled
+        for offset in (0, 7, 12, 13, 62, 78, 142):
+            self.assertFalse(offset in offsets)
+        self.assertTrue(100 in offsets)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+# file test_binfile/test_conversations.py
+#
+#   Copyright 2012 Emory University Libraries
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from eulcommon import binfile
+from eulcommon.binfile import conversations, eudora, outlookexpress
+
+TEST_ROOT = os.path.dirname(__file__)
+FIXTURE_FOLDER = os.path.join(TEST_ROOT, 'fixtures', 'oemacfolder')
+
+
+def header(msgid, subject, references=None, in_reply_to=None):
+    lines = ['From: someone@example.com', 'Message-ID: <%s>' % msgid,
+             'Subject: %s' % subject]
+    if references:
+        lines.append('References: %s' % '\r\n\t'.join('<%s>' % ref
+                                                      for ref in references))
+    if in_reply_to:
+        lines.append('In-Reply-To: <%s>' % in_reply_to)
+    return '\r\n'.join(lines) + '\r\n\r\nbody\r\nMessage-ID: <ignored>\r\n'
+
+
+class TestParsing(unittest.TestCase):
+
+    def test_parse_headers(self):
+        self.assertEqual(('c@x', ['a@x', 'b@x'], 'Re: hello'),
+                         conversations.parse_headers(
+                             header('c@x', 'Re: hello', ['a@x', 'b@x'], 'b@x')))
+        # in-reply-to is added after the references
+        self.assertEqual(('c@x', ['a@x', 'b@x'], 'hi'),
+                         conversations.parse_headers(
+                             header('c@x', 'hi', ['a@x'], 'b@x')))
+        # classic Mac line endings, folded subject, no message id
+        self.assertEqual((None, [], 'one two'),
+                         conversations.parse_headers(
+                             'Subject: one\r two\rFrom: x\r\rMessage-ID: <no>'))
+
+    def test_base_subject(self):
+        self.assertEqual(('hello there', True),
+                         conversations.base_subject('Re: RE[2]: Fwd:  Hello\tthere'))
+        self.assertEqual(('hello', False), conversations.base_subject('Hello'))
+        self.assertEqual(('', False), conversations.base_subject(None))
+
+
+class TestThreader(unittest.TestCase):
+
+    def test_threads(self):
+        threader = conversations.Threader()
+        messages = [
+            header('a', 'Plans'),
+            header('b', 'Re: Plans', ['a']),
+            header('c', 'Other'),
+            # parent d is missing; e and f are siblings under a placeholder
+            header('e', 'Re: Lost', ['d']),
+            header('f', 'Re: Lost', ['d']),
+            header('g', 'Re: Plans', ['a', 'b']),
+            # no references, but the same subject as thread a
+            header('h', 'Re: plans'),
+            # duplicate message id
+            header('a', 'Plans'),
+        ]
+        for i, data in enumerate(messages):
+            threader.add_headers(i * 10, data)
+        threads = threader.threads()
+        self.assertEqual([[0, 10, 50, 60, 70], [20], [30, 40]], list(threads))
+        self.assertEqual(3, len(threads))
+        self.assertEqual(None, threads.parent_of(70))
+        self.assertEqual(None, threads.parent_of(0))
+        self.assertEqual(0, threads.parent_of(10))
+        self.assertEqual(10, threads.parent_of(50))
+        self.assertEqual(0, threads.parent_of(60))
+        self.assertEqual(None, threads.parent_of(30))
+        self.assertEqual(None, threads.parent_of(40))
+        self.assertEqual(threads.thread_of(30), threads.thread_of(40))
+        self.assertRaises(KeyError, threads.parent_of, 5)
+
+    def test_loops(self):
+        threader = conversations.Threader(group_by_subject=False)
+        threader.add(0, 'a', ['b'])
+        threader.add(1, 'b', ['a'])
+        threads = threader.threads()
+        self.assertEqual(1, len(threads))
+        self.assertEqual(1, threads.parent_of(0))
+        self.assertEqual(None, threads.parent_of(1))
+
+    def test_reply_before_original(self):
+        threader = conversations.Threader()
+        threader.add(0, 'x', [], 'Re: News')
+        threader.add(1, 'y', [], 'News')
+        threads = threader.threads()
+        self.assertEqual([[0, 1]], list(threads))
+        self.assertEqual(1, threads.parent_of(0))
+
+
+class TestFolders(unittest.TestCase):
+
+    def test_macfolder(self):
+        folder = outlookexpress.MacFolder(FIXTURE_FOLDER)
+        headers = list(conversations.macfolder_headers(folder))
+        self.assertEqual([0, 1], [i for i, data in headers])
+        self.assertTrue(headers[0][1].startswith('X-Mailer'))
+        threads = conversations.thread_macfolder(folder)
+        self.assertEqual([[0], [1]], list(threads))
+
+    def test_eudora(self):
+        messages = [header('a', 'Hi'), header('b', 'Re: Hi', ['a'])]
+        data = ''.join(messages)
+        tmpdir = tempfile.mkdtemp()
+        try:
+            data_path = os.path.join(tmpdir, 'In')
+            with open(data_path, 'wb') as out:
+                out.write(data)
+            body_offsets = [msg.index('\r\n\r\n') + 4 for msg in messages]
+            table = binfile.pack_table(eudora.Message, columns={
+                'offset': [0, len(messages[0])],
+                'size': [len(msg) for msg in messages],
+                'body_offset': body_offsets})
+            with open(data_path + '.toc', 'wb') as out:
+                out.write(eudora.Toc.pack(version=1, name='In'))
+                out.write(table)
+            threads = conversations.thread_eudora(data_path + '.toc')
+            self.assertEqual([[0, 1]], list(threads))
+            self.assertEqual(0, threads.parent_of(1))
+        finally:
+            shutil.rmtree(tmpdir)
@@ -16,11 +16,14 @@
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
 
+import io
 import unittest
 import os
 import mmap
+import tempfile
 
 from eulcommon import binfile
+from eulcommon.binfile import eudora
 
 
 TEST_ROOT = os.path.dirname(__file__)
@@ -79,5 +82,250 @@ class FieldTest(unittest.TestCase):
         self.assertEqual(self.offset_obj.int, 772)
 
 
+class CodeObject(binfile.BinaryStructure):
+    LENGTH = 2
+    kind = binfile.EnumField(0, 1, {0: 'zero', 2: 'two'})
+    pair = binfile.EnumField(0, 2, {'\x00\x01': 'first'})
+    flags = binfile.FlagField(1, 2, {'one': 0x01, 'two': 0x02, 'four': 0x04})
+    value = binfile.IntegerField(0, 2)
+    raw = binfile.ByteField(0, 1)
+
+
+class StringObject(binfile.BinaryStructure):
+    LENGTH = 6
+    text = binfile.LengthPrependedStringField(1)
+
+
+class CodeFieldTest(unittest.TestCase):
+    def setUp(self):
+        fname = fixture('numbers.bin')
+        self.obj = CodeObject(fname)
+        self.table = binfile.RecordTable(CodeObject, self.obj.mmap)
+
+    def test_enum(self):
+        self.assertEqual('zero', self.obj.kind)
+        self.assertEqual('first', self.obj.pair)
+        # unnamed codes are returned as numbers
+        self.assertEqual(4, self.table[2].kind)
+
+    def test_flags(self):
+        self.assertEqual(frozenset(['one']), self.obj.flags)
+        self.assertEqual(frozenset(['one', 'two']), self.table[1].flags)
+        self.assertEqual(frozenset(['one', 'two', 'four']), self.table[3].flags)
+
+    def test_columns(self):
+        # records are 0001, 0203, 0405, 0607
+        self.assertEqual([1, 515, 1029, 1543], list(self.table.column('value')))
+        self.assertEqual(['zero', 'two', 4, 6], self.table.column('kind'))
+        self.assertEqual(['\x02', '\x04'], self.table.column('raw', 1, 3))
+        self.assertEqual(['two', 4], self.table.column('kind', 1, 3))
+        self.assertEqual([frozenset(['one']), frozenset(['one', 'two'])],
+                         self.table.column('flags', 0, 2))
+
+    def test_string_column(self):
+        table = binfile.RecordTable(StringObject, binfile.pack_table(
+            StringObject, columns={'text': ['', 'ab', 'xyz']}))
+        self.assertEqual(['', 'ab', 'xyz'], table.column('text'))
+        self.assertEqual(['ab'], table.column('text', 1, 2))
+
+    def test_counts(self):
+        self.assertEqual({'zero': 1, 'two': 1, 4: 1, 6: 1},
+                         CodeObject.kind.counts(self.table))
+        self.assertEqual({'first': 1, 515: 1, 1029: 1, 1543: 1},
+                         CodeObject.pair.counts(self.table))
+        self.assertEqual({'one': 4, 'two': 2, 'four': 2},
+                         CodeObject.flags.counts(self.table))
+
+
+class ChainObject(binfile.BinaryStructure):
+    prepended = binfile.StringChainField(0, count=3)
+    second = prepended.item(1)
+    missing = prepended.item(3)
+    terminated = binfile.StringChainField(0, terminator='\x03')
+
+
+class StringChainFieldTest(unittest.TestCase):
+    def setUp(self):
+        self.obj = ChainObject(fixture('numbers.bin'))
+
+    def test_prepended(self):
+        # lengths 0, 1, and 3 at offsets 0, 1, and 3
+        self.assertEqual(['', '\x02', '\x04\x05\x06'],
+                         list(self.obj.prepended))
+        self.assertEqual(3, len(self.obj.prepended))
+        self.assertEqual('\x04\x05\x06', self.obj.prepended[-1])
+        self.assertEqual(7, self.obj.prepended.end)
+        self.assertRaises(IndexError, lambda: self.obj.prepended[3])
+
+    def test_items(self):
+        self.assertEqual('\x02', self.obj.second)
+        self.assertEqual(None, self.obj.missing)
+
+    def test_memoized(self):
+        chain = self.obj.prepended
+        self.assertTrue(chain is self.obj.prepended)
+        chain[2]
+        # offsets of resolved strings are remembered
+        self.assertEqual(3, len(chain._spans))
+
+    def test_terminated(self):
+        self.assertEqual(['\x00\x01\x02', '\x04\x05\x06\x07'],
+                         list(self.obj.terminated))
+        self.assertEqual(8, self.obj.terminated.end)
+
+
+class CachedObject(binfile.BinaryStructure):
+    __slots__ = ()
+    str = binfile.cached_field(binfile.LengthPrependedStringField(2))
+    int = binfile.cached_field(binfile.IntegerField(2, 4))
+    chain = binfile.StringChainField(0, count=2)
+
+
+class CachedFieldTest(unittest.TestCase):
+    def setUp(self):
+        self.data = self.map_data('\x00\x01\x02\x03\x04\x05')
+        self.obj = CachedObject(mm=self.data)
+
+    def map_data(self, data):
+        mm = mmap.mmap(-1, len(data))
+        mm[:] = data
+        return mm
+
+    def test_cached(self):
+        self.assertEqual('\x03\x04', self.obj.str)
+        self.assertEqual(0x0203, self.obj.int)
+        # values are remembered, even if the data changes underneath
+        self.data[2] = '\x01'
+        self.assertEqual('\x03\x04', self.obj.str)
+        self.assertEqual(0x0203, self.obj.int)
+        # replacing the map discards remembered values
+        self.obj.mmap = self.map_data(self.data[:])
+        self.assertEqual('\x03', self.obj.str)
+        self.assertEqual(0x0103, self.obj.int)
+
+    def test_chain_invalidated(self):
+        chain = self.obj.chain
+        self.assertTrue(chain is self.obj.chain)
+        self.obj.mmap = self.map_data(self.data[:])
+        self.assertFalse(chain is self.obj.chain)
+
+    def test_field_class(self):
+        self.assertTrue(isinstance(CachedObject.int, binfile.IntegerField))
+        self.assertTrue(CachedObject.int is binfile.cached_field(CachedObject.int))
+        self.assertEqual([0x0203], list(CachedObject.int.column(
+            binfile.RecordTable(CachedObject, self.data, length=6))))
+
+    def test_slots(self):
+        self.assertFalse(hasattr(self.obj, '__dict__'))
+        self.assertRaises(AttributeError, setattr, self.obj, 'other', 1)
+
+
+class PackTest(unittest.TestCase):
+
+    def test_pack_fields(self):
+        buf = bytearray(8)
+        TestObject.pack_into(buf, 1, {'byte': '\x07', 'int': 772})
+        self.assertEqual('\x00\x07\x00\x03\x04\x00\x00\x00', str(buf))
+        self.assertRaises(ValueError, TestObject.int.pack, buf, 0, 65536)
+        self.assertRaises(ValueError, TestObject.byte.pack, buf, 0, 'abc')
+        # fields may not write past the end of the buffer
+        self.assertRaises(ValueError, TestObject.int.pack, buf, 6, 1)
+        self.assertEqual(8, len(buf))
+        self.assertRaises(TypeError, TestObject.pack_into, buf, 0, {'nope': 1})
+
+    def test_pack_codes(self):
+        data = CodeObject.pack(kind='two', flags=['one', 'four'])
+        obj = CodeObject(mm=data)
+        self.assertEqual('two', obj.kind)
+        self.assertEqual(frozenset(['one', 'four']), obj.flags)
+        self.assertEqual('\x05\x06', CodeObject.pack(kind=5, flags=6))
+
+    def test_pack_chain(self):
+        buf = bytearray(16)
+        ChainObject.prepended.pack(buf, 0, ['a', 'bc'])
+        self.assertEqual('\x01a\x02bc', str(buf[:5]))
+        obj = ChainObject(mm=str(buf))
+        self.assertEqual('bc', obj.second)
+
+    def test_serialize(self):
+        msg = eudora.Toc(fixture('In.toc')).messages[0]
+        data = msg.serialize()
+        self.assertEqual(eudora.Message.LENGTH, len(data))
+        self.assertEqual(msg.subject, eudora.Message(mm=data).subject)
+        changed = eudora.Message(mm=msg.serialize(size=99, subject='Hello'))
+        self.assertEqual(99, changed.size)
+        self.assertEqual('Hello', changed.subject)
+        self.assertEqual(msg.to, changed.to)
+
+    def test_pack_table(self):
+        columns = {'offset': [0, 100, 250], 'size': [100, 150, 70000],
+                   'status_name': ['read', 1, 'read'],
+                   'subject': ['one', 'two', 'three']}
+        packed = binfile.pack_table(eudora.Message, columns=columns)
+        rows = [dict((name, values[i]) for name, values in columns.items())
+                for i in range(3)]
+        self.assertEqual(packed, binfile.pack_table(eudora.Message, rows=rows))
+        # rows with no length are counted as they are packed
+        self.assertEqual(packed, binfile.pack_table(eudora.Message,
+                                                    rows=iter(rows)))
+        self.assertEqual(bytearray(b'xy') + packed,
+                         binfile.pack_table(eudora.Message,
+                                            rows=(row for row in rows),
+                                            buf=bytearray(b'xy') +
+                                            bytearray(len(packed)),
+                                            offset=2))
+
+        # write a complete index file and read it back
+        toc_file = tempfile.NamedTemporaryFile(suffix='.toc')
+        toc_file.write(eudora.Toc.pack(version=1, name='Synthetic'))
+        toc_file.write(packed)
+        toc_file.flush()
+        toc = eudora.Toc(toc_file.name)
+        self.assertEqual('Synthetic', toc.name)
+        self.assertEqual(3, len(toc.messages))
+        self.assertEqual([100, 150, 70000], list(toc.messages.column('size')))
+        self.assertEqual('three', toc.messages[2].subject)
+        self.assertEqual({'read': 2, 1: 1}, toc.status_counts())
+
+    def test_pack_table_errors(self):
+        self.assertRaises(ValueError, binfile.pack_table, eudora.Message,
+                          columns={'offset': [1, 2], 'size': [1]})
+        self.assertRaises(ValueError, binfile.pack_table, eudora.Message,
+                          columns={'body_offset': [-1]})
+        self.assertRaises(ValueError, binfile.pack_table, eudora.Message,
+                          rows=iter([{'size': 1}]), count=0)
+        self.assertRaises(ValueError, binfile.pack_table, eudora.Message,
+                          rows=iter([{'size': 1}]), buf=bytearray(10))
+
+
+class RegionReaderTest(unittest.TestCase):
+    def setUp(self):
+        obj = binfile.BinaryStructure(fixture('numbers.bin'))
+        self.reader = binfile.RegionReader(obj.mmap, 2, 6)
+
+    def test_read(self):
+        self.assertEqual(self.reader.read(3), '\x02\x03\x04')
+        self.assertEqual(self.reader.read(3), '\x05')
+        self.assertEqual(self.reader.read(3), '')
+        self.assertEqual(4, len(self.reader))
+
+    def test_seek(self):
+        self.assertEqual(self.reader.read(), '\x02\x03\x04\x05')
+        self.reader.seek(1)
+        self.assertEqual(1, self.reader.tell())
+        self.assertEqual(self.reader.read(1), '\x03')
+        self.reader.seek(-1, io.SEEK_END)
+        self.assertEqual(self.reader.read(), '\x05')
+        self.assertRaises(ValueError, self.reader.seek, -1)
+
+    def test_buffered(self):
+        buffered = io.BufferedReader(self.reader, 2)
+        self.assertEqual(buffered.read(), '\x02\x03\x04\x05')
+
+    def test_closed(self):
+        self.reader.close()
+        self.assertRaises(ValueError, self.reader.read)
+
+
 if __name__ == '__main__':
     main()
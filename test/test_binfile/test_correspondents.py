@@ -0,0 +1,136 @@
+# file test_binfile/test_correspondents.py
+#
+#   Copyright 2012 Emory University Libraries
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from eulcommon import binfile
+from eulcommon.binfile import correspondents, eudora
+
+TEST_ROOT = os.path.dirname(__file__)
+FIXTURE_FOLDER = os.path.join(TEST_ROOT, 'fixtures', 'oemacfolder')
+
+
+class TestAddresses(unittest.TestCase):
+
+    def test_normalize(self):
+        self.assertEqual('somebody@example.com', correspondents.normalize_address(
+            '"Somebody" <SomeBody@Example.COM>'))
+        self.assertEqual('jane q', correspondents.normalize_address(
+            ' "Jane  Q" '))
+        self.assertEqual(None, correspondents.normalize_address(' '))
+
+    def test_split(self):
+        self.assertEqual(('a@example.com', 'b@example.com'),
+                         correspondents.split_addresses(
+                             'A <a@example.com>, b@example.com, A@example.com'))
+        self.assertEqual((), correspondents.split_addresses(''))
+        self.assertEqual((), correspondents.split_addresses(None))
+        self.assertEqual(None, correspondents.normalize_address(None))
+
+
+class TestCorrespondentIndex(unittest.TestCase):
+
+    def test_add(self):
+        index = correspondents.CorrespondentIndex()
+        index.add('A <a@example.com>', 'b@example.com, c@example.com',
+                  date=100)
+        index.add('a@EXAMPLE.com', ['B <b@example.com>'], date=50)
+        index.add('a@example.com', 'b@example.com')
+        index.add('', 'b@example.com')
+        self.assertEqual(3, index.messages)
+        self.assertEqual(2, len(index))
+        self.assertEqual(3, index.count('a@example.com', 'b@example.com'))
+        self.assertEqual(0, index.count('b@example.com', 'a@example.com'))
+        self.assertEqual([('a@example.com', 'b@example.com', 3, 50, 100),
+                          ('a@example.com', 'c@example.com', 1, 100, 100)],
+                         list(index.edges()))
+
+        out = StringIO()
+        index.add('c@example.com', 'a@example.com')
+        index.write_edges(out)
+        self.assertEqual(
+            'sender\trecipient\tcount\tfirst\tlast\n'
+            'a@example.com\tb@example.com\t3\t1970-01-01T00:00:50Z\t'
+            '1970-01-01T00:01:40Z\n'
+            'a@example.com\tc@example.com\t1\t1970-01-01T00:01:40Z\t'
+            '1970-01-01T00:01:40Z\n'
+            'c@example.com\ta@example.com\t1\t\t\n', out.getvalue())
+
+    def test_macfolder(self):
+        index = correspondents.CorrespondentIndex()
+        self.assertEqual(2, correspondents.add_macfolder(index, FIXTURE_FOLDER))
+        self.assertEqual([('somebody@example.com', 'someone@nowhere.org',
+                           2, None, None)], list(index.edges()))
+
+    def test_truncated_macfolder(self):
+        # the second summary is cut off before its sender and recipient
+        tmpdir = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(FIXTURE_FOLDER, 'Index'), 'rb') as fobj:
+                data = fobj.read()
+            with open(os.path.join(tmpdir, 'Index'), 'wb') as out:
+                out.write(data[:202])
+            index = correspondents.CorrespondentIndex()
+            self.assertEqual(1, correspondents.add_macfolder(index, tmpdir))
+            self.assertEqual([('somebody@example.com', 'someone@nowhere.org',
+                               1, None, None)], list(index.edges()))
+            index.add('a@example.com', ['b@example.com', None])
+            self.assertEqual(1, index.count('a@example.com', 'b@example.com'))
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_eudora(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            toc_path = os.path.join(tmpdir, 'In.toc')
+            table = binfile.pack_table(eudora.Message, rows=[
+                {'status': b'\x02', 'to': 'Friend <friend@example.com>',
+                 'date': 'Sun, 16 Jun 1996 10:10:00 +0100'},
+                {'status': b'\x09', 'to': 'friend@example.com',
+                 'date': 'Mon, 17 Jun 1996 09:00:00 +0000'},
+                {'status': b'\x02', 'to': 'Friend <friend@example.com>',
+                 'date': 'garbage'},
+                {'status': b'\x02', 'to': ''}])
+            with open(toc_path, 'wb') as out:
+                out.write(eudora.Toc.pack(version=1, name='In'))
+                out.write(table)
+            index = correspondents.CorrespondentIndex()
+            self.assertEqual(3, correspondents.add_eudora(
+                index, toc_path, owner='Donor <donor@example.edu>',
+                outgoing=[9]))
+            self.assertEqual(
+                [('friend@example.com', 'donor@example.edu', 2,
+                  834916200, 834916200),
+                 ('donor@example.edu', 'friend@example.com', 1,
+                  835002000, 835002000)],
+                list(index.edges()))
+            self.assertRaises(ValueError, correspondents.add_eudora,
+                              index, toc_path, owner='', outgoing=[9])
+            # with no outgoing statuses, every message is incoming
+            index = correspondents.CorrespondentIndex()
+            correspondents.add_eudora(index, toc_path, owner='donor@example.edu',
+                                      outgoing=())
+            self.assertEqual([('friend@example.com', 'donor@example.edu', 3,
+                               834916200, 835002000)], list(index.edges()))
+        finally:
+            shutil.rmtree(tmpdir)
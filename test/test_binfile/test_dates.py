@@ -0,0 +1,99 @@
+# file test_binfile/test_dates.py
+#
+#   Copyright 2012 Emory University Libraries
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+from email.utils import mktime_tz, parsedate_tz
+import mmap
+import unittest
+
+from eulcommon import binfile
+from eulcommon.binfile import dates, eudora
+
+DATES = [
+    'Sun, 16 Jun 1996 10:10:00 +0100',
+    '16 Jun 96 10:10 -0500',
+    'Mon, 1 Jul 1996 09:00:00 GMT',
+    'Tue, 31 Dec 2002 23:59:59 -0000',
+    'Wed, 2 Oct 2002 08:00:00 EST',
+    'Wed, 02-Oct-2002 13:00:00 UT',
+]
+
+
+class TestDateParser(unittest.TestCase):
+
+    def test_parse(self):
+        parser = dates.DateParser()
+        for value in DATES:
+            self.assertEqual(mktime_tz(parsedate_tz(value)),
+                             parser.parse(value), value)
+            # remembered
+            self.assertEqual(mktime_tz(parsedate_tz(value)),
+                             parser.parse(value), value)
+        # no zone is taken as UTC
+        self.assertEqual(834917400, parser.parse('16 Jun 1996 09:30:00'))
+        self.assertEqual(None, parser.parse(''))
+        self.assertEqual(None, parser.parse('garbage'))
+        self.assertEqual(None, parser.parse('16:6:96 +0100:10:10 1996'))
+
+    def test_max_entries(self):
+        parser = dates.DateParser(max_entries=2)
+        for value in DATES:
+            parser.parse(value)
+        self.assertTrue(len(parser._values) <= 2)
+
+
+class TestColumns(unittest.TestCase):
+
+    def setUp(self):
+        values = ['Mon, 1 Jul 1996 09:00:00 GMT', '',
+                  'Sun, 16 Jun 1996 10:10:00 +0100', '16 Jun 96 10:10 -0500', 'Tue, 31 Dec 2002 23:59:59 -0000']
+        data = binfile.pack_table(eudora.Message, columns={'date': values})
+        self.map = mmap.mmap(-1, len(data))
+        self.map.write(bytes(data))
+        self.table = binfile.RecordTable(eudora.Message, self.map)
+
+    def tearDown(self):
+        self.map.close()
+
+    def test_parse_column(self):
+        times = dates.parse_column(self.table)
+        self.assertEqual([836211600, dates.UNKNOWN, 834916200, 834937800,
+                          1041379199], list(times))
+        self.assertEqual([834916200, 834937800],
+                         list(dates.parse_column(self.table, start=2, stop=4)))
+
+    def test_date_order(self):
+        times = dates.parse_column(self.table)
+        self.assertEqual([2, 3, 0, 4, 1], list(dates.date_order(times)))
+        self.assertEqual([4, 0, 3, 2, 1],
+                         list(dates.date_order(times, reverse=True)))
+
+    def test_timeline(self):
+        timeline = dates.Timeline()
+        timeline.add(dates.parse_column(self.table))
+        self.assertEqual(4, len(timeline))
+        self.assertEqual(1, timeline.unknown)
+        self.assertEqual([('1996', 3), ('2002', 1)], timeline.counts('year'))
+        self.assertEqual([('1996-06', 2), ('1996-07', 1), ('2002-12', 1)],
+                         timeline.counts())
+        self.assertEqual([('1996-06-16', 2), ('1996-07-01', 1),
+                          ('2002-12-31', 1)], timeline.counts('day'))
+        self.assertRaises(ValueError, timeline.counts, 'week')
+
+        collection = dates.Timeline()
+        collection.update(timeline)
+        collection.update(timeline)
+        self.assertEqual([('1996', 6), ('2002', 2)], collection.counts('year'))
+        self.assertEqual(2, collection.unknown)
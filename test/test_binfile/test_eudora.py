@@ -49,6 +49,18 @@ class TestEudora(unittest.TestCase):
         # in this case it is.
         self.assertEqual(messages[1].offset, 1732)
 
+    def test_status(self):
+        obj = eudora.Toc(fixture('In.toc'))
+        messages = obj.messages
+        self.assertEqual('read', messages[0].status_name)
+        self.assertEqual('unset', messages[0].priority_name)
+        self.assertEqual({'read': 2}, obj.status_counts())
+        # codes not verified against sample folders are left as numbers
+        msg = eudora.Message(mm=messages[0].serialize(status_name=9,
+                                                      priority_name=3))
+        self.assertEqual((9, 3), (msg.status_name, msg.priority_name))
+        self.assertEqual([1732, 2339], list(messages.column('size')))
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,123 @@
+# file test_binfile/test_extract.py
+#
+#   Copyright 2012 Emory University Libraries
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from eulcommon import binfile
+from eulcommon.binfile import eudora, extract
+
+TEST_ROOT = os.path.dirname(__file__)
+FIXTURE_FOLDER = os.path.join(TEST_ROOT, 'fixtures', 'oemacfolder')
+
+
+class TestBatchExtractor(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.source = os.path.join(self.tmpdir, 'source')
+        self.output = os.path.join(self.tmpdir, 'output')
+        shutil.copytree(FIXTURE_FOLDER,
+                        os.path.join(self.source, 'Outlook', 'Inbox'))
+        eudora_dir = os.path.join(self.source, 'Eudora')
+        os.makedirs(eudora_dir)
+        self.messages = ['From ???@??? Mon Jan 01 00:00:00 1996\r'
+                         'Subject: %d\r\rmessage %d\r' % (i, i)
+                         for i in range(7)]
+        with open(os.path.join(eudora_dir, 'In'), 'wb') as out:
+            out.write(''.join(self.messages))
+        table = binfile.pack_table(eudora.Message, columns={
+            'offset': [sum(len(msg) for msg in self.messages[:i])
+                       for i in range(len(self.messages))],
+            'size': [len(msg) for msg in self.messages]})
+        with open(os.path.join(eudora_dir, 'In.toc'), 'wb') as out:
+            out.write(eudora.Toc.pack(version=1, name='In'))
+            out.write(table)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def outputs(self):
+        found = []
+        for path, dirs, files in os.walk(self.output):
+            found.extend(os.path.relpath(os.path.join(path, name), self.output)
+                         for name in files)
+        return sorted(found)
+
+    def test_find_folders(self):
+        self.assertEqual(
+            [(extract.EUDORA, os.path.join(self.source, 'Eudora', 'In.toc')),
+             (extract.OUTLOOK_EXPRESS,
+              os.path.join(self.source, 'Outlook', 'Inbox'))],
+            extract.find_folders(self.source))
+        self.assertEqual(
+            [os.path.join('Eudora', 'In'), os.path.join('Outlook', 'Inbox')],
+            [extract.folder_name(kind, path, self.source)
+             for kind, path in extract.find_folders(self.source)])
+
+    def test_run_and_resume(self):
+        progress = StringIO()
+        extractor = extract.BatchExtractor(self.source, self.output,
+                                           processes=0, batch_size=3,
+                                           progress=progress)
+        journal = extractor.run()
+        self.assertEqual(9, journal.messages)
+        expected = [extract.JOURNAL_NAME] + \
+            [os.path.join('Eudora', 'In', '%d.eml' % i) for i in range(7)] + \
+            [os.path.join('Outlook', 'Inbox', '%d.eml' % i) for i in range(2)]
+        self.assertEqual(sorted(expected), self.outputs())
+        with open(os.path.join(self.output, 'Eudora', 'In', '4.eml')) as eml:
+            self.assertEqual(self.messages[4], eml.read())
+        self.assertTrue('9 messages in folders, 9 to extract' in
+                        progress.getvalue())
+        self.assertTrue('9/9 messages (100.0%)' in progress.getvalue())
+
+        # lose the record of one batch, and leave a partly written line
+        journal_path = os.path.join(self.output, extract.JOURNAL_NAME)
+        with open(journal_path) as journal_file:
+            lines = journal_file.readlines()
+        lines = [line for line in lines if not line.startswith(
+            'done\t%s\t3\t6' % os.path.join('Eudora', 'In'))]
+        with open(journal_path, 'w') as journal_file:
+            journal_file.write(''.join(lines) + 'done\tEud')
+        for i in (0, 4):
+            os.remove(os.path.join(self.output, 'Eudora', 'In', '%d.eml' % i))
+
+        # a different batch size is ignored when resuming
+        journal = extract.BatchExtractor(self.source, self.output,
+                                         processes=0, batch_size=5).run()
+        self.assertEqual(3, journal.batch_size)
+        self.assertEqual(9, journal.messages)
+        # only the missing batch was extracted again
+        outputs = self.outputs()
+        self.assertTrue(os.path.join('Eudora', 'In', '4.eml') in outputs)
+        self.assertFalse(os.path.join('Eudora', 'In', '0.eml') in outputs)
+        with open(journal_path) as journal_file:
+            self.assertEqual(len(lines) + 1, len(journal_file.readlines()))
+
+    def test_main(self):
+        self.assertEqual(0, extract.main([self.source, self.output, '-q',
+                                          '-j', '2', '--batch-size', '4']))
+        self.assertEqual(10, len(self.outputs()))
+        # nothing left to do
+        self.assertEqual(0, extract.main([self.source, self.output, '-q']))
+        self.assertEqual(10, len(self.outputs()))
@@ -0,0 +1,122 @@
+# file test_binfile/test_fixity.py
+#
+#   Copyright 2012 Emory University Libraries
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import hashlib
+import os
+from StringIO import StringIO
+import threading
+import unittest
+
+from eulcommon.binfile import fixity, BinaryStructure
+
+
+TEST_ROOT = os.path.dirname(__file__)
+def fixture(fname):
+    return os.path.join(TEST_ROOT, 'fixtures', fname)
+
+FIXTURE_FOLDER = fixture('oemacfolder')
+
+
+def file_digest(path, algorithm, offset=0, size=None):
+    with open(path, 'rb') as fobj:
+        data = fobj.read()
+    end = len(data) if size is None else offset + size
+    return hashlib.new(algorithm, data[offset:end]).hexdigest()
+
+
+class TestChecksumRange(unittest.TestCase):
+
+    def test_checksum_range(self):
+        mm = BinaryStructure(fixture('numbers.bin')).mmap
+        # chunk size smaller than range to exercise chunking
+        checksums = fixity.checksum_range(mm, 1, 5, chunk_size=2)
+        self.assertEqual(set(fixity.DEFAULT_ALGORITHMS), set(checksums))
+        for algorithm in fixity.DEFAULT_ALGORITHMS:
+            self.assertEqual(hashlib.new(algorithm, mm[1:6]).hexdigest(),
+                             checksums[algorithm])
+
+
+class TestFixityCalculator(unittest.TestCase):
+
+    def setUp(self):
+        self.calculator = fixity.FixityCalculator(threads=2)
+
+    def test_macfolder_fixity(self):
+        records = list(self.calculator.macfolder_fixity(FIXTURE_FOLDER))
+        # Index, Mail, and two messages
+        self.assertEqual(4, len(records))
+
+        index, mail, msg1, msg2 = records
+        index_path = os.path.join(FIXTURE_FOLDER, 'Index')
+        mail_path = os.path.join(FIXTURE_FOLDER, 'Mail')
+        self.assertEqual(index_path, index.path)
+        self.assertEqual(None, index.message)
+        self.assertEqual(os.path.getsize(index_path), index.size)
+        self.assertEqual(file_digest(index_path, 'sha256'),
+                         index.checksums['sha256'])
+        self.assertEqual(file_digest(mail_path, 'md5'),
+                         mail.checksums['md5'])
+
+        self.assertEqual(0, msg1.message)
+        self.assertEqual((24, 392), (msg1.offset, msg1.size))
+        self.assertEqual(file_digest(mail_path, 'sha1', 24, 392),
+                         msg1.checksums['sha1'])
+        self.assertEqual(1, msg2.message)
+
+    def test_toc_fixity(self):
+        # no data file for the fixture toc; only the toc itself
+        records = list(self.calculator.toc_fixity(fixture('In.toc')))
+        self.assertEqual(1, len(records))
+        self.assertEqual(file_digest(fixture('In.toc'), 'md5'),
+                         records[0].checksums['md5'])
+
+    def test_messages_fixity_bounded(self):
+        mail_path = os.path.join(FIXTURE_FOLDER, 'Mail')
+        drawn = []
+
+        class Message(object):
+            offset, size = 24, 392
+
+        def messages():
+            for i in range(1000):
+                drawn.append(i)
+                yield Message()
+
+        threads = threading.active_count()
+        records = self.calculator.messages_fixity(mail_path, messages())
+        first = next(records)
+        self.assertEqual(file_digest(mail_path, 'md5', 24, 392),
+                         first.checksums['md5'])
+        # only a window of jobs has been read from the messages
+        self.assert_(len(drawn) <= 2 * fixity.JOBS_PER_THREAD + 1)
+        # stopping early waits for the pool before the map is closed
+        records.close()
+        self.assertEqual(threads, threading.active_count())
+
+    def test_write_manifest(self):
+        output = StringIO()
+        records = self.calculator.macfolder_fixity(FIXTURE_FOLDER)
+        self.assertEqual(4, fixity.write_manifest(records, output))
+        lines = output.getvalue().splitlines()
+        self.assertEqual('path\tmessage\toffset\tsize\tmd5\tsha1\tsha256',
+                         lines[0])
+        fields = lines[3].split('\t')
+        self.assertEqual(['0', '24', '392'], fields[1:4])
+        self.assertEqual(64, len(fields[6]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+# file test_binfile/test_manifest.py
+#
+#   Copyright 2012 Emory University Libraries
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import csv
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from eulcommon import binfile
+from eulcommon.binfile import eudora, manifest
+
+TEST_ROOT = os.path.dirname(__file__)
+FIXTURE_FOLDER = os.path.join(TEST_ROOT, 'fixtures', 'oemacfolder')
+
+
+class TestManifest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.source = os.path.join(self.tmpdir, 'source')
+        shutil.copytree(FIXTURE_FOLDER,
+                        os.path.join(self.source, 'Outlook', 'Inbox'))
+        os.makedirs(os.path.join(self.source, 'Eudora'))
+        table = binfile.pack_table(eudora.Message, columns={
+            'offset': [0, 100, 250],
+            'size': [100, 150, 50],
+            'status': [b'\x02', b'\x09', b'\x63'],
+            'date': ['Sun, 16 Jun 1996 10:10:00 +0100', '', 'junk'],
+            'subject': ['Hello', 'Caf\xe9 "menu"', 'a, b'],
+            'to': ['Somebody', 'x@example.com', '']})
+        with open(os.path.join(self.source, 'Eudora', 'In.toc'), 'wb') as out:
+            out.write(eudora.Toc.pack(version=1, name='In'))
+            out.write(table)
+        self.output = os.path.join(self.tmpdir, 'manifest')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_jsonl(self):
+        writer = manifest.export_manifest(self.source, self.output,
+                                          columns=manifest.COLUMNS)
+        self.assertEqual(5, writer.rows)
+        self.assertEqual([self.output + '.jsonl'], writer.files)
+        with open(writer.files[0]) as result:
+            rows = [json.loads(line) for line in result]
+        self.assertEqual({
+            'folder': os.path.join('Eudora', 'In'), 'position': 1,
+            'offset': 100, 'size': 150, 'status': 9, 'date': '',
+            'timestamp': None, 'subject': u'Caf\xe9 "menu"',
+            'to': 'x@example.com'}, rows[1])
+        self.assertEqual(834916200, rows[0]['timestamp'])
+        self.assertEqual(99, rows[2]['status'])
+        self.assertEqual({
+            'folder': os.path.join('Outlook', 'Inbox'), 'position': 1,
+            'offset': rows[4]['offset'], 'size': rows[4]['size'],
+            'status': None, 'date': None, 'timestamp': None,
+            'subject': 'hello again', 'to': 'someone@nowhere.org'}, rows[4])
+
+    def test_csv_sharded(self):
+        writer = manifest.export_manifest(
+            self.source, self.output, format=manifest.CSV,
+            columns=['folder', 'size', 'subject'], compress=True,
+            shard_size=2, block_size=2)
+        self.assertEqual(['%s-%05d.csv.gz' % (self.output, i)
+                          for i in (1, 2, 3)], writer.files)
+        rows = []
+        for path in writer.files:
+            with gzip.open(path, 'rb') as result:
+                shard = list(csv.reader(result))
+            self.assertEqual(['folder', 'size', 'subject'], shard[0])
+            rows.extend(shard[1:])
+        self.assertEqual(5, len(rows))
+        self.assertEqual(['Eudora/In', '150', 'Caf\xe9 "menu"'], rows[1])
+        self.assertEqual(['Eudora/In', '50', 'a, b'], rows[2])
+        self.assertEqual('Hi!', rows[3][2])
+
+    def test_shard_by_folder(self):
+        writer = manifest.export_manifest(
+            self.source, self.output, columns=['folder', 'position'],
+            shard_by_folder=True, shard_size=2, block_size=2)
+        self.assertEqual(['%s-%05d.jsonl' % (self.output, i)
+                          for i in (1, 2, 3)], writer.files)
+        shards = []
+        for path in writer.files:
+            with open(path) as result:
+                shards.append([(row['folder'], row['position'])
+                               for row in map(json.loads, result)])
+        eudora_folder = os.path.join('Eudora', 'In')
+        outlook_folder = os.path.join('Outlook', 'Inbox')
+        self.assertEqual([[(eudora_folder, 0), (eudora_folder, 1)],
+                          [(eudora_folder, 2)],
+                          [(outlook_folder, 0), (outlook_folder, 1)]],
+                         shards)
+
+    def test_errors(self):
+        self.assertRaises(ValueError, manifest.ManifestWriter, self.output,
+                          columns=['folder', 'body'])
+        self.assertRaises(ValueError, manifest.ManifestWriter, self.output,
+                          format='xml')
+        empty = os.path.join(self.tmpdir, 'empty')
+        os.makedirs(empty)
+        writer = manifest.export_manifest(empty, self.output)
+        self.assertEqual(0, writer.rows)
+        self.assertEqual(0, os.path.getsize(writer.files[0]))
@@ -0,0 +1,105 @@
+# file test_binfile/test_msgcache.py
+#
+#   Copyright 2012 Emory University Libraries
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import os
+import tempfile
+import threading
+import unittest
+
+from eulcommon.binfile import msgcache
+
+
+class TestMessageCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = msgcache.MessageCache(max_bytes=10)
+
+    def test_get_set(self):
+        self.assertEqual(None, self.cache.get('a'))
+        self.cache.set('a', 'abc')
+        self.assertEqual('abc', self.cache.get('a'))
+        self.assertTrue('a' in self.cache)
+        self.assertEqual(3, self.cache.size)
+        # replacing a value updates the size
+        self.cache.set('a', 'abcd')
+        self.assertEqual(4, self.cache.size)
+        self.assertEqual(1, len(self.cache))
+        self.assertEqual({'hits': 1, 'misses': 1, 'evictions': 0,
+                          'entries': 1, 'size': 4, 'max_bytes': 10},
+                         self.cache.stats())
+
+    def test_lru_eviction(self):
+        self.cache.set('a', 'x', size=4)
+        self.cache.set('b', 'y', size=4)
+        # using a makes b the least recently used
+        self.cache.get('a')
+        self.cache.set('c', 'z', size=4)
+        self.assertTrue('a' in self.cache)
+        self.assertFalse('b' in self.cache)
+        self.assertEqual(1, self.cache.evictions)
+        self.assertEqual(8, self.cache.size)
+
+        # values larger than the budget are not cached at all
+        self.cache.set('big', 'x' * 11)
+        self.assertFalse('big' in self.cache)
+        self.assertEqual(2, len(self.cache))
+
+        self.cache.clear()
+        self.assertEqual(0, len(self.cache))
+        self.assertEqual(0, self.cache.size)
+
+    def test_get_or_set(self):
+        calls = []
+
+        def create():
+            calls.append(1)
+            return 'value'
+
+        self.assertEqual('value', self.cache.get_or_set('k', create))
+        self.assertEqual('value', self.cache.get_or_set('k', create))
+        self.assertEqual(1, len(calls))
+        self.assertEqual((1, 1), (self.cache.hits, self.cache.misses))
+
+    def test_threads(self):
+        cache = msgcache.MessageCache(max_bytes=100)
+
+        def worker(n):
+            for i in range(500):
+                key = (n + i) % 40
+                cache.get_or_set(key, lambda: str(key), size=5)
+
+        threads = [threading.Thread(target=worker, args=(n,))
+                   for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(8 * 500, cache.hits + cache.misses)
+        self.assertEqual(20, len(cache))
+        self.assertEqual(100, cache.size)
+
+    def test_message_key(self):
+        tmp = tempfile.NamedTemporaryFile()
+        tmp.write('data')
+        tmp.flush()
+        file_id = msgcache.file_identity(tmp.name)
+        self.assertEqual(file_id, msgcache.file_identity(tmp.name))
+        self.assertNotEqual(msgcache.message_key(file_id, 0, 4),
+                            msgcache.message_key(file_id, 0, 4, 'summary'))
+        tmp.write('more data')
+        tmp.flush()
+        os.utime(tmp.name, (0, 0))
+        self.assertNotEqual(file_id, msgcache.file_identity(tmp.name))
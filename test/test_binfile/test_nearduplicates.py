@@ -0,0 +1,132 @@
+# file test_binfile/test_nearduplicates.py
+#
+#   Copyright 2012 Emory University Libraries
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import itertools
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from eulcommon import binfile
+from eulcommon.binfile import eudora, nearduplicates as nd
+
+TEST_ROOT = os.path.dirname(__file__)
+FIXTURE_FOLDER = os.path.join(TEST_ROOT, 'fixtures', 'oemacfolder')
+
+rng = random.Random(42)
+VOCABULARY = ['word%d' % i for i in range(500)]
+
+
+def text(words=200):
+    return ' '.join(rng.choice(VOCABULARY) for i in range(words))
+
+
+def edited(original):
+    # change one word near the end
+    words = original.split()
+    words[-3] = 'changed'
+    return 'FW: ' + ' '.join(words)
+
+
+class TestMinHash(unittest.TestCase):
+
+    def test_signature(self):
+        hasher = nd.MinHasher(num_perm=32)
+        original = text()
+        self.assertEqual(32, len(hasher.signature(original)))
+        self.assertEqual(hasher.signature(original),
+                         hasher.signature(original.upper()))
+        self.assertEqual(None, hasher.signature(' -- '))
+        # short text is a single shingle
+        self.assertEqual(1, len(hasher.shingles('two words')))
+
+    def test_index(self):
+        hasher = nd.MinHasher()
+        index = nd.LSHIndex(threshold=0.7)
+        first, second = text(), text()
+        for key, body in (('a', first), ('b', second), ('c', edited(first)),
+                          ('d', first), ('e', edited(second))):
+            index.add(key, hasher.signature(body))
+        self.assertEqual([['a', 'c', 'd'], ['b', 'e']], index.clusters())
+        self.assertTrue(index.similarity(0, 2) >= 0.7)
+        self.assertTrue(index.similarity(0, 1) < 0.2)
+        self.assertRaises(ValueError, nd.LSHIndex, 64, 10)
+        self.assertRaises(ValueError, index.add, 'f', [1, 2, 3])
+
+    def test_index_later_bucket_member(self):
+        # all three share the first band, but only the second and third
+        # are similar; the third must be compared with both earlier ones
+        index = nd.LSHIndex(num_perm=4, bands=2, threshold=0.75)
+        index.add('a', [1, 2, 3, 4])
+        index.add('b', [1, 2, 9, 9])
+        index.add('c', [1, 2, 9, 8])
+        self.assertEqual([['b', 'c']], index.clusters())
+
+    def test_index_bounded(self):
+        # copies of one message are kept as a single representative per
+        # bucket, so each new copy is compared only once
+        index = nd.LSHIndex(num_perm=4, bands=2, threshold=0.75)
+        for i in range(50):
+            index.add(i, [1, 2, 3, 4])
+        index.add('other', [1, 2, 7, 8])
+        self.assertEqual([list(range(50))], index.clusters())
+        self.assertEqual([[[0, 50]], [[0], [50]]],
+                         [sorted(bucket.values()) for bucket in index._buckets])
+
+
+class TestFindNearDuplicates(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        first, second = text(), text()
+        bodies = [first, text(), edited(first), second, edited(second)]
+        messages = ['From ???@??? Mon Jan 01 00:00:00 1996\r'
+                    'Subject: %d\r\r%s\r' % (i, body)
+                    for i, body in enumerate(bodies)]
+        self.toc_path = os.path.join(self.tmpdir, 'In.toc')
+        with open(os.path.join(self.tmpdir, 'In'), 'wb') as out:
+            out.write(''.join(messages))
+        offsets = [sum(len(msg) for msg in messages[:i])
+                   for i in range(len(messages))]
+        # the last message has no body offset, so the body is found by
+        # looking for the end of the headers
+        body_offsets = [msg.index('\r\r') + 2 for msg in messages[:-1]] + [0]
+        table = binfile.pack_table(eudora.Message, columns={
+            'offset': offsets, 'size': [len(msg) for msg in messages],
+            'body_offset': body_offsets})
+        with open(self.toc_path, 'wb') as out:
+            out.write(eudora.Toc.pack(version=1, name='In'))
+            out.write(table)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_find(self):
+        expected = [[('In', 0), ('In', 2)], [('In', 3), ('In', 4)]]
+        for processes in (0, 2):
+            jobs = itertools.chain(nd.macfolder_jobs(FIXTURE_FOLDER),
+                                   nd.eudora_jobs(self.toc_path, label='In'))
+            self.assertEqual(expected, nd.find_near_duplicates(
+                jobs, processes=processes, threshold=0.7))
+        # maps opened in this process are closed
+        self.assertEqual({}, nd._maps)
+
+    def test_jobs(self):
+        jobs = list(nd.macfolder_jobs(FIXTURE_FOLDER, label='oe'))
+        self.assertEqual([('oe', 0), ('oe', 1)], [job[0] for job in jobs])
+        self.assertEqual([], list(nd.macfolder_jobs(self.tmpdir)))
+        self.assertEqual(5, len(list(nd.eudora_jobs(self.toc_path))))
@@ -18,7 +18,7 @@ from email import message
 import unittest
 import os
 
-from eulcommon.binfile import outlookexpress
+from eulcommon.binfile import msgcache, outlookexpress
 
 
 TEST_ROOT = os.path.dirname(__file__)
@@ -40,7 +40,7 @@ class TestMacIndex(unittest.TestCase):
 
     def test_messages(self):
         idx = outlookexpress.MacIndex(self.index_filename)
-        messages = list(idx.messages)
+        messages = idx.messages
         self.assertEqual(len(messages), 2)
 
         self.assertTrue(isinstance(messages[0], outlookexpress.MacIndexMessage))
@@ -48,8 +48,29 @@ class TestMacIndex(unittest.TestCase):
         self.assertEqual(24, messages[0].offset)
         self.assertEqual(392, messages[0].size)
 
+        self.assertEqual(416, idx.get_message(1).offset)
+        # 3-byte offsets decoded for all messages at once
+        self.assertEqual([24, 416], list(messages.column('offset')))
+        self.assertRaises(IndexError, idx.get_message, 2)
 
-class TestMacIndex(unittest.TestCase):
+    def test_summaries(self):
+        idx = outlookexpress.MacIndex(self.index_filename)
+        summaries = list(idx.summaries)
+        self.assertEqual(2, len(summaries))
+        self.assertTrue(isinstance(summaries[0], outlookexpress.MacIndexSummary))
+        self.assertEqual('Hi!', summaries[0].subject)
+        self.assertEqual('"Somebody" <somebody@example.com>',
+                         summaries[0].sender)
+        self.assertEqual('someone@nowhere.org', summaries[0].to)
+        self.assertEqual('hello again', summaries[1].subject)
+
+        # positional access via the summary offset in the index message
+        self.assertEqual(58, idx.get_message(1).summary_offset)
+        self.assertEqual('hello again', idx.get_summary(1).subject)
+        self.assertEqual('Hi!', idx.get_summary(0).subject)
+
+
+class TestMacMail(unittest.TestCase):
     index_filename = os.path.join(FIXTURE_FOLDER, 'Index')
     data_filename = os.path.join(FIXTURE_FOLDER, 'Mail')
 
@@ -82,6 +103,23 @@ class TestMacFolder(unittest.TestCase):
     def test_count(self):
         self.assertEqual(2, self.folder.count)
 
+    def test_summaries(self):
+        subjects = [summary.subject for summary in self.folder.summaries]
+        self.assertEqual(['Hi!', 'hello again'], subjects)
+
+    def test_get_email(self):
+        msg = self.folder.get_email(1)
+        self.assertEqual('hello again', msg['Subject'])
+
+        cache = msgcache.MessageCache()
+        cached = self.folder.get_email(1, cache=cache)
+        self.assertTrue(cached is self.folder.get_email(1, cache=cache))
+        self.assertEqual('hello again', cached['Subject'])
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+        # a different folder object for the same file shares entries
+        other = outlookexpress.MacFolder(FIXTURE_FOLDER)
+        self.assertTrue(cached is other.get_email(1, cache=cache))
+
     def test_messages(self):
         msgs = list(self.folder.messages)
         self.assertEqual(self.folder.count, len(msgs))
@@ -106,10 +144,23 @@ class TestMacFolder(unittest.TestCase):
         self.assertEqual(self.folder.count, len(raw_msgs))
         self.assert_(isinstance(raw_msgs[0], outlookexpress.MacMailMessage))
         self.assertFalse(raw_msgs[0].deleted)
+        self.assertEqual('message', raw_msgs[0].kind)
 
         # skipped chunks should be populated now; 0 for fixture folder
         self.assertEqual(0, self.folder.skipped_chunks)
 
+    def test_open(self):
+        raw_msg = list(self.folder.raw_messages)[0]
+        reader = raw_msg.open()
+        self.assertEqual(raw_msg.data, reader.read())
+
+        # reading in small chunks should produce the same message
+        raw_msg.chunk_size = 7
+        msg = raw_msg.as_email()
+        self.assertEqual('Hi!', msg['Subject'])
+        self.assertEqual('This is a test email generated with Outlook Express 4.5 for Mac.',
+                         msg.get_payload())
+
 
 
 if __name__ == '__main__':
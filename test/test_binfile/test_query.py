@@ -0,0 +1,111 @@
+# file test_binfile/test_query.py
+#
+#   Copyright 2012 Emory University Libraries
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import os
+import unittest
+
+from eulcommon import binfile
+from eulcommon.binfile import eudora, query
+
+TEST_ROOT = os.path.dirname(__file__)
+
+
+class TestTableQuery(unittest.TestCase):
+
+    def setUp(self):
+        count = 10
+        columns = {
+            'offset': [i * 100 for i in range(count)],
+            'size': [(i * 37) % 100 for i in range(count)],
+            'status_name': ['read' if i % 2 else 1 for i in range(count)],
+            'to': ['person%d@example.com' % (i % 3) for i in range(count)],
+            'subject': ['Subject %d' % i for i in range(count)],
+        }
+        self.columns = columns
+        data = bytes(binfile.pack_table(eudora.Message, columns=columns))
+        self.table = binfile.RecordTable(eudora.Message, data)
+        # small blocks, to exercise matching across block boundaries
+        self._block_records = query.BLOCK_RECORDS
+        query.BLOCK_RECORDS = 3
+
+    def tearDown(self):
+        query.BLOCK_RECORDS = self._block_records
+
+    def expected(self, test, *names):
+        return [dict((name, self.columns[name][i]) for name in names)
+                for i in range(len(self.table))
+                if test(dict((name, values[i])
+                             for name, values in self.columns.items()))]
+
+    def test_where(self):
+        results = list(self.table.where(size__gt=50))
+        self.assertTrue(all(isinstance(r, eudora.Message) for r in results))
+        self.assertEqual([r for r in self.columns['size'] if r > 50],
+                         [r.size for r in results])
+
+        found = self.table.where(size__gte=11, size__lt=75,
+                                 to__contains='person1').fields('subject')
+        self.assertEqual(self.expected(lambda r: 11 <= r['size'] < 75 and
+                                       'person1' in r['to'], 'subject'),
+                         list(found))
+
+        # chained where is the same as combined conditions
+        chained = self.table.where(size__gte=11).where(size__lt=75) \
+            .where(to__contains='person1').fields('subject')
+        self.assertEqual(list(found), list(chained))
+
+        self.assertEqual(self.expected(lambda r: r['status_name'] == 'read',
+                                       'offset'),
+                         list(self.table.where(status_name='read').fields('offset')))
+        self.assertEqual(5, self.table.where(status_name__exact=1).count())
+        self.assertEqual(3, self.table.where(size__in=[0, 11, 48, 12345]).count())
+        self.assertEqual(5, self.table.where(size__range=(10, 50)).count())
+        self.assertEqual(1, self.table.where(subject__endswith=' 7').count())
+        self.assertEqual(10, self.table.where(subject__startswith='Subj').count())
+        self.assertEqual(4, self.table.where(to__icontains='PERSON0').count())
+        self.assertEqual(0, self.table.where(size__gt=100).count())
+        self.assertEqual([], list(self.table.where(size__gt=100)))
+
+    def test_order_by(self):
+        sizes = sorted(self.columns['size'], reverse=True)
+        self.assertEqual(sizes, [r['size'] for r in
+                                 self.table.order_by('-size').fields('size')])
+        self.assertEqual(sorted(sizes),
+                         [r.size for r in self.table.order_by('size')])
+
+        # mixed ascending and descending keys
+        ordered = list(self.table.where(size__lt=90)
+                       .order_by('to', '-offset').fields('to', 'offset'))
+        expected = sorted(self.expected(lambda r: r['size'] < 90,
+                                        'to', 'offset'),
+                          key=lambda r: (r['to'], -r['offset']))
+        self.assertEqual(expected, ordered)
+
+    def test_fields(self):
+        self.assertEqual(self.expected(lambda r: True, 'size', 'to'),
+                         list(self.table.fields('size', 'to')))
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, self.table.where, bogus=1)
+        self.assertRaises(ValueError, self.table.where, size__bogus=1)
+        self.assertRaises(ValueError, self.table.order_by, '-bogus')
+        self.assertRaises(ValueError, self.table.fields, 'bogus')
+
+    def test_fixture(self):
+        toc = eudora.Toc(os.path.join(TEST_ROOT, 'fixtures', 'In.toc'))
+        self.assertEqual([{'subject': 'Welcome'}],
+                         list(toc.messages.where(to__contains='Somebody')
+                              .fields('subject')))
@@ -0,0 +1,72 @@
+# file test_binfile/test_triage.py
+#
+#   Copyright 2012 Emory University Libraries
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import os
+from StringIO import StringIO
+import unittest
+
+from eulcommon.binfile import triage
+
+
+TEST_ROOT = os.path.dirname(__file__)
+FIXTURE_DIR = os.path.join(TEST_ROOT, 'fixtures')
+def fixture(fname):
+    return os.path.join(FIXTURE_DIR, fname)
+
+
+class TestTriage(unittest.TestCase):
+
+    def test_classify(self):
+        self.assertEqual(triage.OE_INDEX,
+                         triage.classify(fixture('oemacfolder/Index')).format)
+        self.assertEqual(triage.OE_MAIL,
+                         triage.classify(fixture('oemacfolder/Mail')).format)
+        self.assertEqual(triage.EUDORA_TOC,
+                         triage.classify(fixture('In.toc')).format)
+        self.assertEqual(None, triage.classify(fixture('numbers.bin')).format)
+
+    def test_identify(self):
+        with open(fixture('In.toc'), 'rb') as toc:
+            header = toc.read(triage.HEADER_SIZE)
+        size = os.path.getsize(fixture('In.toc'))
+        self.assertEqual(triage.EUDORA_TOC, triage.identify(header, size))
+        # size must fit the header plus whole message records
+        self.assertEqual(None, triage.identify(header, size + 1))
+
+    def test_scan(self):
+        results = dict((os.path.relpath(r.path, FIXTURE_DIR), r.format)
+                       for r in triage.scan(FIXTURE_DIR, threads=2, batch_size=2))
+        self.assertEqual({
+            'In.toc': triage.EUDORA_TOC,
+            os.path.join('oemacfolder', 'Index'): triage.OE_INDEX,
+            os.path.join('oemacfolder', 'Mail'): triage.OE_MAIL,
+        }, results)
+
+        all_results = list(triage.scan(FIXTURE_DIR, include_unknown=True))
+        self.assertTrue(fixture('numbers.bin') in [r.path for r in all_results])
+
+    def test_write_report(self):
+        output = StringIO()
+        count = triage.write_report([triage.classify(fixture('In.toc'))],
+                                    output)
+        self.assertEqual(1, count)
+        self.assertEqual('eudora-toc\t%d\t%s\n' % (os.path.getsize(fixture('In.toc')),
+                                                  fixture('In.toc')),
+                         output.getvalue())
+
+
+if __name__ == '__main__':
+    main()
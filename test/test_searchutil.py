@@ -14,10 +14,22 @@
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
 
+from collections import namedtuple
+import json
+from operator import itemgetter
+import os
+import sys
+import threading
 import unittest
+from django.contrib.auth.models import Group, User
+from django.core.exceptions import ImproperlyConfigured
 from django.core.paginator import Paginator
+from django.test import TestCase
 from eulcommon.searchutil import search_terms, parse_search_terms, \
-     pages_to_show
+     pages_to_show, canonical_query, ParseCache, parse_cache
+from eulcommon.searchutil import query
+from eulcommon.searchutil.predicates import PredicateCompiler
+from eulcommon.binfile import eudora
 
 
 class SearchTermsTest(unittest.TestCase):
@@ -98,6 +110,338 @@ class ParseSearchTermsTest(unittest.TestCase):
                           ('title', 'wind')],
                          parse_search_terms('frog toad title:willows title:wind'))
 
+    def test_syntax_errors(self):
+        self.assertRaises(RuntimeError, parse_search_terms, 'a:b:c')
+        self.assertRaises(RuntimeError, parse_search_terms, ':willows')
+        self.assertRaises(RuntimeError, parse_search_terms, 'title:"a b"c')
+
+    def test_corpus(self):
+        # results and errors recorded from the ply grammar that
+        # parse_search_terms originally used
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'fixtures', 'search_queries.json')
+        with open(path) as corpus:
+            cases = json.load(corpus)
+
+        def native(value):
+            # the corpus was recorded with byte strings under python 2
+            if bytes is str and value is not None:
+                return value.encode('utf-8')
+            return value
+
+        for case in cases:
+            query = native(case['query'])
+            if 'error' in case:
+                try:
+                    parse_search_terms(query)
+                except RuntimeError as err:
+                    self.assertEqual(case['error'], str(err), query)
+                else:
+                    self.fail('no syntax error for %r' % query)
+            else:
+                self.assertEqual([tuple(map(native, term))
+                                  for term in case['terms']],
+                                 parse_search_terms(query), query)
+
+    def test_threads(self):
+        queries = ['grahame "frog and toad" title:willows', 'a:b:c',
+                   '  subject:"re: meeting"  from:someone@example.com ',
+                   'title: willows', 'wh?ther thou goest', '"a" b"c"',
+                   'tab\tseparated\twords', '"non phrase\'']
+
+        def parse(query):
+            try:
+                return parse_search_terms(query)
+            except RuntimeError as err:
+                return str(err)
+
+        # bypass the cache, so that every query is parsed concurrently
+        max_entries = parse_cache.max_entries
+        parse_cache.max_entries = 0
+        parse_cache.clear()
+        try:
+            expected = dict((query, parse(query)) for query in queries)
+            mismatches = run_threads(parse, queries, expected)
+            self.assertEqual(0, parse_cache.hits)
+        finally:
+            parse_cache.max_entries = max_entries
+        self.assertEqual([], mismatches)
+
+
+def run_threads(parse, queries, expected, threads=8, repeat=500):
+    # parse queries in several threads at once, returning a list of
+    # (query, result) for results that differ from those expected
+    mismatches = []
+    start = threading.Event()
+
+    def worker(n):
+        start.wait()
+        for i in range(repeat):
+            query = queries[(n + i) % len(queries)]
+            result = parse(query)
+            if result != expected[query]:
+                mismatches.append((query, result))
+
+    # switch threads as often as possible, to interleave parses
+    if hasattr(sys, 'setswitchinterval'):
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+    else:
+        interval = sys.getcheckinterval()
+        sys.setcheckinterval(1)
+    try:
+        workers = [threading.Thread(target=worker, args=(n,))
+                   for n in range(threads)]
+        for thread in workers:
+            thread.start()
+        start.set()
+        for thread in workers:
+            thread.join()
+    finally:
+        if hasattr(sys, 'setswitchinterval'):
+            sys.setswitchinterval(interval)
+        else:
+            sys.setcheckinterval(interval)
+    return mismatches
+
+
+class ParseCacheTest(unittest.TestCase):
+
+    def test_parse(self):
+        cache = ParseCache(max_entries=2)
+        terms = cache.parse('title:willows wind')
+        self.assertEqual([('title', 'willows'), (None, 'wind')], terms)
+        # callers can modify their results without affecting the cache
+        terms.append((None, 'extra'))
+        self.assertEqual([('title', 'willows'), (None, 'wind')],
+                         cache.parse('title:willows wind'))
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+
+        # least recently used strings are discarded first
+        cache.parse('frog')
+        cache.parse('title:willows wind')
+        cache.parse('toad')
+        self.assert_('title:willows wind' in cache)
+        self.assert_('frog' not in cache)
+        self.assertEqual({'hits': 2, 'misses': 3, 'evictions': 1,
+                          'entries': 2, 'max_entries': 2}, cache.stats())
+
+        cache.clear()
+        self.assertEqual(0, len(cache))
+        self.assertEqual((0, 0, 0),
+                         (cache.hits, cache.misses, cache.evictions))
+
+    def test_errors_not_cached(self):
+        cache = ParseCache()
+        self.assertRaises(RuntimeError, cache.parse, 'a:b:c')
+        self.assertRaises(RuntimeError, cache.parse, 'a:b:c')
+        self.assertEqual(0, len(cache))
+        self.assertEqual(2, cache.misses)
+
+    def test_disabled(self):
+        cache = ParseCache(max_entries=0)
+        self.assertEqual([(None, 'frog')], cache.parse('frog'))
+        self.assertEqual([(None, 'frog')], cache.parse('frog'))
+        self.assertEqual((0, 2, 0), (cache.hits, cache.misses, len(cache)))
+
+    def test_threads(self):
+        # more strings than entries, so that threads also evict entries
+        # other threads are reading
+        cache = ParseCache(max_entries=3)
+        queries = ['title:willows wind', 'frog', '"frog and toad"', 'toad',
+                   'subject:"re: meeting" from:someone@example.com']
+        expected = dict((query, cache.parse(query)) for query in queries)
+        cache.clear()
+        self.assertEqual([], run_threads(cache.parse, queries, expected,
+                                         threads=8, repeat=200))
+        stats = cache.stats()
+        self.assertEqual(8 * 200, stats['hits'] + stats['misses'])
+        self.assertTrue(stats['entries'] <= 3)
+        self.assertTrue(stats['evictions'] > 0)
+
+
+class CanonicalQueryTest(unittest.TestCase):
+
+    def test_canonical_query(self):
+        self.assertEqual('"frog and toad" grahame title:willows',
+                         canonical_query(' title:"willows"  "frog  and '
+                                         'toad"\tgrahame'))
+        # order and repetition of terms
+        self.assertEqual(canonical_query('toad frog title:wind'),
+                         canonical_query('title:wind frog toad frog'))
+        # quoting is kept where it is needed
+        self.assertEqual('"" "a:b" title: title:"in the willows"',
+                         canonical_query('title:"in the willows" "a:b" '
+                                         'title: ""'))
+        self.assertEqual('', canonical_query('   '))
+        self.assertRaises(RuntimeError, canonical_query, 'a:b:c')
+
+    def test_stable(self):
+        # the canonical form is its own canonical form
+        for query in ['b a "a" title: "" title:"  x  y "',
+                      'subject:"re: meeting" from:someone@example.com']:
+            canonical = canonical_query(query)
+            self.assertEqual(canonical, canonical_query(canonical))
+        # and parses to the same terms
+        query = 'grahame "frog and toad" title:willows "re: meeting"'
+        self.assertEqual(set(parse_search_terms(query)),
+                         set(parse_search_terms(canonical_query(query))))
+
+
+class QueryCompilerTest(TestCase):
+
+    def setUp(self):
+        self.compiler = query.QueryCompiler({
+            'name': ('first_name', 'last_name'),
+            'group': 'groups__name',
+            'user': query.SearchField('username', lookup='iexact'),
+        }, default=('username', 'email'))
+        editors = Group.objects.create(name='editors')
+        admins = Group.objects.create(name='admins')
+        self.toad = User.objects.create(username='toad', first_name='Mr.',
+                                        last_name='Toad',
+                                        email='toad@example.com')
+        self.toad.groups.add(editors, admins)
+        self.mole = User.objects.create(username='mole', first_name='Mole',
+                                        email='mole@example.org')
+        self.mole.groups.add(editors)
+
+    def search(self, terms):
+        return sorted(user.username for user in
+                      self.compiler.filter(User.objects.all(), terms))
+
+    def test_filter(self):
+        self.assertEqual(['mole', 'toad'], self.search(''))
+        self.assertEqual(['toad'], self.search('example.com'))
+        self.assertEqual(['mole', 'toad'], self.search('name:o group:edit'))
+        self.assertEqual(['toad'], self.search('name:"mr." name:toad'))
+        self.assertEqual(['mole'], self.search('user:MOLE'))
+        self.assertEqual([], self.search('user:mol'))
+        self.assertEqual(['toad'],
+                         self.search([('group', 'admins'), (None, 'example')]))
+        # incomplete terms are ignored
+        self.assertEqual(['mole', 'toad'], self.search('name:'))
+
+    def test_merge(self):
+        self.assertEqual([('name', ['toad']), (None, ['example.org'])],
+                         self.compiler.merge('name:toad example.org name:Toad '
+                                             'name:to example'))
+        # only exact duplicates are merged for exact lookups
+        self.assertEqual([('user', ['mole', 'MOLE2'])],
+                         self.compiler.merge('user:mole user:Mole '
+                                             'user:MOLE2'))
+
+    def test_errors(self):
+        self.assertRaises(ValueError, self.compiler.compile, 'password:x',
+                          User)
+        compiler = query.QueryCompiler({'name': 'first_name'})
+        self.assertEqual(['mole'], sorted(
+            user.username for user in compiler.filter(User.objects.all(),
+                                                      'name:mole')))
+        self.assertRaises(ValueError, compiler.compile, 'mole', User)
+
+    def test_joins(self):
+        # every term on a multi-valued relation is applied separately, so
+        # the terms may match different related records
+        self.assertEqual(['toad'], self.search('group:edit group:admin'))
+        queryset = self.compiler.filter(User.objects.all(),
+                                        'group:edit group:admin name:toad')
+        self.assertEqual(4, str(queryset.query).count('JOIN'))
+        self.assertEqual(3, len(self.compiler.compile(
+            'group:edit group:admin name:toad', User)))
+        # unless the field asks to share a join
+        compiler = query.QueryCompiler({
+            'group': query.SearchField('groups__name', shared_join=True),
+            'name': 'last_name'})
+        queryset = compiler.filter(User.objects.all(),
+                                   'group:edit group:itors name:toad')
+        self.assertEqual(2, str(queryset.query).count('JOIN'))
+        self.assertEqual(['toad'], [user.username for user in queryset])
+        self.assertEqual([], list(compiler.filter(User.objects.all(),
+                                                  'group:edit group:admin')))
+
+    @unittest.skipIf(query.SearchQuery is not None,
+                     'full-text search is available')
+    def test_no_fulltext(self):
+        self.assertRaises(ImproperlyConfigured, query.QueryCompiler,
+                          {}, search_vector='search')
+
+
+Summary = namedtuple('Summary', 'sender to subject size')
+
+
+class PredicateCompilerTest(unittest.TestCase):
+
+    records = [
+        Summary('Mole <mole@example.org>', 'toad@example.com',
+                'Quarterly  Report\nfor the river bank', 120),
+        Summary('toad@example.com', 'mole@example.org',
+                'Re: motor cars', 4500),
+        Summary('Badger', None, 'the wild wood\0\0\0', 800),
+        Summary('RAT@example.org', 'mole@example.org, toad@example.com',
+                'Re: quarterly report', 4500),
+    ]
+
+    def setUp(self):
+        self.compiler = PredicateCompiler({
+            'from': 'sender', 'to': 'to', 'subject': 'subject',
+            'who': ('sender', 'to'), 'size': 'size'},
+            default=('subject', 'sender'))
+
+    def search(self, terms):
+        predicate = self.compiler.compile(terms)
+        rows = [position for position, record in enumerate(self.records)
+                if predicate(record)]
+        # the columnar path finds the same records
+        columns = dict(zip(Summary._fields, zip(*self.records)))
+        self.assertEqual(rows, predicate.filter_columns(columns))
+        return rows
+
+    def test_predicate(self):
+        self.assertEqual([0, 1, 2, 3], self.search(''))
+        self.assertEqual([0, 3], self.search('"quarterly report"'))
+        self.assertEqual([0], self.search('from:mole who:toad to:example'))
+        self.assertEqual([2], self.search('"wild wood" from:badger'))
+        self.assertEqual([1, 3], self.search('size:4500'))
+        self.assertEqual([0, 1, 3], self.search('who:mole'))
+        self.assertEqual([3], self.search('rat re:'))
+        self.assertEqual([], self.search('subject:"wood the"'))
+        self.assertEqual([0, 1, 2, 3], self.search('""'))
+        predicate = self.compiler.compile('re subject:re subject:RE')
+        self.assertEqual(2, len(predicate.checks))
+        self.assertEqual(['subject', 'sender'], predicate.names)
+        # words match within words ("report")
+        self.assertEqual(self.records[:2],
+                         list(predicate.filter(self.records[:3])))
+
+    def test_getter(self):
+        compiler = PredicateCompiler({'to': 'to', 'size': 'size',
+                                      'sender': 'sender'},
+                                     default='subject', getter=itemgetter)
+        records = [record._asdict() for record in self.records]
+        predicate = compiler.compile('motor to:mole')
+        self.assertEqual([records[1]], list(predicate.filter(records)))
+        self.assertEqual([3], compiler.compile('size:45 sender:rat')
+                         .filter_columns({'size': [120, 4500, 800, 4500],
+                                          'sender': ['', '', '', 'Rat']}))
+
+    def test_errors(self):
+        self.assertRaises(ValueError, self.compiler.compile, 'date:1996')
+        self.assertRaises(ValueError, PredicateCompiler({}).compile, 'report')
+        # search strings cannot reach attributes that are not search fields
+        self.assertRaises(ValueError, self.compiler.compile,
+                          '__class__.__name__:r')
+        self.assertRaises(ValueError, self.compiler.compile, 'nosuch:x')
+
+    def test_filter_table(self):
+        toc = eudora.Toc(os.path.join(os.path.dirname(
+            os.path.abspath(__file__)), 'test_binfile', 'fixtures', 'In.toc'))
+        compiler = PredicateCompiler({'to': 'to'}, default='subject')
+        self.assertEqual([0], list(compiler.compile('welcome to:SOMEBODY')
+                                   .filter_table(toc.messages, block_size=1)))
+        self.assertEqual([0, 1], list(compiler.compile('')
+                                      .filter_table(toc.messages)))
+
 
 class PagesToShowTest(unittest.TestCase):
 